@@ -3,6 +3,7 @@ import os
 import subprocess
 import pandas as pd
 
+import destruct.utils.genome
 import destruct.utils.seq
 import destruct.utils.misc
 
@@ -167,7 +168,7 @@ def create_breakpoints(sim_info, genome_fasta, breakpoints_fasta, breakpoints_in
     """
 
     random.seed(int(sim_info['breakpoints_seed']))
-    genome = dict(destruct.utils.seq.read_sequences(open(genome_fasta, 'r')))
+    genome = destruct.utils.genome.read_genome(genome_fasta)
     info_table = []
     with open(breakpoints_fasta, 'w') as fasta:
         for idx in range(int(sim_info['num_breakpoints'])):
@@ -14,7 +14,7 @@ import pypeliner
 import destruct.benchmark.wrappers
 import destruct.utils.download
 import destruct.utils.misc
-import destruct.utils.seq
+import destruct.utils.genome
 
 
 class BreakpointDatabase(object):
@@ -108,7 +108,7 @@ def create_roc_plot(sim_info, tool_defs, genome_fasta, simulated_filename, predi
 
             return row
 
-        genome = dict(destruct.utils.seq.read_sequences(open(genome_fasta, 'r')))
+        genome = destruct.utils.genome.read_genome(genome_fasta)
         results = results.apply(normalize_breakpoint, axis=1, args=(genome,))
         del genome
 
@@ -0,0 +1,70 @@
+import argparse
+import filecmp
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import destruct.tasks
+
+
+def prepare_seed_fastq_by_line(reads_1_fastq, reads_2_fastq, seed_length, seed_fastq):
+    """ Line based seed preparation, for comparison.
+    """
+    with open(reads_1_fastq, 'rt') as reads_1, open(reads_2_fastq, 'rt') as reads_2, open(seed_fastq, 'wt') as seed:
+        fastq_lines = [[], []]
+        for fastq_1_line, fastq_2_line in zip(reads_1, reads_2):
+            fastq_lines[0].append(fastq_1_line.rstrip())
+            fastq_lines[1].append(fastq_2_line.rstrip())
+            if len(fastq_lines[0]) == 4:
+                for read_end in (0, 1):
+                    if len(fastq_lines[read_end][1]) > seed_length:
+                        fastq_lines[read_end][1] = fastq_lines[read_end][1][0:seed_length]
+                        fastq_lines[read_end][3] = fastq_lines[read_end][3][0:seed_length]
+                    for line in fastq_lines[read_end]:
+                        seed.write(line + '\n')
+                fastq_lines = [[], []]
+
+
+def write_simulated_fastq(fastq_filename, read_end, num_reads, read_length):
+    nucleotides = 'ACGT' * 16
+    qualities = ''.join(chr(33 + q) for q in range(2, 42))
+    with open(fastq_filename, 'wt') as fastq:
+        for read_idx in range(num_reads):
+            seq = ''.join(random.sample(nucleotides, read_length))
+            qual = ''.join(random.choice(qualities) for _ in range(read_length))
+            fastq.write('@{}/{}\n{}\n+{}\n{}\n'.format(read_idx, read_end, seq, read_idx, qual))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Benchmark seed fastq preparation')
+    parser.add_argument('--num_reads', type=int, default=1000000, help='Number of read pairs')
+    parser.add_argument('--read_length', type=int, default=60, help='Read length, at most 64')
+    parser.add_argument('--seed_length', type=int, default=36, help='Seed length')
+    args = parser.parse_args()
+
+    random.seed(2014)
+
+    temp_dir = tempfile.mkdtemp()
+
+    try:
+        reads_1_fastq = os.path.join(temp_dir, 'reads1.fq')
+        reads_2_fastq = os.path.join(temp_dir, 'reads2.fq')
+        write_simulated_fastq(reads_1_fastq, 1, args.num_reads, args.read_length)
+        write_simulated_fastq(reads_2_fastq, 2, args.num_reads, args.read_length)
+
+        seed_filenames = dict()
+        for name, func in (('line', prepare_seed_fastq_by_line), ('block', destruct.tasks.prepare_seed_fastq)):
+            seed_filenames[name] = os.path.join(temp_dir, name + '.seed')
+            start = time.time()
+            func(reads_1_fastq, reads_2_fastq, args.seed_length, seed_filenames[name])
+            elapsed = time.time() - start
+            print('{}\t{:.2f}s\t{:.0f} reads/s'.format(name, elapsed, args.num_reads / elapsed))
+
+        if not filecmp.cmp(seed_filenames['line'], seed_filenames['block'], shallow=False):
+            raise Exception('seed fastq output differs')
+
+    finally:
+        shutil.rmtree(temp_dir)
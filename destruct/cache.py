@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+
+
+# Config values that determine the content of outputs cached for each stage
+
+bamdisc_config_keys = (
+    'bam_max_soft_clipped',
+    'bam_max_fragment_length',
+    'num_read_samples',
+)
+
+score_stats_config_keys = (
+    'match_score',
+    'mismatch_score',
+    'gap_score',
+    'fragment_length_num_stddevs',
+    'score_stats_tolerance',
+    'score_stats_batch_size',
+    'score_stats_min_length_fraction',
+)
+
+realign_config_keys = score_stats_config_keys + (
+    'binary_seed_alignments',
+    'reads_per_split',
+    'realign_job_seconds',
+    'reads_per_split_min',
+    'reads_per_split_max',
+    'alignment_threshold',
+    'chimeric_prior',
+    'chimeric_threshold',
+    'readvalid_threshold',
+)
+
+
+def file_fingerprint(filename, sample_size=1 << 20):
+    """ Fingerprint a file by size, modification time and content sampled
+    from its start and end, avoiding a full read of large bam files.
+    """
+    stat = os.stat(filename)
+    fingerprint = hashlib.sha1()
+    fingerprint.update('{}\t{}\n'.format(stat.st_size, stat.st_mtime_ns).encode())
+    with open(filename, 'rb') as f:
+        fingerprint.update(f.read(sample_size))
+        f.seek(max(0, stat.st_size - sample_size))
+        fingerprint.update(f.read(sample_size))
+    return fingerprint.hexdigest()
+
+
+def file_checksum(filename, block_size=1 << 24):
+    """ Checksum of the full content of a file.
+    """
+    checksum = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            checksum.update(block)
+    return checksum.hexdigest()
+
+
+def write_genome_checksum(config):
+    """ Write the checksum of the genome fasta alongside the reference data.
+    """
+    with open(config['genome_checksum'], 'w') as checksum_file:
+        checksum_file.write(file_checksum(config['genome_fasta']) + '\n')
+
+
+def genome_checksum(config):
+    """ Checksum of the genome fasta, read from the reference data if it is up
+    to date, otherwise calculated from the fasta.
+    """
+    checksum_filename = config['genome_checksum']
+    if os.path.exists(checksum_filename) and os.path.getmtime(checksum_filename) >= os.path.getmtime(config['genome_fasta']):
+        with open(checksum_filename, 'r') as checksum_file:
+            return checksum_file.read().strip()
+    return file_checksum(config['genome_fasta'])
+
+
+def cache_key(filenames, config, config_keys, params=()):
+    """ Calculate a key for outputs derived from a set of files, config values
+    and other parameters.
+    """
+    key = hashlib.sha1()
+    for filename in filenames:
+        key.update(file_fingerprint(filename).encode())
+    key.update(json.dumps([[k, config[k]] for k in config_keys]).encode())
+    key.update(json.dumps([str(a) for a in params]).encode())
+    return key.hexdigest()
+
+
+def library_cache_dirs(cache_dir, library_filenames, config, config_keys, params=()):
+    """ Cache directory for each library, keyed by the library's input files and config.
+
+    Directories are created by the jobs writing to them, not here.
+
+    Args:
+        cache_dir (str): root cache directory for a stage
+        library_filenames (dict): list of input filenames keyed by library
+        config (dict): destruct config
+        config_keys (tuple): config values determining stage outputs
+        params (tuple): other values determining stage outputs, such as
+            the reference checksum and fixed command line arguments
+
+    Returns:
+        dict: cache directory keyed by library
+
+    """
+    library_dirs = dict()
+    for library, filenames in library_filenames.items():
+        library_dirs[library] = os.path.join(cache_dir, cache_key(filenames, config, config_keys, params))
+    return library_dirs
+
+
+class CacheFilenames(dict):
+    """ Pypeliner fnames for files in library cache directories.
+
+    Filenames are formatted with the chunks of any axes nested below the
+    library axis, so outputs split by chunk can also be cached.
+
+    Args:
+        library_dirs (dict): cache directory keyed by library
+        filename (str): filename format within each cache directory
+
+    """
+
+    def __init__(self, library_dirs, filename):
+        dict.__init__(self, library_dirs)
+        self.filename = filename
+
+    def get(self, key, default=None):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if key[0] not in self:
+            return default
+        return os.path.join(self[key[0]], self.filename.format(*key[1:]))
@@ -3,7 +3,10 @@ import os
 
 import pypeliner
 
+import destruct.cache
 import destruct.defaultconfig
+import destruct.utils.genome
+import destruct.utils.regions
 
 
 def wget_gunzip(url, filename):
@@ -85,6 +88,10 @@ def create_ref_data(config, ref_data_dir):
                     satellite_regions_file.write('\t'.join([chr, start, end]) + '\n')
     auto_sentinal.run(wget_repeats)
 
+    def index_satellite_regions():
+        destruct.utils.regions.write_region_index(config['satellite_regions'], config['satellite_regions_index'])
+    auto_sentinal.run(index_satellite_regions)
+
     def bowtie_build():
         pypeliner.commandline.execute('bowtie-build', config['genome_fasta'], config['genome_fasta'])
     auto_sentinal.run(bowtie_build)
@@ -93,4 +100,12 @@ def create_ref_data(config, ref_data_dir):
         pypeliner.commandline.execute('samtools', 'faidx', config['genome_fasta'])
     auto_sentinal.run(samtools_faidx)
 
+    def pack_genome():
+        destruct.utils.genome.write_packed_genome(config['genome_fasta'], config['genome_packed'])
+    auto_sentinal.run(pack_genome)
+
+    def genome_checksum():
+        destruct.cache.write_genome_checksum(config)
+    auto_sentinal.run(genome_checksum)
+
 
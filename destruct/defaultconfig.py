@@ -58,10 +58,13 @@ def get_config(ref_data_dir, user_config):
 
     genome_fasta                                = ref_data_dir+'/Homo_sapiens.'+ensembl_genome_version+'.'+ensembl_version+'.dna.chromosomes.fa'
     genome_fai                                  = genome_fasta+'.fai'
+    genome_packed                               = genome_fasta+'.packed'
+    genome_checksum                             = genome_fasta+'.sha1'
     gtf_filename                                = ref_data_dir+'/Homo_sapiens.'+ensembl_genome_version+'.'+ensembl_version+'.gtf'
     dgv_filename                                = ref_data_dir+'/dgv.txt'
     repeat_regions                              = ref_data_dir+'/repeats.regions'
     satellite_regions                           = ref_data_dir+'/repeats.satellite.regions'
+    satellite_regions_index                     = satellite_regions+'.index'
 
     # Mapping between ensembl and ucsc chromosome names, hg19 and hg18 provided for you
     chromosome_map                              = pkg_resources.resource_filename('destruct', 'data/'+ucsc_genome_version+'_chr_map.tsv')
@@ -97,6 +100,17 @@ def get_config(ref_data_dir, user_config):
     # Number of concordant reads sampled to calculate valid alignment score distribution
     num_read_samples                            = 100000
 
+    # Align sampled reads in batches, stopping once the confidence interval of the score
+    # distribution of each aligned length is within this relative tolerance, for example
+    # 0.05, or None to align all
+    score_stats_tolerance                       = None
+
+    # Number of sampled reads in the first batch, later batches double the reads aligned
+    score_stats_batch_size                      = 10000
+
+    # Aligned lengths with less than this fraction of scores need not be within tolerance
+    score_stats_min_length_fraction             = 0.01
+
     # Minimum discordant read count for filtering clusters
     cluster_readcount_threshold                 = 2
 
@@ -111,6 +125,9 @@ def get_config(ref_data_dir, user_config):
     mismatch_score                              = -3
     gap_score                                   = -4
 
+    # Stream seed alignments to realignment in a compact binary format rather than sam
+    binary_seed_alignments                      = True
+
     # Min alignment likelihood
     min_alignment_log_likelihood                = -5.0
 
@@ -133,9 +150,41 @@ def get_config(ref_data_dir, user_config):
     # Parallelization parameters
     ###
 
-    # Number of reads per parallel realignment job
+    # Number of threads for bam decoding and fastq compression when extracting discordant reads
+    bamdisc_threads                             = 1
+
+    # Size of bam regions extracted in parallel when retrieving discordant reads, None for a single pass
+    bamdisc_region_size                         = None
+
+    # Memory budget in MB for buffering discordant reads before spilling sorted runs to disk
+    bamdisc_spill_memory                        = 1024
+
+    # Maximum number of spilled runs merged at once when pairing discordant reads
+    bamdisc_spill_fan_in                        = 64
+
+    # Number of reads per parallel realignment job, None to size jobs from the
+    # measured cost of realigning the sampled reads of each library, timing two
+    # realignments of the sampled reads per library
     reads_per_split                             = 1000000
 
+    # Target wall time in seconds of each realignment job when sizing jobs
+    realign_job_seconds                         = 1800
+
+    # Bounds on the number of reads per realignment job when sizing jobs
+    reads_per_split_min                         = 10000
+    reads_per_split_max                         = 10000000
+
+    # Number of threads for each realignment job
+    realign_threads                             = 1
+
+    # Minimum number of spanning alignments per clustering job, chromosome
+    # pairs are packed into jobs of at least this size or the largest pair
+    cluster_job_alignments                      = 1000000
+
+    # Number of threads for set cover, connected components of clusters sharing
+    # reads are solved in parallel, giving the same assignments as one thread
+    setcover_threads                            = 1
+
     # Number of clusters per parallel 
     clusters_per_split                          = 1000
 
@@ -3,6 +3,7 @@ import collections
 import pandas as pd
 import numpy as np
 import scipy
+import scipy.special
 import scipy.stats
 
 import destruct.utils.misc
@@ -242,29 +243,30 @@ def calculate_cluster_weights(breakpoints_filename, weights_filename):
     breakpoints[['cluster_id', 'weight']].to_csv(weights_filename, sep='\t', index=False, header=False)
 
 
-def calculate_realignment_likelihoods(breakpoints_filename, realignments_filename, score_stats_filename,
-                                      likelihoods_filename, match_score, fragment_mean, fragment_stddev):
-
-    match_score = float(match_score)
-    fragment_mean = float(fragment_mean)
-    fragment_stddev = float(fragment_stddev)
+realignment_dtypes = {
+    'cluster_id': np.int32,
+    'breakpoint_id': np.int32,
+    'cluster_end': np.int8,
+    'library_id': np.int16,
+    'read_id': np.int32,
+    'read_end': np.int8,
+    'align_id': np.int32,
+    'aligned_length': np.int16,
+    'template_length': np.int32,
+    'score': np.int32,
+}
 
-    score_stats = pd.read_csv(score_stats_filename, sep='\t', names=score_stats_fields)
 
-    breakpoints = pd.read_csv(breakpoints_filename, sep='\t', names=breakpoint_fields,
-                              converters={'chromosome_1':str, 'chromosome_2':str, 'inserted':str})
-
-    breakpoints.loc[breakpoints['inserted'] == '.', 'inserted'] = ''
-
-    breakpoints['inslen'] = breakpoints['inserted'].apply(len)
+def log_two_sided_tail(z_score):
+    """ Log probability of a standard normal at least as extreme as z_score.
+    """
+    return np.log(2.) + scipy.special.log_ndtr(-np.abs(z_score))
 
-    data = pd.read_csv(realignments_filename, sep='\t', names=realignment_fields)
-
-    if len(data.index) == 0:
-        with open(likelihoods_filename, 'w'):
-            pass
-        return
 
+def calculate_chunk_realignment_likelihoods(data, score_stats, breakpoints, match_score, fragment_mean, fragment_stddev):
+    """ Likelihood of the best realignment of each read to each breakpoint, for
+    a chunk of realignments including all realignments of its clusters.
+    """
     data = data.merge(score_stats, on='aligned_length')
 
     # Alignment score likelihood and CDF
@@ -291,13 +293,13 @@ def calculate_realignment_likelihoods(breakpoints_filename, realignments_filenam
     data = data.merge(breakpoints[['cluster_id', 'breakpoint_id', 'inslen']],
                       on=['cluster_id', 'breakpoint_id'])
 
-    data['template_length'] = data['template_length_1'] + data['template_length_2'] + data['inslen']
+    data['template_length'] = data['template_length_1'].astype(np.int64) + data['template_length_2'] + data['inslen']
 
     # Template length likelihood and CDF
     constant = 1. / ((2 * np.pi)**0.5 * fragment_stddev)
     data['length_z_score'] = (data['template_length'] - fragment_mean) / fragment_stddev
     data['length_log_likelihood'] = -np.log(constant) - np.square(data['length_z_score']) / 2.
-    data['length_log_cdf'] = np.log(2. * scipy.stats.norm.sf(data['length_z_score'].abs()))
+    data['length_log_cdf'] = log_two_sided_tail(data['length_z_score'].values)
 
     data['log_likelihood'] = data['score_log_likelihood_1'] + \
                              data['score_log_likelihood_2'] + \
@@ -306,15 +308,50 @@ def calculate_realignment_likelihoods(breakpoints_filename, realignments_filenam
                       data['score_log_cdf_2'] + \
                       data['length_log_cdf']
 
-    index_fields = ['cluster_id', 'breakpoint_id', 'library_id', 'read_id']
     data = data.sort_values(index_fields + ['log_likelihood'])\
                .groupby(index_fields)\
                .last()\
                .reset_index()
 
-    data = data[likelihoods_fields]
+    return data[likelihoods_fields]
+
+
+def calculate_realignment_likelihoods(breakpoints_filename, realignments_filename, score_stats_filename,
+                                      likelihoods_filename, match_score, fragment_mean, fragment_stddev,
+                                      chunksize=1000000):
+    """ Calculate likelihoods of realignments, streaming realignments in chunks
+    of whole clusters so that memory is bounded by the chunk size and the
+    largest cluster.  Realignments are expected to be grouped by cluster.
+    """
+    match_score = float(match_score)
+    fragment_mean = float(fragment_mean)
+    fragment_stddev = float(fragment_stddev)
+
+    score_stats = pd.read_csv(score_stats_filename, sep='\t', names=score_stats_fields)
+
+    breakpoints = pd.read_csv(breakpoints_filename, sep='\t', names=breakpoint_fields,
+                              usecols=['cluster_id', 'breakpoint_id', 'inserted'],
+                              dtype={'cluster_id': np.int32, 'breakpoint_id': np.int32},
+                              converters={'inserted':str})
+
+    breakpoints.loc[breakpoints['inserted'] == '.', 'inserted'] = ''
+
+    breakpoints['inslen'] = breakpoints['inserted'].apply(len)
+
+    realignments_iter = pd.read_csv(realignments_filename, sep='\t', names=realignment_fields,
+                                    dtype=realignment_dtypes, iterator=True, chunksize=chunksize)
+
+    realignments_iter = destruct.utils.streaming.group_aware_iter(realignments_iter, ['cluster_id'])
+
+    with open(likelihoods_filename, 'w') as likelihoods_file:
+        for data in realignments_iter:
+            if data is None or len(data.index) == 0:
+                continue
+
+            data = calculate_chunk_realignment_likelihoods(
+                data, score_stats, breakpoints, match_score, fragment_mean, fragment_stddev)
 
-    data.to_csv(likelihoods_filename, sep='\t', index=False, header=False)
+            data.to_csv(likelihoods_file, sep='\t', index=False, header=False)
 
 
 def select_clusters(clusters_filename,
@@ -1,9 +1,17 @@
+import gzip
+import os
 import sys
 import tarfile
 import numpy as np
 import pandas as pd
+import pypeliner
 
 import destruct.utils.plots
+import destruct.utils.seq
+
+
+# Normal quantile for the 95% confidence interval of expon_lda
+confidence_interval_z = 1.96
 
 
 def load_align_data_hist(filename):
@@ -16,28 +24,185 @@ def load_align_data_hist(filename):
     return align_data_hist.reset_index()
 
 
+def sum_scores_by_length(filename, chunksize=1000000):
+    ''' Count, total score and total squared score of alignments for each aligned length,
+    streaming the score file in chunks.
+    '''
+    score_sums = None
+
+    for chunk in pd.read_csv(filename, sep='\t', names=['aligned_length', 'score'], dtype=np.int64, chunksize=chunksize):
+        chunk['score_sq'] = chunk['score'] * chunk['score']
+        grouped = chunk.groupby('aligned_length')
+        chunk_sums = pd.DataFrame({
+            'count': grouped.size(),
+            'total': grouped['score'].sum(),
+            'total_sq': grouped['score_sq'].sum(),
+        })
+
+        score_sums = add_score_sums(score_sums, chunk_sums)
+
+    if score_sums is None:
+        score_sums = pd.DataFrame(
+            {'count': [], 'total': [], 'total_sq': []}, dtype=np.int64,
+            index=pd.Index([], dtype=np.int64, name='aligned_length'))
+
+    return score_sums
+
+
+def add_score_sums(score_sums_1, score_sums_2):
+    if score_sums_1 is None:
+        return score_sums_2.sort_index()
+    return score_sums_1.add(score_sums_2, fill_value=0).astype(np.int64).sort_index()
+
+
+def calculate_expon_lda(score_sums, match_score):
+    ''' Exponential rate of the alignment score penalty for each aligned length.
+    '''
+    aligned_length = score_sums.index.values
+    count = score_sums['count'].values
+
+    # Mean penalty relative to a perfect match of the aligned length
+    penalty = (match_score * aligned_length * count - score_sums['total'].values) / count
+
+    with np.errstate(divide='ignore'):
+        expon_lda = np.minimum(1.0 / penalty, 1.0)
+
+    return expon_lda
+
+
+def calculate_expon_lda_converged(score_sums, match_score, tolerance, min_length_fraction):
+    ''' Check whether the confidence interval of expon_lda for each aligned
+    length is within a relative tolerance, ignoring rare aligned lengths.
+    '''
+    if len(score_sums.index) == 0:
+        return False
+
+    aligned_length = score_sums.index.values
+    count = score_sums['count'].values.astype(float)
+
+    mean_penalty = match_score * aligned_length - score_sums['total'].values / count
+    variance = np.maximum(score_sums['total_sq'].values / count - (score_sums['total'].values / count) ** 2, 0.0)
+    variance *= count / np.maximum(count - 1, 1)
+    stderr = np.sqrt(variance / count)
+
+    with np.errstate(divide='ignore'):
+        expon_lda = np.minimum(1.0 / mean_penalty, 1.0)
+        expon_lda_upper = np.minimum(1.0 / np.maximum(mean_penalty - confidence_interval_z * stderr, 0.0), 1.0)
+        expon_lda_lower = np.minimum(1.0 / (mean_penalty + confidence_interval_z * stderr), 1.0)
+
+    interval_converged = 0.5 * (expon_lda_upper - expon_lda_lower) <= tolerance * expon_lda
+    rare = count < min_length_fraction * count.sum()
+    converged = (interval_converged & (count > 1)) | rare
+
+    return converged.all()
+
+
+def write_score_stats(score_sums, match_score, score_stats_filename):
+    score_stats = pd.DataFrame({
+        'aligned_length': score_sums.index.values,
+        'expon_lda': calculate_expon_lda(score_sums, match_score),
+    })
+
+    score_stats.to_csv(score_stats_filename, sep='\t', header=False, index=False)
+
+
 def create_score_stats(true_scores_filename, match_score, score_stats_filename):
     ''' Infer distribution of null alignment scores and true alignment scores from samples of null and true scores.
     The null samples may include some true scores so run a quick EM mixture model on the null samples to identify
     the actual distribution of null scores.  Output distributions for each alignment length.
     '''
-    all_true_scores = load_align_data_hist(true_scores_filename)
+    score_sums = sum_scores_by_length(true_scores_filename)
 
-    all_true_scores['penalty'] = match_score * all_true_scores['aligned_length'] - all_true_scores['score']
+    write_score_stats(score_sums, match_score, score_stats_filename)
 
-    score_stats = list()
 
-    for aligned_length in all_true_scores['aligned_length'].unique():
+def read_fastq_records(fastq_filename):
+    opener = (open, gzip.open)[fastq_filename.endswith('.gz')]
+    with opener(fastq_filename, 'rb') as fastq_file:
+        lines = fastq_file.readlines()
+    return [b''.join(lines[idx:idx + 4]) for idx in range(0, len(lines) - len(lines) % 4, 4)]
 
-        true_scores = all_true_scores.loc[all_true_scores['aligned_length'] == aligned_length]
 
-        expon_lda = 1.0 / np.average(true_scores['penalty'], weights=true_scores['freq'])
+def create_score_stats_sequential(
+    sample_1_fastq, sample_2_fastq, seed_length,
+    bowtie_command, seed_alignment_pipe, aligntrue_command, match_score,
+    score_stats_filename, sampling_filename, temp_directory,
+    batch_size, tolerance, min_length_fraction,
+):
+    ''' Calculate score stats from batches of the sampled reads, stopping once
+    expon_lda is within tolerance for each aligned length.
 
-        expon_lda = min(expon_lda, 1.0)
+    Batches are drawn in a fixed random order from the reservoir sample, the
+    first of batch_size reads and later batches doubling the number of reads
+    aligned so far.  The number of reads used is written to sampling_filename.
 
-        score_stats.append((aligned_length, expon_lda))
-
-    score_stats = pd.DataFrame(score_stats, columns=['aligned_length', 'expon_lda'])
-
-    score_stats.to_csv(score_stats_filename, sep='\t', header=False, index=False)
+    Each batch is seed aligned with bowtie_command followed by the batch seed
+    fastq, and piped through seed_alignment_pipe to aligntrue_command followed
+    by the batch reads and scores output.
+    '''
+    try:
+        os.makedirs(temp_directory)
+    except OSError:
+        pass
+
+    reads_1 = read_fastq_records(sample_1_fastq)
+    reads_2 = read_fastq_records(sample_2_fastq)
+
+    if len(reads_1) != len(reads_2):
+        raise ValueError('sample fastqs {} and {} have different read counts'.format(sample_1_fastq, sample_2_fastq))
+
+    num_samples = len(reads_1)
+    order = np.random.RandomState(0).permutation(num_samples)
+
+    batch_reads_1 = os.path.join(temp_directory, 'batch1.fq')
+    batch_reads_2 = os.path.join(temp_directory, 'batch2.fq')
+    batch_seed = os.path.join(temp_directory, 'batch.seed')
+    batch_scores = os.path.join(temp_directory, 'batch.scores')
+
+    score_sums = None
+    num_used = 0
+    num_batches = 0
+    converged = False
+
+    while num_used < num_samples and not converged:
+        batch_end = min(num_samples, max(batch_size, 2 * num_used))
+        batch = np.sort(order[num_used:batch_end])
+
+        with open(batch_reads_1, 'wb') as reads_1_file, open(batch_reads_2, 'wb') as reads_2_file:
+            for idx in batch:
+                reads_1_file.write(reads_1[idx])
+                reads_2_file.write(reads_2[idx])
+
+        with open(batch_reads_1, 'rb') as reads_1_file, open(batch_reads_2, 'rb') as reads_2_file, open(batch_seed, 'wb') as seed_file:
+            for block_1, block_2 in destruct.utils.seq.iter_paired_fastq_blocks(reads_1_file, reads_2_file, lambda: float('inf')):
+                destruct.utils.seq.write_seed_fastq_block(seed_file, block_1, block_2, seed_length)
+
+        pypeliner.commandline.execute(*(
+            tuple(bowtie_command) + (batch_seed,) + tuple(seed_alignment_pipe) + tuple(aligntrue_command) + (
+                '-1', batch_reads_1,
+                '-2', batch_reads_2,
+                '-s', batch_scores,
+            )
+        ))
+
+        score_sums = add_score_sums(score_sums, sum_scores_by_length(batch_scores))
+
+        num_used = batch_end
+        num_batches += 1
+
+        converged = calculate_expon_lda_converged(score_sums, match_score, tolerance, min_length_fraction)
+
+    if score_sums is None:
+        raise ValueError('no sampled reads in {}'.format(sample_1_fastq))
+
+    write_score_stats(score_sums, match_score, score_stats_filename)
+
+    sampling = pd.DataFrame([{
+        'sample_read_count': num_samples,
+        'used_read_count': num_used,
+        'num_batches': num_batches,
+        'converged': converged,
+        'tolerance': tolerance,
+    }])
+    sampling.to_csv(sampling_filename, sep='\t', index=False)
 
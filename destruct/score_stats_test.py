@@ -0,0 +1,59 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import destruct.score_stats
+
+
+def make_score_sums(scores):
+    lengths = []
+    values = []
+    for aligned_length, length_scores in scores.items():
+        lengths.extend([aligned_length] * len(length_scores))
+        values.extend(length_scores)
+    data = pd.DataFrame({'aligned_length': lengths, 'score': values}, dtype=np.int64)
+    data['score_sq'] = data['score'] * data['score']
+    grouped = data.groupby('aligned_length')
+    return pd.DataFrame({
+        'count': grouped.size(),
+        'total': grouped['score'].sum(),
+        'total_sq': grouped['score_sq'].sum(),
+    })
+
+
+class ExponLdaConvergedTest(unittest.TestCase):
+
+    match_score = 2
+
+    def converged(self, scores, tolerance=0.1, min_length_fraction=0.01):
+        score_sums = make_score_sums(scores)
+        return destruct.score_stats.calculate_expon_lda_converged(
+            score_sums, self.match_score, tolerance, min_length_fraction)
+
+    def test_empty(self):
+        self.assertFalse(destruct.score_stats.calculate_expon_lda_converged(
+            make_score_sums({}), self.match_score, 0.1, 0.01))
+
+    def test_common_lengths_converged(self):
+        scores = {100: [190, 192] * 500, 50: [90, 92] * 500}
+        self.assertTrue(self.converged(scores))
+
+    def test_common_lengths_not_converged(self):
+        scores = {100: [100, 200] * 5}
+        self.assertFalse(self.converged(scores))
+
+    def test_rare_singleton_lengths(self):
+        scores = {100: [190, 192] * 500, 50: [90, 92] * 500, 37: [70], 63: [110]}
+        self.assertTrue(self.converged(scores))
+
+    def test_common_singleton_length(self):
+        scores = {100: [190, 192] * 500, 37: [70]}
+        self.assertFalse(self.converged(scores, min_length_fraction=0.0001))
+
+    def test_single_alignment(self):
+        self.assertFalse(self.converged({100: [190]}))
+
+
+if __name__ == '__main__':
+    unittest.main()
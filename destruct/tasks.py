@@ -3,13 +3,18 @@ import csv
 import errno
 import itertools
 import os
+import shutil
+import struct
 import tarfile
+import time
 import gzip
+import heapq
 import numpy as np
 import pandas as pd
 import pypeliner
 import pygenes
 
+import destruct.utils.genome
 import destruct.utils.plots
 import destruct.utils.seq
 import destruct.predict_breaks
@@ -18,19 +23,9 @@ import destruct.predict_breaks
 def prepare_seed_fastq(reads_1_fastq, reads_2_fastq, seed_length, seed_fastq):
     opener_1 = (open, gzip.open)[reads_1_fastq.endswith('.gz')]
     opener_2 = (open, gzip.open)[reads_2_fastq.endswith('.gz')]
-    with opener_1(reads_1_fastq, 'rt') as reads_1, opener_2(reads_2_fastq, 'rt') as reads_2, open(seed_fastq, 'wt') as seed:
-        fastq_lines = [[], []]
-        for fastq_1_line, fastq_2_line in zip(reads_1, reads_2):
-            fastq_lines[0].append(fastq_1_line.rstrip())
-            fastq_lines[1].append(fastq_2_line.rstrip())
-            if len(fastq_lines[0]) == 4:
-                for read_end in (0, 1):
-                    if len(fastq_lines[read_end][1]) > seed_length:
-                        fastq_lines[read_end][1] = fastq_lines[read_end][1][0:seed_length]
-                        fastq_lines[read_end][3] = fastq_lines[read_end][3][0:seed_length]
-                    for line in fastq_lines[read_end]:
-                        seed.write(line + '\n')
-                fastq_lines = [[], []]
+    with opener_1(reads_1_fastq, 'rb') as reads_1, opener_2(reads_2_fastq, 'rb') as reads_2, open(seed_fastq, 'wb') as seed:
+        for block_1, block_2 in destruct.utils.seq.iter_paired_fastq_blocks(reads_1, reads_2, lambda: float('inf')):
+            destruct.utils.seq.write_seed_fastq_block(seed, block_1, block_2, seed_length)
 
 
 class ConcordantReadStats(object):
@@ -46,6 +41,12 @@ class ConcordantReadStats(object):
     def fragment_length_stddev(self):
         return float(self.stats['fragment_stddev'])
 
+    @property
+    def discordant_read_count(self):
+        if self.stats.get('discordant_read_count') is None:
+            return None
+        return int(self.stats['discordant_read_count'])
+
     @property
     def fragment_length_min(self):
         return int(self.fragment_length_mean - self.fragment_length_num_stddevs * self.fragment_length_stddev)
@@ -63,7 +64,9 @@ def read_stats(stats_filename, fragment_length_num_stddevs):
     fragment_mean = (flen_stats['key'] * flen_stats['value']).sum() / fragment_count
     fragment_variance = ((flen_stats['key'] - fragment_mean) * (flen_stats['key'] - fragment_mean) * flen_stats['value']).sum() / (fragment_count - 1)
     fragment_stddev = fragment_variance**0.5
-    return ConcordantReadStats({'fragment_mean': fragment_mean, 'fragment_stddev': fragment_stddev}, fragment_length_num_stddevs)
+    discordant_read_count = stats.loc[(stats['type'] == 'read_count') & (stats['key'] == 'discordant'), 'value']
+    discordant_read_count = int(discordant_read_count.astype(int).sum()) if len(discordant_read_count) > 0 else None
+    return ConcordantReadStats({'fragment_mean': fragment_mean, 'fragment_stddev': fragment_stddev, 'discordant_read_count': discordant_read_count}, fragment_length_num_stddevs)
 
 
 def write_stats_table(library_ids, lib_stats, stats_table_filename):
@@ -74,6 +77,108 @@ def write_stats_table(library_ids, lib_stats, stats_table_filename):
             stats_table_file.write(str(lib_stats[lib_name].fragment_length_stddev) + '\n')
 
 
+def time_commandline(*args):
+    """ Execute a command line and return its elapsed wall time in seconds.
+    """
+    start_time = time.time()
+    pypeliner.commandline.execute(*args)
+    return time.time() - start_time
+
+
+def count_fastq_reads(fastq_filename):
+    with gzip.open(fastq_filename, 'rb') as fastq_file:
+        return sum(1 for line in fastq_file) // 4
+
+
+def calculate_reads_per_split(stats, sample_fastq, sample_seed_filename, job_seconds,
+                              min_reads_per_split, max_reads_per_split, metadata_filename,
+                              temp_space, *realign_args):
+    """ Calculate the number of reads per realignment job from the per read
+    cost of realigning the sampled reads, targeting a given job wall time.
+
+    Args:
+        stats (ConcordantReadStats): library stats including discordant read count
+        sample_fastq (str): sampled end 1 reads, gzipped fastq
+        sample_seed_filename (str): seed fastq of the sampled reads, as given in realign_args
+        job_seconds (float): target wall time of each realignment job
+        min_reads_per_split (int): minimum reads per job
+        max_reads_per_split (int): maximum reads per job
+        metadata_filename (str): output table recording the chosen chunk size
+        temp_space (str): temporary directory
+        realign_args (list): realignment command line for the sampled reads
+
+    The realignment command is timed for the sampled reads and for an empty
+    seed fastq, and the difference is used as the cost of the sampled reads,
+    excluding the startup cost of loading the reference and indices.  The
+    chosen reads per job is written to metadata_filename along with the
+    timings, and read back with read_reads_per_split.
+
+    """
+    try:
+        os.makedirs(temp_space)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+    empty_seed_filename = os.path.join(temp_space, 'empty.seed')
+    with open(empty_seed_filename, 'wb'):
+        pass
+
+    empty_args = [(arg, empty_seed_filename)[arg == sample_seed_filename] for arg in realign_args]
+
+    num_sample_reads = count_fastq_reads(sample_fastq)
+    startup_seconds = time_commandline(*empty_args)
+    sample_seconds = time_commandline(*realign_args)
+
+    seconds_per_read = max(sample_seconds - startup_seconds, 0.) / max(num_sample_reads, 1)
+
+    if seconds_per_read > 0:
+        reads_per_split = int(job_seconds / seconds_per_read)
+    else:
+        reads_per_split = max_reads_per_split
+    reads_per_split = min(max(reads_per_split, min_reads_per_split), max_reads_per_split)
+
+    # Spread reads evenly over the jobs rather than leaving a small final job,
+    # falling back to the minimum job size if the read count is not known
+    if not stats.discordant_read_count:
+        reads_per_split = min_reads_per_split
+        num_splits = None
+    else:
+        num_splits = max(1, -(-stats.discordant_read_count // reads_per_split))
+        reads_per_split = max(1, -(-stats.discordant_read_count // num_splits))
+
+    metadata = pd.DataFrame([{
+        'discordant_read_count': stats.discordant_read_count,
+        'sample_read_count': num_sample_reads,
+        'startup_seconds': startup_seconds,
+        'sample_realign_seconds': sample_seconds,
+        'seconds_per_read': seconds_per_read,
+        'target_job_seconds': job_seconds,
+        'reads_per_split': reads_per_split,
+        'num_splits': num_splits,
+    }])
+    metadata.to_csv(metadata_filename, sep='\t', index=False)
+
+
+def read_reads_per_split(metadata_filename):
+    """ Read the number of reads per realignment job chosen by calculate_reads_per_split.
+    """
+    metadata = pd.read_csv(metadata_filename, sep='\t')
+    return int(metadata['reads_per_split'].iloc[0])
+
+
+def merge_library_tables(library_ids, in_filenames, out_filename):
+    """ Merge per library tables into one, prefixed by library name and id.
+    """
+    tables = []
+    for lib_name, in_filename in sorted(in_filenames.items()):
+        table = pd.read_csv(in_filename, sep='\t')
+        table.insert(0, 'library_id', library_ids[lib_name])
+        table.insert(0, 'library', lib_name)
+        tables.append(table)
+    pd.concat(tables, ignore_index=True).to_csv(out_filename, sep='\t', na_rep='NA', index=False)
+
+
 def split_file_byline(in_filename, lines_per_file, out_filename_callback):
     with open(in_filename, 'rt') as in_file:
         file_number = 0
@@ -117,26 +222,73 @@ def split_fastq(in_filename, num_reads_per_file, out_filename_callback):
                 out_file.close()
 
 
-def merge_files_by_line(in_filenames, out_filename):
-    with open(out_filename, 'wt') as out_file:
+def split_fastq_seed(reads_1_fastq, reads_2_fastq, num_reads_per_file, seed_length,
+                     reads_1_callback, reads_2_callback, seed_callback):
+    """ Split paired gzipped fastqs and write seed fastqs for each chunk in a single pass.
+    """
+    with gzip.open(reads_1_fastq, 'rb') as reads_1, gzip.open(reads_2_fastq, 'rb') as reads_2:
+        file_number = 0
+        out_files = None
+        out_file_read_count = None
+        try:
+            blocks = destruct.utils.seq.iter_paired_fastq_blocks(
+                reads_1, reads_2, lambda: num_reads_per_file - (out_file_read_count or 0) % num_reads_per_file)
+            for block_1, block_2 in blocks:
+                if out_files is None or out_file_read_count == num_reads_per_file:
+                    if out_files is not None:
+                        for out_file in out_files:
+                            out_file.close()
+                    out_files = (
+                        open(reads_1_callback(file_number), 'wb'),
+                        open(reads_2_callback(file_number), 'wb'),
+                        open(seed_callback(file_number), 'wb'),
+                    )
+                    out_file_read_count = 0
+                    file_number += 1
+                out_files[0].write(block_1[0])
+                out_files[1].write(block_2[0])
+                destruct.utils.seq.write_seed_fastq_block(out_files[2], block_1, block_2, seed_length)
+                out_file_read_count += len(block_1[1])
+        finally:
+            if out_files is not None:
+                for out_file in out_files:
+                    out_file.close()
+
+
+def merge_files_by_line(in_filenames, out_filename, buffer_size=1<<20):
+    with open(out_filename, 'wb') as out_file:
         for id, in_filename in sorted(in_filenames.items()):
-            with open(in_filename, 'rt') as in_file:
-                for line in in_file:
-                    out_file.write(line)
+            with open(in_filename, 'rb') as in_file:
+                shutil.copyfileobj(in_file, out_file, buffer_size)
 
 
 def create_library_ids(library_names):
     return dict([(library_name, library_id) for library_id, library_name in enumerate(library_names)])
 
 
-def merge_alignment_files(in_filenames, out_filename, library_idxs):
-    with open(out_filename, 'wt') as out_file:
+def merge_alignment_files(in_filenames, out_filename, library_idxs, buffer_size=1<<20):
+    """ Concatenate per library alignment files, which destruct_realign2 writes
+    with the library id as the first field.  Each block of lines is checked
+    for the expected library id, and blocks with any other library id, such
+    as cached realignments from a run with different libraries, are rewritten
+    line by line.
+    """
+    with open(out_filename, 'wb') as out_file:
         for lib_id, in_filename in in_filenames.items():
-            idx = library_idxs[lib_id]
-            with open(in_filename, 'rt') as in_file:
-                for line in in_file:
-                    line = str(idx) + line[line.index('\t'):]
-                    out_file.write(line)
+            prefix = str(library_idxs[lib_id]).encode() + b'\t'
+            with open(in_filename, 'rb') as in_file:
+                while True:
+                    block = in_file.read(buffer_size)
+                    if not block:
+                        break
+                    if not block.endswith(b'\n'):
+                        block += in_file.readline()
+                    num_lines = block.count(b'\n') + (not block.endswith(b'\n'))
+                    if block.startswith(prefix) and block.count(b'\n' + prefix) == num_lines - 1:
+                        out_file.write(block)
+                    else:
+                        for line in block.splitlines(True):
+                            out_file.write(prefix + line[line.index(b'\t') + 1:])
 
 
 def merge_sorted_files_by_line(in_filenames, out_filename, temp_space, sort_fields):
@@ -148,6 +300,151 @@ def merge_sorted_files_by_line(in_filenames, out_filename, temp_space, sort_fiel
     pypeliner.commandline.execute(*['sort', '-T', temp_space, '-m', '-n', '-k', sort_fields] + list(in_filenames.values()) + ['>', out_filename])
 
 
+def merge_sorted_files_by_key(in_filenames, out_filename, temp_space, num_key_fields,
+                              max_open_files=256, buffer_size=1<<20):
+    """ Merge files sorted numerically by their leading fields with a k-way
+    heap merge, ties ordered by input chunk.
+
+    At most max_open_files are merged at once, larger sets of files are merged
+    in passes of consecutive batches through intermediate files in temp_space.
+    """
+    filenames = [in_filename for _, in_filename in sorted(in_filenames.items())]
+
+    merge_pass = 0
+    while len(filenames) > max_open_files:
+        try:
+            os.makedirs(temp_space)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        merged_filenames = []
+        for batch_idx, batch_start in enumerate(range(0, len(filenames), max_open_files)):
+            merged_filename = os.path.join(temp_space, 'merge.{}.{}'.format(merge_pass, batch_idx))
+            _merge_files_by_key(filenames[batch_start:batch_start + max_open_files], merged_filename, num_key_fields, buffer_size)
+            merged_filenames.append(merged_filename)
+
+        if merge_pass > 0:
+            for filename in filenames:
+                os.remove(filename)
+
+        filenames = merged_filenames
+        merge_pass += 1
+
+    _merge_files_by_key(filenames, out_filename, num_key_fields, buffer_size)
+
+    if merge_pass > 0:
+        for filename in filenames:
+            os.remove(filename)
+
+
+def _merge_files_by_key(in_filenames, out_filename, num_key_fields, buffer_size):
+    def read_entry(file_idx, in_file):
+        line = in_file.readline()
+        if not line:
+            return None
+        key = tuple(int(value) for value in line.split('\t', num_key_fields)[:num_key_fields])
+        return (key, file_idx, line)
+
+    in_files = []
+    try:
+        for in_filename in in_filenames:
+            in_files.append(open(in_filename, 'rt', buffering=buffer_size))
+
+        heap = []
+        for file_idx, in_file in enumerate(in_files):
+            entry = read_entry(file_idx, in_file)
+            if entry is not None:
+                heap.append(entry)
+        heapq.heapify(heap)
+
+        with open(out_filename, 'wt', buffering=buffer_size) as out_file:
+            while heap:
+                _, file_idx, line = heap[0]
+                out_file.write(line)
+                entry = read_entry(file_idx, in_files[file_idx])
+                if entry is None:
+                    heapq.heappop(heap)
+                else:
+                    heapq.heapreplace(heap, entry)
+    finally:
+        for in_file in in_files:
+            in_file.close()
+
+
+def read_bam_references(bam_filename):
+    """ Read reference names and lengths from the header of a bam file.
+    """
+    with gzip.open(bam_filename, 'rb') as bam_file:
+        if bam_file.read(4) != b'BAM\x01':
+            raise ValueError('{} is not a bam file'.format(bam_filename))
+        l_text, = struct.unpack('<i', bam_file.read(4))
+        bam_file.read(l_text)
+        n_ref, = struct.unpack('<i', bam_file.read(4))
+        references = list()
+        for _ in range(n_ref):
+            l_name, = struct.unpack('<i', bam_file.read(4))
+            name = bam_file.read(l_name)[:-1].decode()
+            l_ref, = struct.unpack('<i', bam_file.read(4))
+            references.append((name, l_ref))
+    return references
+
+
+def is_collated_bam(bam_filename):
+    """ Check the bam header for queryname sorted or collated bams, in which
+    mates are adjacent rather than sorted by position.
+    """
+    with gzip.open(bam_filename, 'rb') as bam_file:
+        if bam_file.read(4) != b'BAM\x01':
+            raise ValueError('{} is not a bam file'.format(bam_filename))
+        l_text, = struct.unpack('<i', bam_file.read(4))
+        header_text = bam_file.read(l_text).decode()
+    for line in header_text.splitlines():
+        if line.startswith('@HD'):
+            tags = dict(field.split(':', 1) for field in line.split('\t')[1:] if ':' in field)
+            return tags.get('SO') == 'queryname' or tags.get('GO') == 'query'
+    return False
+
+
+def generate_bam_regions(bam_filename, region_size):
+    """ Split a bam into regions for sharded discordant read extraction,
+    with a final region for unmapped pairs.
+    """
+    regions = list()
+    for name, length in read_bam_references(bam_filename):
+        for start in range(0, length, region_size):
+            end = min(start + region_size, length)
+            regions.append('{}:{}-{}'.format(name, start, end))
+    regions.append('*')
+    return dict(enumerate(regions))
+
+
+def merge_discordant_shards(
+    shard_reads1_filenames, shard_reads2_filenames, shard_stats_filenames,
+    shard_sample1_filenames, shard_sample2_filenames, shard_orphans_filenames,
+    reads1_filename, reads2_filename, stats_filename, sample1_filename, sample2_filename,
+    num_read_samples, num_threads):
+
+    args = ['destruct_mergediscordantfastq', '-r']
+    for shard_id in sorted(shard_stats_filenames.keys()):
+        args += ['--shardfastq1', shard_reads1_filenames[shard_id]]
+        args += ['--shardfastq2', shard_reads2_filenames[shard_id]]
+        args += ['--shardstats', shard_stats_filenames[shard_id]]
+        args += ['--shardsample1', shard_sample1_filenames[shard_id]]
+        args += ['--shardsample2', shard_sample2_filenames[shard_id]]
+        args += ['--orphans', shard_orphans_filenames[shard_id]]
+    args += [
+        '--fastq1', reads1_filename,
+        '--fastq2', reads2_filename,
+        '-s', stats_filename,
+        '--sample1', sample1_filename,
+        '--sample2', sample2_filename,
+        '-n', num_read_samples,
+        '--threads', num_threads,
+    ]
+    pypeliner.commandline.execute(*args)
+
+
 def generate_chromosome_args(chromosomes):
     args = list()
     for chromosome_pair in itertools.combinations_with_replacement(chromosomes, 2):
@@ -156,6 +453,110 @@ def generate_chromosome_args(chromosomes):
     return dict(enumerate(args))
 
 
+def pack_chromosome_pairs(chromosome_pairs, pair_alignment_counts, job_alignments):
+    """ Pack chromosome pairs into jobs of similar alignment counts, first fit
+    decreasing with job capacity the larger of job_alignments and the largest
+    pair, returning the list of pairs of each job.
+    """
+    capacity = max([job_alignments] + list(pair_alignment_counts.values()))
+
+    jobs = list()
+    job_counts = list()
+    for chromosome_pair in sorted(chromosome_pairs, key=lambda a: -pair_alignment_counts.get(a, 0)):
+        count = pair_alignment_counts.get(chromosome_pair, 0)
+        for job_idx, job_count in enumerate(job_counts):
+            if job_count + count <= capacity:
+                jobs[job_idx].append(chromosome_pair)
+                job_counts[job_idx] += count
+                break
+        else:
+            jobs.append([chromosome_pair])
+            job_counts.append(count)
+
+    pair_order = dict((chromosome_pair, idx) for idx, chromosome_pair in enumerate(chromosome_pairs))
+    return [sorted(job, key=lambda a: pair_order[a]) for job in jobs]
+
+
+def partition_by_chromosome_pair(chromosomes, spanning_filename, split_filename,
+                                 spanning_callback, split_callback, job_alignments,
+                                 buffer_size=1<<20):
+    """ Partition spanning and split alignments into clustering jobs of similar
+    size, returning the chromosome args of each job.
+
+    Alignments are counted per chromosome pair in a first pass, and pairs are
+    packed into jobs.  All alignments of a read are written to the job of each
+    chromosome pair its read ends connect, or the excluded pairs job for pairs
+    involving unlisted chromosomes.  Clustering each job with its chromosome
+    args is then equivalent to clustering the full file, including the
+    concordance test over all alignments of a read.
+    """
+    chromosome_pairs = list(itertools.combinations_with_replacement(chromosomes, 2))
+
+    # Listed chromosome pair for either order of chromosomes, None for excluded pairs
+    pair_keys = dict()
+    for chromosome_pair in chromosome_pairs:
+        pair_keys[chromosome_pair] = chromosome_pair
+        pair_keys[chromosome_pair[::-1]] = chromosome_pair
+
+    def read_spanning_pairs():
+        with open(spanning_filename, 'rt', buffering=buffer_size) as spanning_file:
+            for _, read_lines in itertools.groupby(spanning_file, lambda line: line.split('\t', 2)[:2]):
+                read_lines = list(read_lines)
+
+                end_chromosomes = (set(), set())
+                for line in read_lines:
+                    fields = line.split('\t', 5)
+                    end_chromosomes[int(fields[2])].add(fields[4])
+
+                read_pairs = set(pair_keys.get(chromosome_pair) for chromosome_pair in itertools.product(*end_chromosomes))
+
+                yield read_lines, read_pairs
+
+    pair_alignment_counts = collections.Counter()
+    for read_lines, read_pairs in read_spanning_pairs():
+        for chromosome_pair in read_pairs:
+            if chromosome_pair is not None:
+                pair_alignment_counts[chromosome_pair] += len(read_lines)
+
+    jobs = pack_chromosome_pairs(chromosome_pairs, pair_alignment_counts, job_alignments)
+
+    chromosome_args = dict()
+    pair_jobs = dict()
+    for job_idx, job in enumerate(jobs):
+        chromosome_args[job_idx] = '--inclchrompair ' + ';'.join(','.join(chromosome_pair) for chromosome_pair in job)
+        for chromosome_pair in job:
+            pair_jobs[chromosome_pair] = job_idx
+
+    excluded_job = len(jobs)
+    chromosome_args[excluded_job] = '--exclchrompairs ' + ','.join(chromosomes)
+
+    def open_job_files(callback):
+        return dict((job_idx, open(callback(job_idx), 'wt', buffering=buffer_size)) for job_idx in chromosome_args)
+
+    spanning_files = open_job_files(spanning_callback)
+    try:
+        for read_lines, read_pairs in read_spanning_pairs():
+            read_jobs = set(pair_jobs.get(chromosome_pair, excluded_job) for chromosome_pair in read_pairs)
+            for job_idx in read_jobs:
+                spanning_files[job_idx].writelines(read_lines)
+    finally:
+        for out_file in spanning_files.values():
+            out_file.close()
+
+    split_files = open_job_files(split_callback)
+    try:
+        with open(split_filename, 'rt', buffering=buffer_size) as split_file:
+            for line in split_file:
+                fields = line.split('\t', 9)
+                job_idx = pair_jobs.get(pair_keys.get((fields[4], fields[8])), excluded_job)
+                split_files[job_idx].write(line)
+    finally:
+        for out_file in split_files.values():
+            out_file.close()
+
+    return chromosome_args
+
+
 def read_clusters_breakpoints(clusters_filename, breakpoints_filename):
     with open(clusters_filename, 'rt') as clusters_file, open(breakpoints_filename, 'rt') as breakpoints_file:
         clusters_reader = csv.reader(clusters_file, delimiter='\t')
@@ -187,6 +588,72 @@ def merge_clusters(in_clusters_filenames, in_breakpoints_filenames,
                 new_cluster_id += 1
 
 
+def decimal_length(values):
+    """ Number of characters of each integer written in decimal.
+    """
+    powers_of_ten = 10 ** np.arange(1, 19, dtype=np.uint64)
+    magnitudes = np.abs(values.astype(np.int64)).astype(np.uint64)
+    return np.searchsorted(powers_of_ten, magnitudes, side='right') + 1 + (values < 0)
+
+
+def index_clusters(clusters_filename, breakpoints_filename, sorted_clusters_filename,
+                   clusters_index_filename, breakpoints_index_filename, index_spacing=256):
+    """ Index cluster memberships by library and read, and breakpoints by cluster,
+    so that realigning each chunk of reads loads only the clusters of those reads.
+
+    Args:
+        clusters_filename (str): merged cluster memberships
+        breakpoints_filename (str): merged breakpoints, grouped by cluster
+        sorted_clusters_filename (str): output cluster memberships sorted by library and read
+        clusters_index_filename (str): output library, read and offset of every index_spacing sorted memberships
+        breakpoints_index_filename (str): output offset of the breakpoints of each cluster
+
+    KwArgs:
+        index_spacing (int): number of sorted memberships between index entries
+
+    """
+    fields = ['cluster_id', 'cluster_end', 'lib_id', 'read_id', 'read_end', 'align_id']
+
+    if os.path.getsize(clusters_filename) > 0:
+        clusters = pd.read_csv(clusters_filename, sep='\t', header=None, names=fields, dtype=np.int64)
+    else:
+        clusters = pd.DataFrame(columns=fields, dtype=np.int64)
+
+    clusters.sort_values(['lib_id', 'read_id'], kind='mergesort', inplace=True)
+
+    values = clusters[fields].values
+    with open(sorted_clusters_filename, 'wt') as sorted_clusters_file:
+        np.savetxt(sorted_clusters_file, values, fmt='%d', delimiter='\t')
+
+    # Byte offset of each line, from the decimal digits and sign of each
+    # value, and 5 tabs and a newline per line
+    line_lengths = np.full(len(values), len(fields), dtype=np.int64)
+    for column in values.T:
+        line_lengths += decimal_length(column)
+    offsets = np.concatenate([[0], np.cumsum(line_lengths)])
+
+    index_rows = np.arange(0, len(values), index_spacing)
+    clusters_index = np.zeros(len(index_rows), dtype=[('lib_id', '<i4'), ('read_id', '<i4'), ('offset', '<i8')])
+    clusters_index['lib_id'] = clusters['lib_id'].values[index_rows]
+    clusters_index['read_id'] = clusters['read_id'].values[index_rows]
+    clusters_index['offset'] = offsets[index_rows]
+    clusters_index.tofile(clusters_index_filename)
+
+    # Offset of the first breakpoint of each cluster, indexed by cluster id
+    cluster_offsets = dict()
+    offset = 0
+    with open(breakpoints_filename, 'rb') as breakpoints_file:
+        for line in breakpoints_file:
+            cluster_id = int(line[:line.index(b'\t')])
+            cluster_offsets.setdefault(cluster_id, offset)
+            offset += len(line)
+
+    breakpoints_index = np.full(max(cluster_offsets.keys(), default=-1) + 1, -1, dtype='<i8')
+    for cluster_id, offset in cluster_offsets.items():
+        breakpoints_index[cluster_id] = offset
+    breakpoints_index.tofile(breakpoints_index_filename)
+
+
 def tabulate_reads(clusters_filename, likelihoods_filename, library_ids, reads1_filenames, reads2_filenames, reads_table_filename):
     fields = ['cluster_id', 'cluster_end', 'lib_id', 'read_id', 'read_end', 'align_id']
     clusters = pd.read_csv(clusters_filename, sep='\t', names=fields, usecols=['cluster_id', 'lib_id', 'read_id'])
@@ -422,9 +889,7 @@ def tabulate_results(breakpoints_filename, likelihoods_filename, library_ids,
     breakpoints['num_inserted'] = breakpoints.apply(calculate_num_inserted, axis=1)
 
     # Annotate sequence
-    reference_sequences = dict()
-    for id, seq in destruct.utils.seq.read_sequences(open(genome_fasta, 'rt')):
-        reference_sequences[id] = seq
+    reference_sequences = destruct.utils.genome.read_genome(genome_fasta)
 
     breakpoints['sequence'] = breakpoints.apply(lambda row: create_sequence(row, reference_sequences), axis=1)
 
@@ -26,6 +26,8 @@ def run(**args):
         config,
         args['ref_data_dir'],
         args['raw_data_dir'],
+        realign_splits_table=args['realign_splits_table'],
+        score_sampling_table=args['score_sampling_table'],
     )
 
     pyp.run(workflow)
@@ -56,7 +58,13 @@ def add_arguments(argparser):
                            help='Configuration filename')
 
     argparser.add_argument('--raw_data_dir', required=False,
-                           help='Raw data directory')
+                           help='Raw data directory, caching per library outputs for reuse across runs')
+
+    argparser.add_argument('--realign_splits_table', required=False,
+                           help='Output table of the measured realignment cost and reads per realignment job of each library, if sized from the sampled reads')
+
+    argparser.add_argument('--score_sampling_table', required=False,
+                           help='Output table of the number of sampled reads aligned for the score stats of each library, if sampling stops within a tolerance')
 
     argparser.set_defaults(func=run)
 
@@ -0,0 +1,260 @@
+import os
+import struct
+
+import numpy as np
+
+import destruct.utils.seq
+
+
+# Packed genome format, little endian, sections aligned to 8 bytes:
+#
+#   header: b'DGN1', uint32 number of sequences, uint64 offset of index
+#
+#   for each sequence:
+#     bases: 2 bits per base, A C G T as 0 1 2 3, base i in bits 2*(i%4) of byte i//4
+#     exceptions: uint32 starts, uint32 ends, uint8 bytes for runs of identical
+#       bases other than ACGT, such as N, stored as 0 in the packed bases
+#     lowercase: uint32 starts, uint32 ends for runs of lowercase bases
+#
+#   index, for each sequence:
+#     uint32 name length, name, uint64 length, uint64 bases offset,
+#     uint64 number of exceptions, uint64 exceptions offset,
+#     uint64 number of lowercase runs, uint64 lowercase offset
+
+_magic = b'DGN1'
+_header = struct.Struct('<4sIQ')
+_index_entry = struct.Struct('<QQQQQQ')
+
+_base_codes = np.full(256, 4, dtype=np.uint8)
+_base_codes[[ord('A'), ord('C'), ord('G'), ord('T')]] = [0, 1, 2, 3]
+
+_unpack_table = np.array([[ord('ACGT'[(byte >> (2 * idx)) & 3]) for idx in range(4)] for byte in range(256)], dtype=np.uint8)
+
+
+def packed_genome_filename(genome_fasta):
+    return genome_fasta + '.packed'
+
+
+def _runs(values, ignore):
+    """ Start, end and value of runs of identical values, excluding ignored value.
+    """
+    if len(values) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), values
+    boundaries = np.flatnonzero(values[1:] != values[:-1]) + 1
+    starts = np.concatenate([[0], boundaries])
+    ends = np.concatenate([boundaries, [len(values)]])
+    run_values = values[starts]
+    keep = run_values != ignore
+    return starts[keep], ends[keep], run_values[keep]
+
+
+def _write_aligned(packed_file, *arrays):
+    offset = packed_file.tell()
+    for array in arrays:
+        packed_file.write(array.tobytes())
+    packed_file.write(b'\0' * (-packed_file.tell() % 8))
+    return offset
+
+
+def write_packed_genome(genome_fasta, packed_filename):
+    """ Create a 2 bit packed genome from a fasta.
+
+    Args:
+        genome_fasta (str): genome fasta filename
+        packed_filename (str): output packed genome filename
+
+    """
+    temp_filename = packed_filename + '.tmp'
+
+    index = []
+    with open(genome_fasta, 'rt') as fasta, open(temp_filename, 'wb') as packed_file:
+        packed_file.write(_header.pack(_magic, 0, 0))
+
+        for id, sequence in destruct.utils.seq.read_sequences(fasta):
+            sequence = np.frombuffer(sequence.encode('ascii'), dtype=np.uint8)
+
+            if len(sequence) >= 1 << 32:
+                raise ValueError('sequence {} too long for packed genome'.format(id))
+
+            lowercase = (sequence >= ord('a')) & (sequence <= ord('z'))
+            sequence = np.where(lowercase, sequence - 32, sequence).astype(np.uint8)
+
+            codes = _base_codes[sequence]
+            exception = codes == 4
+
+            codes = np.where(exception, 0, codes).astype(np.uint8)
+            codes = np.concatenate([codes, np.zeros(-len(codes) % 4, dtype=np.uint8)]).reshape(-1, 4)
+            bases = codes[:, 0] | (codes[:, 1] << 2) | (codes[:, 2] << 4) | (codes[:, 3] << 6)
+
+            exception_starts, exception_ends, exception_bytes = _runs(np.where(exception, sequence.astype(np.int16), -1), -1)
+            lowercase_starts, lowercase_ends, _ = _runs(lowercase, False)
+
+            bases_offset = _write_aligned(packed_file, bases)
+            exceptions_offset = _write_aligned(
+                packed_file,
+                exception_starts.astype('<u4'),
+                exception_ends.astype('<u4'),
+                exception_bytes.astype(np.uint8))
+            lowercase_offset = _write_aligned(
+                packed_file,
+                lowercase_starts.astype('<u4'),
+                lowercase_ends.astype('<u4'))
+
+            index.append((id, _index_entry.pack(
+                len(sequence), bases_offset,
+                len(exception_starts), exceptions_offset,
+                len(lowercase_starts), lowercase_offset)))
+
+        index_offset = packed_file.tell()
+        for id, entry in index:
+            name = id.encode('ascii')
+            packed_file.write(struct.pack('<I', len(name)) + name + entry)
+
+        packed_file.seek(0)
+        packed_file.write(_header.pack(_magic, len(index), index_offset))
+
+    os.rename(temp_filename, packed_filename)
+
+
+def _run_positions(run_starts, run_ends, start, end):
+    """ Positions in [start, end) covered by runs, relative to start, and the run of each.
+    """
+    first = np.searchsorted(run_ends, start, side='right')
+    last = np.searchsorted(run_starts, end, side='left')
+    starts = np.maximum(run_starts[first:last], start) - start
+    ends = np.minimum(run_ends[first:last], end) - start
+    lengths = (ends - starts).astype(np.int64)
+    run_idxs = np.repeat(np.arange(first, last), lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(starts, lengths) + offsets, run_idxs
+
+
+class PackedGenome(object):
+    """ Memory mapped packed genome, concurrent readers share the page cache.
+
+    Sequences are accessed like a dict of str, for instance genome['1'][1000:1100],
+    decoding only the requested bases.
+
+    Args:
+        packed_filename (str): packed genome created by write_packed_genome
+
+    """
+
+    def __init__(self, packed_filename):
+        self.data = np.memmap(packed_filename, dtype=np.uint8, mode='r')
+
+        magic, num_sequences, index_offset = _header.unpack_from(self.data, 0)
+        if magic != _magic:
+            raise ValueError('invalid packed genome ' + packed_filename)
+
+        self.sequences = dict()
+        self.names = []
+
+        offset = index_offset
+        for seq_idx in range(num_sequences):
+            name_length, = struct.unpack_from('<I', self.data, offset)
+            offset += 4
+            name = self.data[offset:offset + name_length].tobytes().decode('ascii')
+            offset += name_length
+            length, bases_offset, num_exceptions, exceptions_offset, num_lowercase, lowercase_offset = _index_entry.unpack_from(self.data, offset)
+            offset += _index_entry.size
+
+            exceptions = self.data[exceptions_offset:exceptions_offset + 9 * num_exceptions]
+            lowercase = self.data[lowercase_offset:lowercase_offset + 8 * num_lowercase]
+
+            self.sequences[name] = (
+                length,
+                self.data[bases_offset:bases_offset + (length + 3) // 4],
+                exceptions[:4 * num_exceptions].view('<u4'),
+                exceptions[4 * num_exceptions:8 * num_exceptions].view('<u4'),
+                exceptions[8 * num_exceptions:],
+                lowercase[:4 * num_lowercase].view('<u4'),
+                lowercase[4 * num_lowercase:].view('<u4'),
+            )
+            self.names.append(name)
+
+    def __contains__(self, name):
+        return name in self.sequences
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def keys(self):
+        return list(self.names)
+
+    def values(self):
+        return [PackedSequence(self, name) for name in self.names]
+
+    def items(self):
+        return [(name, PackedSequence(self, name)) for name in self.names]
+
+    def __getitem__(self, name):
+        if name not in self.sequences:
+            raise KeyError(name)
+        return PackedSequence(self, name)
+
+    def length(self, name):
+        return int(self.sequences[name][0])
+
+    def fetch(self, name, start, end):
+        """ Sequence for 0-based positions [start, end) within the sequence.
+        """
+        length, bases, exception_starts, exception_ends, exception_bytes, lowercase_starts, lowercase_ends = self.sequences[name]
+
+        if start >= end:
+            return ''
+
+        byte_start = start // 4
+        sequence = _unpack_table[bases[byte_start:(end + 3) // 4]].reshape(-1)
+        sequence = sequence[start - 4 * byte_start:end - 4 * byte_start]
+
+        positions, run_idxs = _run_positions(exception_starts, exception_ends, start, end)
+        sequence[positions] = exception_bytes[run_idxs]
+
+        positions, _ = _run_positions(lowercase_starts, lowercase_ends, start, end)
+        letters = positions[(sequence[positions] >= ord('A')) & (sequence[positions] <= ord('Z'))]
+        sequence[letters] += 32
+
+        return sequence.tobytes().decode('ascii')
+
+
+class PackedSequence(object):
+    """ Sequence of a packed genome supporting len, indexing and slicing as for str.
+    """
+
+    def __init__(self, genome, name):
+        self.genome = genome
+        self.name = name
+
+    def __len__(self):
+        return self.genome.length(self.name)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, end, step = key.indices(len(self))
+            if step != 1:
+                return self.genome.fetch(self.name, 0, len(self))[key]
+            return self.genome.fetch(self.name, start, end)
+        length = len(self)
+        if key < 0:
+            key += length
+        if key < 0 or key >= length:
+            raise IndexError('sequence index out of range')
+        return self.genome.fetch(self.name, key, key + 1)
+
+    def __str__(self):
+        return self.genome.fetch(self.name, 0, len(self))
+
+
+def read_genome(genome_fasta):
+    """ Read a genome as a dict like object of sequences, using the packed
+    genome created alongside the fasta if it is up to date.
+    """
+    packed_filename = packed_genome_filename(genome_fasta)
+    if os.path.exists(packed_filename) and os.path.getmtime(packed_filename) >= os.path.getmtime(genome_fasta):
+        return PackedGenome(packed_filename)
+    with open(genome_fasta, 'rt') as fasta:
+        return dict(destruct.utils.seq.read_sequences(fasta))
@@ -0,0 +1,84 @@
+import os
+import struct
+
+import numpy as np
+import pandas as pd
+
+
+# Region index format, little endian:
+#
+#   header: b'DRI1', uint32 number of references
+#
+#   for each reference:
+#     uint32 name length, name, uint64 number of regions,
+#     int32 starts, int32 ends
+#
+# Regions of each reference are merged where they overlap, so both starts and
+# ends are sorted and an overlapping region is found by binary search.
+
+_magic = b'DRI1'
+
+
+def merge_regions(starts, ends):
+    """ Merge overlapping closed intervals, dropping empty intervals.
+
+    Args:
+        starts (numpy.array): interval starts
+        ends (numpy.array): interval ends
+
+    Returns:
+        tuple of numpy.array: sorted non overlapping starts and ends
+
+    """
+    keep = starts <= ends
+    order = np.lexsort((ends[keep], starts[keep]))
+    starts = starts[keep][order]
+    ends = ends[keep][order]
+
+    if len(starts) == 0:
+        return starts, ends
+
+    # A new merged interval begins where the start is beyond all previous ends
+    max_ends = np.maximum.accumulate(ends)
+    new_interval = np.concatenate([[True], starts[1:] > max_ends[:-1]])
+
+    merged_idxs = np.flatnonzero(new_interval)
+    merged_starts = starts[merged_idxs]
+    merged_ends = max_ends[np.concatenate([merged_idxs[1:] - 1, [len(starts) - 1]])]
+
+    return merged_starts, merged_ends
+
+
+def write_region_index(regions_filename, index_filename):
+    """ Create a sorted binary index of a chromosome, start, end regions file.
+
+    Args:
+        regions_filename (str): tab separated regions filename
+        index_filename (str): output region index filename
+
+    """
+    temp_filename = index_filename + '.tmp'
+
+    if os.path.getsize(regions_filename) > 0:
+        regions = pd.read_csv(regions_filename, sep='\t', header=None, usecols=[0, 1, 2],
+                              names=['chromosome', 'start', 'end'], converters={'chromosome': str})
+    else:
+        regions = pd.DataFrame({'chromosome': [], 'start': [], 'end': []})
+
+    with open(temp_filename, 'wb') as index_file:
+        chromosomes = sorted(regions['chromosome'].unique())
+
+        index_file.write(_magic + struct.pack('<I', len(chromosomes)))
+
+        for chromosome, chromosome_regions in regions.groupby('chromosome', sort=True):
+            starts, ends = merge_regions(
+                chromosome_regions['start'].values.astype(np.int64),
+                chromosome_regions['end'].values.astype(np.int64))
+
+            name = chromosome.encode('ascii')
+            index_file.write(struct.pack('<I', len(name)) + name + struct.pack('<Q', len(starts)))
+            index_file.write(starts.astype('<i4').tobytes())
+            index_file.write(ends.astype('<i4').tobytes())
+
+    os.rename(temp_filename, index_filename)
+
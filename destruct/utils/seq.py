@@ -1,3 +1,5 @@
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
 
 
 def read_sequences(fasta):
@@ -17,3 +19,147 @@ def read_sequences(fasta):
     if id is not None:
         yield (id, ''.join(sequences))
 
+
+
+# Bytes removed by str.rstrip for ascii text
+_rstrip_bytes = np.zeros(256, dtype=bool)
+_rstrip_bytes[[9, 10, 11, 12, 13, 28, 29, 30, 31, 32]] = True
+
+
+class FastqBlockReader(object):
+    """ Read blocks of complete fastq records as bytes.
+
+    Args:
+        fastq_file (file): fastq opened in binary mode
+        block_size (int): number of bytes per read
+
+    """
+
+    def __init__(self, fastq_file, block_size=1 << 22):
+        self.fastq_file = fastq_file
+        self.block_size = block_size
+        self.chunks = []
+        self.size = 0
+        self.line_ends = [np.zeros(0, dtype=np.int64)]
+        self.num_lines = 0
+        self.eof = False
+
+    def num_records(self):
+        return self.num_lines // 4
+
+    def fill(self):
+        """ Read another block, returning False at end of file.
+        """
+        if self.eof:
+            return False
+        block = self.fastq_file.read(self.block_size)
+        if not block:
+            self.eof = True
+            if self.size == 0 or self.chunks[-1].endswith(b'\n'):
+                return False
+            block = b'\n'
+        block_line_ends = np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == ord('\n')) + self.size
+        self.chunks.append(block)
+        self.size += len(block)
+        self.line_ends.append(block_line_ends)
+        self.num_lines += len(block_line_ends)
+        return True
+
+    def take(self, num_records):
+        """ Remove records from the buffer.
+
+        Returns:
+            tuple of memoryview, numpy.array, numpy.array: data, and line
+            start and end offsets with shape (num_records, 4)
+
+        """
+        num_lines = 4 * num_records
+        data = b''.join(self.chunks)
+        line_ends = np.concatenate(self.line_ends)
+        ends = line_ends[:num_lines]
+        starts = np.concatenate([[0], ends[:-1] + 1])
+        cut = int(ends[-1]) + 1 if num_lines > 0 else 0
+        remainder = data[cut:]
+        self.chunks = [remainder] if len(remainder) > 0 else []
+        self.size = len(remainder)
+        self.line_ends = [line_ends[num_lines:] - cut]
+        self.num_lines -= num_lines
+        return memoryview(data)[:cut], starts.reshape(-1, 4), ends.reshape(-1, 4)
+
+
+def iter_paired_fastq_blocks(fastq_1_file, fastq_2_file, max_records, records_per_block=1 << 16):
+    """ Iterate paired blocks of fastq records, stopping at the end of either file.
+
+    Args:
+        fastq_1_file (file): end 1 fastq opened in binary mode
+        fastq_2_file (file): end 2 fastq opened in binary mode
+        max_records (callable): maximum records for the next block
+        records_per_block (int): target number of records per block
+
+    Yields:
+        tuple of tuples: for each end, results of FastqBlockReader.take
+
+    """
+    readers = (FastqBlockReader(fastq_1_file), FastqBlockReader(fastq_2_file))
+    while True:
+        for reader in readers:
+            while reader.num_records() < records_per_block and reader.fill():
+                pass
+        num_records = min(min(reader.num_records() for reader in readers), max_records())
+        if num_records == 0:
+            break
+        yield tuple(reader.take(num_records) for reader in readers)
+
+
+def write_seed_fastq_block(seed_file, block_1, block_2, seed_length):
+    """ Write paired records truncated to seed length, stripping trailing
+    whitespace from each line.
+
+    Args:
+        seed_file (file): output opened in binary mode
+        block_1 (tuple): end 1 block from FastqBlockReader.take
+        block_2 (tuple): end 2 block from FastqBlockReader.take
+        seed_length (int): maximum sequence and quality length
+
+    """
+    data_1, starts_1, ends_1 = block_1
+    data_2, starts_2, ends_2 = block_2
+
+    buf = np.concatenate([np.frombuffer(data_1, dtype=np.uint8), np.frombuffer(data_2, dtype=np.uint8)])
+
+    # Interleave end 1 and end 2 lines of each record
+    starts = np.hstack([starts_1, starts_2 + len(data_1)])
+    ends = np.hstack([ends_1, ends_2 + len(data_1)])
+
+    # Strip trailing whitespace
+    strip = ends > starts
+    strip[strip] = _rstrip_bytes[buf[ends[strip] - 1]]
+    while strip.any():
+        ends[strip] -= 1
+        strip &= ends > starts
+        strip[strip] = _rstrip_bytes[buf[ends[strip] - 1]]
+
+    # Truncate sequence and qualities of reads with long sequences
+    for seq_col in (1, 5):
+        truncate = (ends[:, seq_col] - starts[:, seq_col]) > seed_length
+        for col in (seq_col, seq_col + 2):
+            ends[truncate, col] = starts[truncate, col] + seed_length
+
+    # Copy lines grouped by length, each line as a single row of a strided
+    # view over the input and output buffers, then add newlines
+    starts = starts.ravel()
+    lengths = ends.ravel() - starts
+    out_starts = np.cumsum(lengths + 1) - lengths - 1
+    out = np.empty(int(lengths.sum()) + len(lengths), dtype=np.uint8)
+    order = np.argsort(lengths, kind='stable')
+    group_starts = np.flatnonzero(np.diff(lengths[order])) + 1
+    for group in np.split(order, group_starts):
+        length = int(lengths[group[0]])
+        if length == 0:
+            continue
+        src = as_strided(buf, shape=(len(buf) - length + 1, length), strides=(1, 1))
+        dst = as_strided(out, shape=(len(out) - length + 1, length), strides=(1, 1))
+        dst[out_starts[group]] = src[starts[group]]
+    out[out_starts + lengths] = ord('\n')
+
+    seed_file.write(out.tobytes())
@@ -49,22 +49,25 @@ def group_aware_iter(df_iter, group_cols):
     for df in df_iter:
 
         if len(df.index) == 0:
-            return
+            break
+
+        # Add previous last group to beginning of data, the last group
+        # may span several chunks
+        if prev_data is not None:
+            df = pd.concat([prev_data, df], ignore_index=True)
 
         last_group = df.loc[df.index[-1], group_cols].values
 
-        # Remove last group
-        next_data = df.loc[(df[group_cols] != last_group).all(axis=1)]
+        is_last_group = (df[group_cols] == last_group).all(axis=1)
 
-        # Add previous last group to beginning of data
-        if prev_data is not None:
-            next_data = pd.concat([prev_data, next_data], ignore_index=True)
+        # Remove last group
+        next_data = df.loc[~is_last_group]
 
-        yield next_data
+        if len(next_data.index) > 0:
+            yield next_data
 
         # Save last group for next yield
-        prev_data = df.loc[(df[group_cols] == last_group).all(axis=1)]
-
-    yield prev_data
-
+        prev_data = df.loc[is_last_group]
 
+    if prev_data is not None:
+        yield prev_data
@@ -5,6 +5,7 @@ import pypeliner.workflow
 import pypeliner.managed as mgd
 
 import destruct.tasks
+import destruct.cache
 import destruct.defaultconfig
 
 
@@ -14,6 +15,10 @@ lowmem = {'mem': 4, 'num_retry': 2, 'mem_retry_factor': 2}
 medmem = {'mem': 8, 'num_retry': 2, 'mem_retry_factor': 2}
 himem = {'mem': 16, 'num_retry': 2, 'mem_retry_factor': 2}
 
+# Seed length and bowtie arguments for seed alignment
+seed_length = 36
+bowtie_args = ('--chunkmbs', '512', '-k', '1000', '-m', '1000', '--strata', '--best', '-S')
+
 
 def create_destruct_workflow(
     bam_filenames,
@@ -23,14 +28,25 @@ def create_destruct_workflow(
     config,
     ref_data_dir,
     raw_data_dir=None,
+    realign_splits_table=None,
+    score_sampling_table=None,
 ):
-    # Optionally cache raw reads for quicker rerun
+    config = destruct.defaultconfig.get_config(ref_data_dir, config)
+
+    # Optionally cache raw reads for quicker rerun, keyed by the content
+    # of each bam and the config used to extract reads
     if raw_data_dir is not None:
-        mgd_stats = mgd.File(os.path.join(raw_data_dir, '{bylibrary}_stats.txt'), 'bylibrary')
-        mgd_reads_1 = mgd.File(os.path.join(raw_data_dir, '{bylibrary}_reads1.fq.gz'), 'bylibrary')
-        mgd_reads_2 = mgd.File(os.path.join(raw_data_dir, '{bylibrary}_reads2.fq.gz'), 'bylibrary')
-        mgd_sample_1 = mgd.File(os.path.join(raw_data_dir, '{bylibrary}_sample1.fq.gz'), 'bylibrary')
-        mgd_sample_2 = mgd.File(os.path.join(raw_data_dir, '{bylibrary}_sample2.fq.gz'), 'bylibrary')
+        cache_dirs = destruct.cache.library_cache_dirs(
+            os.path.join(raw_data_dir, 'bamdisc'),
+            dict([(lib_id, [bam_filename]) for lib_id, bam_filename in bam_filenames.items()]),
+            config,
+            destruct.cache.bamdisc_config_keys,
+        )
+        mgd_stats = mgd.File('stats.txt', 'bylibrary', fnames=destruct.cache.CacheFilenames(cache_dirs, 'stats.txt'))
+        mgd_reads_1 = mgd.File('reads1.fq.gz', 'bylibrary', fnames=destruct.cache.CacheFilenames(cache_dirs, 'reads1.fq.gz'))
+        mgd_reads_2 = mgd.File('reads2.fq.gz', 'bylibrary', fnames=destruct.cache.CacheFilenames(cache_dirs, 'reads2.fq.gz'))
+        mgd_sample_1 = mgd.File('sample1.fq.gz', 'bylibrary', fnames=destruct.cache.CacheFilenames(cache_dirs, 'sample1.fq.gz'))
+        mgd_sample_2 = mgd.File('sample2.fq.gz', 'bylibrary', fnames=destruct.cache.CacheFilenames(cache_dirs, 'sample2.fq.gz'))
 
     else:
         mgd_stats = mgd.TempFile('stats.txt', 'bylibrary')
@@ -39,8 +55,6 @@ def create_destruct_workflow(
         mgd_sample_1 = mgd.TempFile('sample1.fq.gz', 'bylibrary')
         mgd_sample_2 = mgd.TempFile('sample2.fq.gz', 'bylibrary')
 
-    config = destruct.defaultconfig.get_config(ref_data_dir, config)
-
     workflow = pypeliner.workflow.Workflow()
 
     # Set the library ids
@@ -50,27 +64,99 @@ def create_destruct_workflow(
         value=destruct.tasks.create_library_ids(bam_filenames.keys()),
     )
 
-    # Retrieve discordant reads and stats from bam files
+    # Retrieve discordant reads and stats from bam files, region sharding
+    # requires coordinate sorted bams so is skipped for collated bams
+
+    bamdisc_region_size = config['bamdisc_region_size']
+    if bamdisc_region_size is not None and any(
+            destruct.tasks.is_collated_bam(bam_filename) for bam_filename in bam_filenames.values()):
+        bamdisc_region_size = None
+
+    if bamdisc_region_size is None:
+        workflow.commandline(
+            name='bamdisc',
+            axes=('bylibrary',),
+            ctx={'io': 1, 'mem': 8, 'ncpus': config['bamdisc_threads']},
+            args=(
+                'destruct_bamdiscordantfastq',
+                '-r',
+                '-c', config['bam_max_soft_clipped'],
+                '-f', config['bam_max_fragment_length'],
+                '-b', mgd.InputFile('bam', 'bylibrary', fnames=bam_filenames),
+                '-s', mgd_stats.as_output(),
+                '--fastq1', mgd_reads_1.as_output(),
+                '--fastq2', mgd_reads_2.as_output(),
+                '-t', mgd.TempSpace('bamdisc.tempspace', 'bylibrary'),
+                '-n', config['num_read_samples'],
+                '--sample1', mgd_sample_1.as_output(),
+                '--sample2', mgd_sample_2.as_output(),
+                '--threads', config['bamdisc_threads'],
+                '--spillmem', config['bamdisc_spill_memory'],
+                '--spillfanin', config['bamdisc_spill_fan_in'],
+            ),
+        )
 
-    workflow.commandline(
-        name='bamdisc',
-        axes=('bylibrary',),
-        ctx={'io': 1, 'mem': 8},
-        args=(
-            'destruct_bamdiscordantfastq',
-            '-r',
-            '-c', config['bam_max_soft_clipped'],
-            '-f', config['bam_max_fragment_length'],
-            '-b', mgd.InputFile('bam', 'bylibrary', fnames=bam_filenames),
-            '-s', mgd_stats.as_output(),
-            '--fastq1', mgd_reads_1.as_output(),
-            '--fastq2', mgd_reads_2.as_output(),
-            '-t', mgd.TempSpace('bamdisc.tempspace', 'bylibrary'),
-            '-n', config['num_read_samples'],
-            '--sample1', mgd_sample_1.as_output(),
-            '--sample2', mgd_sample_2.as_output(),
-        ),
-    )
+    else:
+        # Extract discordant reads from regions of each bam in parallel,
+        # pairing reads with mates in different regions when merging
+
+        workflow.transform(
+            name='bamregions',
+            axes=('bylibrary',),
+            ctx=locally,
+            func=destruct.tasks.generate_bam_regions,
+            ret=mgd.TempOutputObj('bam_region', 'bylibrary', 'byregion'),
+            args=(
+                mgd.InputFile('bam', 'bylibrary', fnames=bam_filenames),
+                bamdisc_region_size,
+            ),
+        )
+
+        workflow.commandline(
+            name='bamdiscshard',
+            axes=('bylibrary', 'byregion'),
+            ctx={'io': 1, 'mem': 8, 'ncpus': config['bamdisc_threads']},
+            args=(
+                'destruct_bamdiscordantfastq',
+                '-c', config['bam_max_soft_clipped'],
+                '-f', config['bam_max_fragment_length'],
+                '-b', mgd.InputFile('bam', 'bylibrary', fnames=bam_filenames),
+                '--region', mgd.TempInputObj('bam_region', 'bylibrary', 'byregion'),
+                '-s', mgd.TempOutputFile('shard_stats.txt', 'bylibrary', 'byregion'),
+                '--fastq1', mgd.TempOutputFile('shard_reads1.fq.gz', 'bylibrary', 'byregion'),
+                '--fastq2', mgd.TempOutputFile('shard_reads2.fq.gz', 'bylibrary', 'byregion'),
+                '--orphans', mgd.TempOutputFile('shard_orphans.tsv.gz', 'bylibrary', 'byregion'),
+                '-t', mgd.TempSpace('bamdisc.tempspace', 'bylibrary', 'byregion'),
+                '-n', config['num_read_samples'],
+                '--sample1', mgd.TempOutputFile('shard_sample1.fq.gz', 'bylibrary', 'byregion'),
+                '--sample2', mgd.TempOutputFile('shard_sample2.fq.gz', 'bylibrary', 'byregion'),
+                '--threads', config['bamdisc_threads'],
+                '--spillmem', config['bamdisc_spill_memory'],
+                '--spillfanin', config['bamdisc_spill_fan_in'],
+            ),
+        )
+
+        workflow.transform(
+            name='bamdiscmerge',
+            axes=('bylibrary',),
+            ctx={'io': 1, 'mem': 8, 'ncpus': config['bamdisc_threads']},
+            func=destruct.tasks.merge_discordant_shards,
+            args=(
+                mgd.TempInputFile('shard_reads1.fq.gz', 'bylibrary', 'byregion'),
+                mgd.TempInputFile('shard_reads2.fq.gz', 'bylibrary', 'byregion'),
+                mgd.TempInputFile('shard_stats.txt', 'bylibrary', 'byregion'),
+                mgd.TempInputFile('shard_sample1.fq.gz', 'bylibrary', 'byregion'),
+                mgd.TempInputFile('shard_sample2.fq.gz', 'bylibrary', 'byregion'),
+                mgd.TempInputFile('shard_orphans.tsv.gz', 'bylibrary', 'byregion'),
+                mgd_reads_1.as_output(),
+                mgd_reads_2.as_output(),
+                mgd_stats.as_output(),
+                mgd_sample_1.as_output(),
+                mgd_sample_2.as_output(),
+                config['num_read_samples'],
+                config['bamdisc_threads'],
+            ),
+        )
 
     workflow.subworkflow(
         name='destruct_fastq',
@@ -89,6 +175,8 @@ def create_destruct_workflow(
         ),
         kwargs={
             'raw_data_dir': raw_data_dir,
+            'realign_splits_table': mgd.OutputFile(realign_splits_table) if realign_splits_table is not None else None,
+            'score_sampling_table': mgd.OutputFile(score_sampling_table) if score_sampling_table is not None else None,
         },
     )
 
@@ -107,7 +195,69 @@ def create_destruct_fastq_workflow(
     config,
     ref_data_dir,
     raw_data_dir=None,
+    realign_splits_table=None,
+    score_sampling_table=None,
 ):
+    # Optionally convert bowtie sam to binary for realignment
+    if config['binary_seed_alignments']:
+        seed_alignment_pipe = ('|', 'destruct_samtobinary', '|')
+        seed_alignment_args = ('--binary',)
+    else:
+        seed_alignment_pipe = ('|',)
+        seed_alignment_args = ()
+
+    # Optionally cache realignments for quicker rerun, keyed by the content
+    # of each library's reads and the reference, the config used for
+    # realignment, and the fixed seed alignment arguments
+    if raw_data_dir is not None:
+        cache_params = (destruct.cache.genome_checksum(config), seed_length) + bowtie_args
+
+        cache_dirs = destruct.cache.library_cache_dirs(
+            os.path.join(raw_data_dir, 'realign'),
+            dict([(lib_id, [
+                fastq1_filenames[lib_id],
+                fastq2_filenames[lib_id],
+                sample1_filenames[lib_id],
+                sample2_filenames[lib_id],
+                stats_filenames[lib_id],
+            ]) for lib_id in fastq1_filenames.keys()]),
+            config,
+            destruct.cache.realign_config_keys,
+            cache_params,
+        )
+
+        # Score stats are cached separately, keyed by the sampled reads and
+        # alignment scores only, so changes to other realignment settings
+        # skip both sample alignment and score stats
+        score_stats_cache_dirs = destruct.cache.library_cache_dirs(
+            os.path.join(raw_data_dir, 'scorestats'),
+            dict([(lib_id, [
+                sample1_filenames[lib_id],
+                sample2_filenames[lib_id],
+                stats_filenames[lib_id],
+            ]) for lib_id in fastq1_filenames.keys()]),
+            config,
+            destruct.cache.score_stats_config_keys,
+            cache_params,
+        )
+        mgd_score_stats = mgd.File('score.stats', 'bylibrary', fnames=destruct.cache.CacheFilenames(score_stats_cache_dirs, 'score.stats'))
+        mgd_score_sampling = mgd.File('score_sampling.tsv', 'bylibrary', fnames=destruct.cache.CacheFilenames(score_stats_cache_dirs, 'score_sampling.tsv'))
+
+        mgd_reads_1 = mgd.File('reads1', 'bylibrary', 'byread', fnames=destruct.cache.CacheFilenames(cache_dirs, 'reads1.{}.fq'))
+        mgd_reads_2 = mgd.File('reads2', 'bylibrary', 'byread', fnames=destruct.cache.CacheFilenames(cache_dirs, 'reads2.{}.fq'), axes_origin=[])
+        mgd_spanning = mgd.File('spanning.alignments', 'bylibrary', 'byread', fnames=destruct.cache.CacheFilenames(cache_dirs, 'spanning.{}.alignments'))
+        mgd_split = mgd.File('split.alignments', 'bylibrary', 'byread', fnames=destruct.cache.CacheFilenames(cache_dirs, 'split.{}.alignments'))
+        mgd_realign_splits = mgd.File('realign_splits.tsv', 'bylibrary', fnames=destruct.cache.CacheFilenames(cache_dirs, 'realign_splits.tsv'))
+
+    else:
+        mgd_score_stats = mgd.TempFile('score.stats', 'bylibrary')
+        mgd_score_sampling = mgd.TempFile('score_sampling.tsv', 'bylibrary')
+        mgd_reads_1 = mgd.TempFile('reads1', 'bylibrary', 'byread')
+        mgd_reads_2 = mgd.TempFile('reads2', 'bylibrary', 'byread', axes_origin=[])
+        mgd_spanning = mgd.TempFile('spanning.alignments', 'bylibrary', 'byread')
+        mgd_split = mgd.TempFile('split.alignments', 'bylibrary', 'byread')
+        mgd_realign_splits = mgd.TempFile('realign_splits.tsv', 'bylibrary')
+
     workflow = pypeliner.workflow.Workflow()
 
     # Set the library ids
@@ -139,124 +289,206 @@ def create_destruct_fastq_workflow(
         args=(
             mgd.InputFile('sample1.fq.gz', 'bylibrary', fnames=sample1_filenames),
             mgd.InputFile('sample2.fq.gz', 'bylibrary', fnames=sample2_filenames),
-            36,
+            seed_length,
             mgd.TempOutputFile('sample.seed', 'bylibrary'),
         ),
     )
 
-    workflow.commandline(
-        name='bwtrealign_sample',
-        axes=('bylibrary',),
-        ctx=medmem,
-        args=(
+    # Optionally align the sample in batches until the score stats are within tolerance
+
+    if config['score_stats_tolerance'] is None:
+        workflow.commandline(
+            name='bwtrealign_sample',
+            axes=('bylibrary',),
+            ctx=medmem,
+            args=(
+                'bowtie',
+                config['genome_fasta'],
+                mgd.TempInputFile('sample.seed', 'bylibrary'),
+            ) + bowtie_args + seed_alignment_pipe + (
+                'destruct_aligntrue',
+                '-a', '-',
+                '-1', mgd.InputFile('sample1.fq.gz', 'bylibrary', fnames=sample1_filenames),
+                '-2', mgd.InputFile('sample2.fq.gz', 'bylibrary', fnames=sample2_filenames),
+                '-r', config['genome_fasta'],
+                '-g', config['gap_score'],
+                '-x', config['mismatch_score'],
+                '-m', config['match_score'],
+                '--flmin', mgd.TempInputObj('stats', 'bylibrary').prop('fragment_length_min'),
+                '--flmax', mgd.TempInputObj('stats', 'bylibrary').prop('fragment_length_max'),
+                '-s', mgd.TempOutputFile('samples.align.true', 'bylibrary'),
+            ) + seed_alignment_args,
+        )
+
+        workflow.transform(
+            name='scorestats',
+            axes=('bylibrary',),
+            ctx=medmem,
+            func='destruct.score_stats.create_score_stats',
+            args=(
+                mgd.TempInputFile('samples.align.true', 'bylibrary'),
+                config['match_score'],
+                mgd_score_stats.as_output(),
+            ),
+        )
+
+    else:
+        workflow.transform(
+            name='scorestats',
+            axes=('bylibrary',),
+            ctx=medmem,
+            func='destruct.score_stats.create_score_stats_sequential',
+            args=(
+                mgd.InputFile('sample1.fq.gz', 'bylibrary', fnames=sample1_filenames),
+                mgd.InputFile('sample2.fq.gz', 'bylibrary', fnames=sample2_filenames),
+                seed_length,
+                ('bowtie', config['genome_fasta']) + bowtie_args,
+                seed_alignment_pipe,
+                (
+                    'destruct_aligntrue',
+                    '-a', '-',
+                    '-r', config['genome_fasta'],
+                    '-g', config['gap_score'],
+                    '-x', config['mismatch_score'],
+                    '-m', config['match_score'],
+                    '--flmin', mgd.TempInputObj('stats', 'bylibrary').prop('fragment_length_min'),
+                    '--flmax', mgd.TempInputObj('stats', 'bylibrary').prop('fragment_length_max'),
+                ) + seed_alignment_args,
+                config['match_score'],
+                mgd_score_stats.as_output(),
+                mgd_score_sampling.as_output(),
+                mgd.TempSpace('scorestats_temp', 'bylibrary'),
+                int(config['score_stats_batch_size']),
+                config['score_stats_tolerance'],
+                config['score_stats_min_length_fraction'],
+            ),
+        )
+
+        if score_sampling_table is not None:
+            workflow.transform(
+                name='merge_score_sampling',
+                ctx=lowmem,
+                func='destruct.tasks.merge_library_tables',
+                args=(
+                    mgd.TempInputObj('library_id', 'bylibrary'),
+                    mgd_score_sampling.as_input(),
+                    mgd.OutputFile(score_sampling_table),
+                ),
+            )
+
+    # Seed alignment piped to realignment, for the sampled reads and each chunk of discordant reads
+
+    def realign_command(seed_fastq, reads_1, reads_2, spanning, split):
+        return (
             'bowtie',
             config['genome_fasta'],
-            mgd.TempInputFile('sample.seed', 'bylibrary'),
-            '--chunkmbs', '512',
-            '-k', '1000',
-            '-m', '1000',
-            '--strata',
-            '--best',
-            '-S',
-            '|',
-            'destruct_aligntrue',
+            seed_fastq,
+        ) + bowtie_args + seed_alignment_pipe + (
+            'destruct_realign2',
+            '-l', mgd.TempInputObj('library_id', 'bylibrary'),
             '-a', '-',
-            '-1', mgd.InputFile('sample1.fq.gz', 'bylibrary', fnames=sample1_filenames),
-            '-2', mgd.InputFile('sample2.fq.gz', 'bylibrary', fnames=sample2_filenames),
+            '-1', reads_1,
+            '-2', reads_2,
             '-r', config['genome_fasta'],
             '-g', config['gap_score'],
             '-x', config['mismatch_score'],
             '-m', config['match_score'],
             '--flmin', mgd.TempInputObj('stats', 'bylibrary').prop('fragment_length_min'),
             '--flmax', mgd.TempInputObj('stats', 'bylibrary').prop('fragment_length_max'),
-            '-s', mgd.TempOutputFile('samples.align.true', 'bylibrary'),
-        ),
-    )
+            '--tchimer', config['chimeric_threshold'],
+            '--talign', config['alignment_threshold'],
+            '--pchimer', config['chimeric_prior'],
+            '--tvalid', config['readvalid_threshold'],
+            '-z', mgd_score_stats.as_input(),
+            '--span', spanning,
+            '--split', split,
+            '--threads', config['realign_threads'],
+        ) + seed_alignment_args
+
+    # Optionally size realignment jobs from the time taken to realign the
+    # sampled reads, persisted with the realignment outputs so that reruns
+    # split the reads the same way
+
+    if config['reads_per_split'] is None:
+        workflow.transform(
+            name='realign_splits',
+            axes=('bylibrary',),
+            ctx=dict(medmem, ncpus=config['realign_threads']),
+            func='destruct.tasks.calculate_reads_per_split',
+            args=(
+                mgd.TempInputObj('stats', 'bylibrary'),
+                mgd.InputFile('sample1.fq.gz', 'bylibrary', fnames=sample1_filenames),
+                mgd.TempInputFile('sample.seed', 'bylibrary'),
+                config['realign_job_seconds'],
+                int(config['reads_per_split_min']),
+                int(config['reads_per_split_max']),
+                mgd_realign_splits.as_output(),
+                mgd.TempSpace('realign_splits_temp', 'bylibrary'),
+            ) + realign_command(
+                mgd.TempInputFile('sample.seed', 'bylibrary'),
+                mgd.InputFile('sample1.fq.gz', 'bylibrary', fnames=sample1_filenames),
+                mgd.InputFile('sample2.fq.gz', 'bylibrary', fnames=sample2_filenames),
+                mgd.TempOutputFile('sample.spanning.alignments', 'bylibrary'),
+                mgd.TempOutputFile('sample.split.alignments', 'bylibrary'),
+            ),
+        )
+
+        workflow.transform(
+            name='reads_per_split',
+            axes=('bylibrary',),
+            ctx=lowmem,
+            func='destruct.tasks.read_reads_per_split',
+            ret=mgd.TempOutputObj('reads_per_split', 'bylibrary'),
+            args=(
+                mgd_realign_splits.as_input(),
+            ),
+        )
+
+        reads_per_split = mgd.TempInputObj('reads_per_split', 'bylibrary')
+
+        if realign_splits_table is not None:
+            workflow.transform(
+                name='merge_realign_splits',
+                ctx=lowmem,
+                func='destruct.tasks.merge_library_tables',
+                args=(
+                    mgd.TempInputObj('library_id', 'bylibrary'),
+                    mgd_realign_splits.as_input(),
+                    mgd.OutputFile(realign_splits_table),
+                ),
+            )
 
-    workflow.transform(
-        name='scorestats',
-        axes=('bylibrary',),
-        ctx=medmem,
-        func='destruct.score_stats.create_score_stats',
-        args=(
-            mgd.TempInputFile('samples.align.true', 'bylibrary'),
-            config['match_score'],
-            mgd.TempOutputFile('score.stats', 'bylibrary'),
-        ),
-    )
+    else:
+        reads_per_split = int(config['reads_per_split'])
 
     # Split discordant fastqs and align
 
     workflow.transform(
-        name='splitfastq1',
+        name='splitfastqseed',
         axes=('bylibrary',),
         ctx=lowmem,
-        func='destruct.tasks.split_fastq',
+        func='destruct.tasks.split_fastq_seed',
         args=(
             mgd.InputFile('reads1.fq.gz', 'bylibrary', fnames=fastq1_filenames),
-            int(config['reads_per_split']),
-            mgd.TempOutputFile('reads1', 'bylibrary', 'byread'),
-        ),
-    )
-
-    workflow.transform(
-        name='splitfastq2',
-        axes=('bylibrary',),
-        ctx=lowmem,
-        func='destruct.tasks.split_fastq',
-        args=(
             mgd.InputFile('reads2.fq.gz', 'bylibrary', fnames=fastq2_filenames),
-            int(config['reads_per_split']),
-            mgd.TempOutputFile('reads2', 'bylibrary', 'byread', axes_origin=[]),
-        ),
-    )
-
-    workflow.transform(
-        name='prepseed',
-        axes=('bylibrary', 'byread'),
-        ctx=medmem,
-        func='destruct.tasks.prepare_seed_fastq',
-        args=(
-            mgd.TempInputFile('reads1', 'bylibrary', 'byread'),
-            mgd.TempInputFile('reads2', 'bylibrary', 'byread'),
-            36,
-            mgd.TempOutputFile('reads.seed', 'bylibrary', 'byread'),
+            reads_per_split,
+            seed_length,
+            mgd_reads_1.as_output(),
+            mgd_reads_2.as_output(),
+            mgd.TempOutputFile('reads.seed', 'bylibrary', 'byread', axes_origin=[]),
         ),
     )
 
     workflow.commandline(
         name='bwtrealign',
         axes=('bylibrary', 'byread'),
-        ctx=medmem,
-        args=(
-            'bowtie',
-            config['genome_fasta'],
+        ctx=dict(medmem, ncpus=config['realign_threads']),
+        args=realign_command(
             mgd.TempInputFile('reads.seed', 'bylibrary', 'byread'),
-            '--chunkmbs', '512',
-            '-k', '1000',
-            '-m', '1000',
-            '--strata',
-            '--best',
-            '-S',
-            '|',
-            'destruct_realign2',
-            '-l', mgd.TempInputObj('library_id', 'bylibrary'),
-            '-a', '-',
-            '-1', mgd.TempInputFile('reads1', 'bylibrary', 'byread'),
-            '-2', mgd.TempInputFile('reads2', 'bylibrary', 'byread'),
-            '-r', config['genome_fasta'],
-            '-g', config['gap_score'],
-            '-x', config['mismatch_score'],
-            '-m', config['match_score'],
-            '--flmin', mgd.TempInputObj('stats', 'bylibrary').prop('fragment_length_min'),
-            '--flmax', mgd.TempInputObj('stats', 'bylibrary').prop('fragment_length_max'),
-            '--tchimer', config['chimeric_threshold'],
-            '--talign', config['alignment_threshold'],
-            '--pchimer', config['chimeric_prior'],
-            '--tvalid', config['readvalid_threshold'],
-            '-z', mgd.TempInputFile('score.stats', 'bylibrary'),
-            '--span', mgd.TempOutputFile('spanning.alignments', 'bylibrary', 'byread'),
-            '--split', mgd.TempOutputFile('split.alignments', 'bylibrary', 'byread'),
+            mgd_reads_1.as_input(),
+            mgd_reads_2.as_input(),
+            mgd_spanning.as_output(),
+            mgd_split.as_output(),
         ),
     )
 
@@ -266,7 +498,7 @@ def create_destruct_fastq_workflow(
         ctx=lowmem,
         func='destruct.tasks.merge_files_by_line',
         args=(
-            mgd.TempInputFile('spanning.alignments', 'bylibrary', 'byread'),
+            mgd_spanning.as_input(),
             mgd.TempOutputFile('spanning.alignments_1', 'bylibrary'),
         ),
     )
@@ -290,7 +522,7 @@ def create_destruct_fastq_workflow(
         ctx=lowmem,
         func='destruct.tasks.merge_files_by_line',
         args=(
-            mgd.TempInputFile('split.alignments', 'bylibrary', 'byread'),
+            mgd_split.as_input(),
             mgd.TempOutputFile('split.alignments', 'bylibrary'),
         ),
     )
@@ -317,11 +549,21 @@ def create_destruct_fastq_workflow(
         ),
     )
 
-    # Cluster spanning reads
+    # Partition alignments into clustering jobs of similar size by chromosome pair
 
-    workflow.setobj(
-        obj=mgd.TempOutputObj('chrom.args', 'bychromarg'),
-        value=destruct.tasks.generate_chromosome_args(config['chromosomes']),
+    workflow.transform(
+        name='partition_alignments',
+        ctx=lowmem,
+        func='destruct.tasks.partition_by_chromosome_pair',
+        ret=mgd.TempOutputObj('chrom.args', 'bychromarg'),
+        args=(
+            config['chromosomes'],
+            mgd.TempInputFile('spanning.alignments'),
+            mgd.TempInputFile('split.alignments'),
+            mgd.TempOutputFile('spanning.alignments', 'bychromarg'),
+            mgd.TempOutputFile('split.alignments', 'bychromarg'),
+            config['cluster_job_alignments'],
+        ),
     )
 
     workflow.transform(
@@ -335,13 +577,15 @@ def create_destruct_fastq_workflow(
         ),
     )
 
+    # Cluster spanning reads
+
     workflow.commandline(
         name='cluster',
         axes=('bychromarg',),
         ctx=medmem,
         args=(
             'destruct_mclustermatepairs',
-            '-a', mgd.TempInputFile('spanning.alignments'),
+            '-a', mgd.TempInputFile('spanning.alignments', 'bychromarg'),
             '-s', mgd.TempInputFile('libstats.tsv'),
             '-c', mgd.TempOutputFile('clusters', 'bychromarg'),
             mgd.TempInputObj('chrom.args', 'bychromarg'),
@@ -359,8 +603,8 @@ def create_destruct_fastq_workflow(
         func='destruct.predict_breaks.predict_breaks',
         args=(
             mgd.TempInputFile('clusters', 'bychromarg'),
-            mgd.TempInputFile('spanning.alignments'),
-            mgd.TempInputFile('split.alignments'),
+            mgd.TempInputFile('spanning.alignments', 'bychromarg'),
+            mgd.TempInputFile('split.alignments', 'bychromarg'),
             mgd.TempOutputFile('breakpoints_2', 'bychromarg'),
         ),
     )
@@ -378,6 +622,21 @@ def create_destruct_fastq_workflow(
         ),
     )
 
+    # Index clusters by read so each realignment job reads only the clusters of its reads
+
+    workflow.transform(
+        name='index_clusters',
+        ctx=medmem,
+        func='destruct.tasks.index_clusters',
+        args=(
+            mgd.TempInputFile('clusters'),
+            mgd.TempInputFile('breakpoints_2'),
+            mgd.TempOutputFile('clusters.sorted'),
+            mgd.TempOutputFile('clusters.index'),
+            mgd.TempOutputFile('breakpoints_2.index'),
+        ),
+    )
+
     # Realign reads to breakpoints
 
     workflow.commandline(
@@ -388,14 +647,16 @@ def create_destruct_fastq_workflow(
             'destruct_realigntobreaks2',
             '-r', config['genome_fasta'],
             '-b', mgd.TempInputFile('breakpoints_2'),
-            '-c', mgd.TempInputFile('clusters'),
+            '-c', mgd.TempInputFile('clusters.sorted'),
+            '--clustersindex', mgd.TempInputFile('clusters.index'),
+            '--breakpointsindex', mgd.TempInputFile('breakpoints_2.index'),
             '-g', config['gap_score'],
             '-x', config['mismatch_score'],
             '-m', config['match_score'],
             '--flmax', mgd.TempInputObj('stats', 'bylibrary').prop('fragment_length_max'),
-            '--span', mgd.TempInputFile('spanning.alignments', 'bylibrary', 'byread'),
-            '-1', mgd.TempInputFile('reads1', 'bylibrary', 'byread'),
-            '-2', mgd.TempInputFile('reads2', 'bylibrary', 'byread'),
+            '--span', mgd_spanning.as_input(),
+            '-1', mgd_reads_1.as_input(),
+            '-2', mgd_reads_2.as_input(),
             '--realignments', mgd.TempOutputFile('realignments', 'bylibrary', 'byread'),
         ),
     )
@@ -410,7 +671,7 @@ def create_destruct_fastq_workflow(
         args=(
             mgd.TempInputFile('breakpoints_2'),
             mgd.TempInputFile('realignments', 'bylibrary', 'byread'),
-            mgd.TempInputFile('score.stats', 'bylibrary'),
+            mgd_score_stats.as_input(),
             mgd.TempOutputFile('likelihoods_2', 'bylibrary', 'byread'),
             config['match_score'],
             mgd.TempInputObj('stats', 'bylibrary').prop('fragment_length_mean'),
@@ -419,27 +680,14 @@ def create_destruct_fastq_workflow(
     )
 
     workflow.transform(
-        name='merge_likelihoods_1',
-        axes=('bylibrary',),
+        name='merge_likelihoods',
         ctx=lowmem,
-        func='destruct.tasks.merge_sorted_files_by_line',
+        func='destruct.tasks.merge_sorted_files_by_key',
         args=(
             mgd.TempInputFile('likelihoods_2', 'bylibrary', 'byread'),
-            mgd.TempOutputFile('likelihoods_2', 'bylibrary'),
-            mgd.TempSpace('merge_likelihoods_1_temp', 'bylibrary'),
-            '1',
-        ),
-    )
-
-    workflow.transform(
-        name='merge_likelihoods_2',
-        ctx=lowmem,
-        func='destruct.tasks.merge_sorted_files_by_line',
-        args=(
-            mgd.TempInputFile('likelihoods_2', 'bylibrary'),
             mgd.TempOutputFile('likelihoods_2'),
-            mgd.TempSpace('merge_likelihoods_2_temp'),
-            '1',
+            mgd.TempSpace('merge_likelihoods_temp'),
+            4,
         ),
     )
 
@@ -457,12 +705,13 @@ def create_destruct_fastq_workflow(
 
     workflow.commandline(
         name='setcover',
-        ctx=medmem,
+        ctx=dict(medmem, ncpus=config['setcover_threads']),
         args=(
             'destruct_setcover',
             '-c', mgd.TempInputFile('clusters'),
             '-w', mgd.TempInputFile('cluster_weights'),
             '-a', mgd.TempOutputFile('clusters_setcover'),
+            '--threads', config['setcover_threads'],
         ),
     )
 
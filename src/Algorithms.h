@@ -10,7 +10,11 @@
 
 #include "BinaryMinHeap.h"
 
+#include <algorithm>
+#include <functional>
+#include <queue>
 #include <vector>
+#include <stdint.h>
 #include <boost/unordered_map.hpp>
 #include <boost/unordered_set.hpp>
 
@@ -105,4 +109,160 @@ void AssignInOrder(const vector<unordered_set<TElemType> >& sets, const vector<i
 	}
 }
 
+// Greedy weighted set cover of dense element ids, with sets given as offsets
+// into an array of elements.  Gains are evaluated lazily, a popped set whose
+// cost per uncovered element is stale is pushed again with its current cost.
+// Of the sets with the minimum current cost, the set with the lowest index is
+// selected, as stale costs are lower bounds and the heap orders equal costs by
+// index.  Each element is assigned to the first selected set containing it, or
+// -1 if in no set.
+inline void LazySetCover(const vector<uint32_t>& setOffsets, const vector<uint32_t>& setElements, int numElements,
+                         const vector<double>& weights, vector<int>& solution, vector<int>& elementAssignments)
+{
+	int numSets = (int)setOffsets.size() - 1;
+
+	// Sets containing each element
+	vector<uint32_t> elementOffsets(numElements + 1, 0);
+	for (vector<uint32_t>::const_iterator elementIter = setElements.begin(); elementIter != setElements.end(); elementIter++)
+	{
+		elementOffsets[*elementIter + 1]++;
+	}
+	for (int elementIdx = 0; elementIdx < numElements; elementIdx++)
+	{
+		elementOffsets[elementIdx + 1] += elementOffsets[elementIdx];
+	}
+
+	vector<uint32_t> elementSets(setElements.size());
+	vector<uint32_t> elementFill(elementOffsets.begin(), elementOffsets.end() - 1);
+	for (int setIdx = 0; setIdx < numSets; setIdx++)
+	{
+		for (uint32_t offset = setOffsets[setIdx]; offset < setOffsets[setIdx + 1]; offset++)
+		{
+			elementSets[elementFill[setElements[offset]]++] = setIdx;
+		}
+	}
+
+	vector<uint32_t> uncovered(numSets);
+
+	typedef pair<double,int> CostSet;
+	priority_queue<CostSet, vector<CostSet>, greater<CostSet> > costHeap;
+
+	for (int setIdx = 0; setIdx < numSets; setIdx++)
+	{
+		uncovered[setIdx] = setOffsets[setIdx + 1] - setOffsets[setIdx];
+
+		if (uncovered[setIdx] > 0)
+		{
+			costHeap.push(CostSet(weights[setIdx] / (double)uncovered[setIdx], setIdx));
+		}
+	}
+
+	elementAssignments = vector<int>(numElements, -1);
+
+	while (!costHeap.empty())
+	{
+		CostSet top = costHeap.top();
+		costHeap.pop();
+
+		int setIdx = top.second;
+
+		if (uncovered[setIdx] == 0)
+		{
+			continue;
+		}
+
+		// Costs only increase as elements are covered, so a current cost is minimal
+		double cost = weights[setIdx] / (double)uncovered[setIdx];
+		if (cost > top.first)
+		{
+			costHeap.push(CostSet(cost, setIdx));
+			continue;
+		}
+
+		solution.push_back(setIdx);
+
+		for (uint32_t offset = setOffsets[setIdx]; offset < setOffsets[setIdx + 1]; offset++)
+		{
+			uint32_t elementIdx = setElements[offset];
+
+			if (elementAssignments[elementIdx] >= 0)
+			{
+				continue;
+			}
+
+			elementAssignments[elementIdx] = setIdx;
+
+			for (uint32_t elementOffset = elementOffsets[elementIdx]; elementOffset < elementOffsets[elementIdx + 1]; elementOffset++)
+			{
+				DebugCheck(uncovered[elementSets[elementOffset]] > 0);
+				uncovered[elementSets[elementOffset]]--;
+			}
+		}
+	}
+}
+
+// Connected components of sets sharing elements, numbered in order of their first set,
+// sets without elements are assigned -1
+inline int SetCoverComponents(const vector<uint32_t>& setOffsets, const vector<uint32_t>& setElements, int numElements,
+                              vector<int>& setComponents)
+{
+	int numSets = (int)setOffsets.size() - 1;
+
+	// Union find over elements, joining the elements of each set
+	vector<uint32_t> parent(numElements);
+	for (int elementIdx = 0; elementIdx < numElements; elementIdx++)
+	{
+		parent[elementIdx] = elementIdx;
+	}
+
+	for (int setIdx = 0; setIdx < numSets; setIdx++)
+	{
+		for (uint32_t offset = setOffsets[setIdx]; offset < setOffsets[setIdx + 1]; offset++)
+		{
+			uint32_t root1 = setElements[setOffsets[setIdx]];
+			while (parent[root1] != root1)
+			{
+				parent[root1] = parent[parent[root1]];
+				root1 = parent[root1];
+			}
+
+			uint32_t root2 = setElements[offset];
+			while (parent[root2] != root2)
+			{
+				parent[root2] = parent[parent[root2]];
+				root2 = parent[root2];
+			}
+
+			parent[max(root1, root2)] = min(root1, root2);
+		}
+	}
+
+	vector<int> rootComponents(numElements, -1);
+	int numComponents = 0;
+
+	setComponents = vector<int>(numSets, -1);
+	for (int setIdx = 0; setIdx < numSets; setIdx++)
+	{
+		if (setOffsets[setIdx] == setOffsets[setIdx + 1])
+		{
+			continue;
+		}
+
+		uint32_t root = setElements[setOffsets[setIdx]];
+		while (parent[root] != root)
+		{
+			root = parent[root];
+		}
+
+		if (rootComponents[root] < 0)
+		{
+			rootComponents[root] = numComponents++;
+		}
+
+		setComponents[setIdx] = rootComponents[root];
+	}
+
+	return numComponents;
+}
+
 #endif
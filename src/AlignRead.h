@@ -12,14 +12,19 @@
 
 #include <iostream>
 #include <string>
+#include <boost/shared_ptr.hpp>
 
 using namespace boost;
 using namespace std;
 
 
+// Read sequences prepared for alignment, copies share the prepared
+// sequences but select their current read independently
 class PreppedReads
 {
 public:
+	PreppedReads() : mStorage(new ReadStorage()) {}
+	
 	void Prep(FastqReadStream& readSeqsStream)
 	{
 		RawRead rawRead;
@@ -29,40 +34,43 @@ public:
 			readID.fragmentIndex = SAFEPARSE(int, rawRead.fragment);
 			readID.readEnd = rawRead.readEnd;
 			
-			mReadSequences += string(16,'X');
+			mStorage->sequences += string(16,'X');
 			
 			string readSeqPlus = rawRead.sequence;
 			reverse(readSeqPlus.begin(), readSeqPlus.end());
 			
-			mReadSeqInfo[readID].start[PlusStrand] = mReadSequences.size();
-			mReadSequences += readSeqPlus;
-			mReadSeqInfo[readID].end[PlusStrand] = mReadSequences.size();
+			mStorage->seqInfo[readID].start[PlusStrand] = mStorage->sequences.size();
+			mStorage->sequences += readSeqPlus;
+			mStorage->seqInfo[readID].end[PlusStrand] = mStorage->sequences.size();
 			
-			mReadSequences += string(16,'X');
+			mStorage->sequences += string(16,'X');
 			
 			string readSeqMinus = rawRead.sequence;
 			ReverseComplement(readSeqMinus);
 			reverse(readSeqMinus.begin(), readSeqMinus.end());
 			
-			mReadSeqInfo[readID].start[MinusStrand] = mReadSequences.size();
-			mReadSequences += readSeqMinus;
-			mReadSeqInfo[readID].end[MinusStrand] = mReadSequences.size();
+			mStorage->seqInfo[readID].start[MinusStrand] = mStorage->sequences.size();
+			mStorage->sequences += readSeqMinus;
+			mStorage->seqInfo[readID].end[MinusStrand] = mStorage->sequences.size();
 		}
 		
-		mReadSequences += string(16,'X');
+		mStorage->sequences += string(16,'X');
 	}
 	
 	void SetCurrentRead(int fragmentIndex)
 	{
+		// Const access, the sequences are shared between threads
+		const string& sequences = mStorage->sequences;
+		
 		for (int readEnd = 0; readEnd <= 1; readEnd++)
 		{
 			ReadID readID;
 			readID.fragmentIndex = fragmentIndex;
 			readID.readEnd = readEnd;
 			
-			unordered_map<ReadID,ReadSeqInfo>::const_iterator infoIter = mReadSeqInfo.find(readID);
+			unordered_map<ReadID,ReadSeqInfo>::const_iterator infoIter = mStorage->seqInfo.find(readID);
 			
-			if (infoIter == mReadSeqInfo.end())
+			if (infoIter == mStorage->seqInfo.end())
 			{
 				cerr << "Error: Could not find sequence for read " << readID.fragmentIndex << " end " << readID.readEnd << endl;
 				exit(1);
@@ -70,15 +78,15 @@ public:
 			
 			for (int strand = 0; strand <= 1; strand++)
 			{
-				mCurrentSeqStartPtr[strand][readEnd] = &mReadSequences[infoIter->second.start[strand]];
-				mCurrentSeqEndPtr[strand][readEnd] = &mReadSequences[infoIter->second.end[strand]];
+				mCurrentSeqStartPtr[strand][readEnd] = &sequences[infoIter->second.start[strand]];
+				mCurrentSeqEndPtr[strand][readEnd] = &sequences[infoIter->second.end[strand]];
 			}
 			
-			mCurrentSeq5PrimeSeed16Ptr[PlusStrand][readEnd] = &mReadSequences[infoIter->second.end[PlusStrand] - 16];
-			mCurrentSeq5PrimeSeed16Ptr[MinusStrand][readEnd] = &mReadSequences[infoIter->second.start[MinusStrand]];
+			mCurrentSeq5PrimeSeed16Ptr[PlusStrand][readEnd] = &sequences[infoIter->second.end[PlusStrand] - 16];
+			mCurrentSeq5PrimeSeed16Ptr[MinusStrand][readEnd] = &sequences[infoIter->second.start[MinusStrand]];
 			
-			mCurrentSeq3PrimeSeed16Ptr[PlusStrand][readEnd] = &mReadSequences[infoIter->second.start[PlusStrand]];
-			mCurrentSeq3PrimeSeed16Ptr[MinusStrand][readEnd] = &mReadSequences[infoIter->second.end[MinusStrand] - 16];
+			mCurrentSeq3PrimeSeed16Ptr[PlusStrand][readEnd] = &sequences[infoIter->second.start[PlusStrand]];
+			mCurrentSeq3PrimeSeed16Ptr[MinusStrand][readEnd] = &sequences[infoIter->second.end[MinusStrand] - 16];
 		}
 	}
 	
@@ -129,26 +137,36 @@ private:
 		size_t end[2];
 	};
 	
-	string mReadSequences;
-	unordered_map<ReadID,ReadSeqInfo> mReadSeqInfo;
+	struct ReadStorage
+	{
+		string sequences;
+		unordered_map<ReadID,ReadSeqInfo> seqInfo;
+	};
+	
+	boost::shared_ptr<ReadStorage> mStorage;
 	const char* mCurrentSeqStartPtr[2][2];
 	const char* mCurrentSeqEndPtr[2][2];
 	const char* mCurrentSeq5PrimeSeed16Ptr[2][2];
 	const char* mCurrentSeq3PrimeSeed16Ptr[2][2];
 };
 
+// Reference positions read by the sse aligners beyond the aligned sequence
+const int cReferenceWindowSlack = 32;
+
 int AlignSelfScoreSSE(SimpleAligner& aligner, const RawAlignment& alignment, const Sequences& references, const PreppedReads& reads)
 {
+	string refBuffer;
+	
 	int score;
 	
 	if (alignment.strand == PlusStrand)
 	{
-		const char* refPtr = references.Get(alignment.reference, alignment.region.start);
+		const char* refPtr = references.GetWindow(alignment.reference, alignment.region.start, reads.ReadLength(alignment.readEnd) + cReferenceWindowSlack, refBuffer);
 		score = aligner.AlignBandedSSE2BW7ScoreFwd(refPtr, reads.StartPtr(alignment.readEnd, PlusStrand), reads.EndPtr(alignment.readEnd, PlusStrand));
 	}
 	else
 	{
-		const char* refPtr = references.Get(alignment.reference, alignment.region.end);
+		const char* refPtr = references.GetWindow(alignment.reference, alignment.region.end, reads.ReadLength(alignment.readEnd) + cReferenceWindowSlack, refBuffer);
 		score = aligner.AlignBandedSSE2BW7ScoreRev(refPtr, reads.StartPtr(alignment.readEnd, MinusStrand), reads.EndPtr(alignment.readEnd, MinusStrand));
 	}
 	
@@ -252,20 +270,22 @@ private:
 
 AlignInfo AlignSelfFullSSE(SimpleAligner& aligner, const RawAlignment& alignment, const Sequences& references, const PreppedReads& reads)
 {
+	string refBuffer;
+	
 	AlignInfo alignInfo;
 	
 	if (alignment.strand == PlusStrand)
 	{
 		alignInfo = AlignInfo(alignment.region.start, alignment.strand, reads.ReadLength(alignment.readEnd));
 		
-		const char* refPtr = references.Get(alignment.reference, alignment.region.start);
+		const char* refPtr = references.GetWindow(alignment.reference, alignment.region.start, reads.ReadLength(alignment.readEnd) + cReferenceWindowSlack, refBuffer);
 		aligner.AlignBandedSSE2BW7ScoreFwd(refPtr, reads.StartPtr(alignment.readEnd, PlusStrand), reads.EndPtr(alignment.readEnd, PlusStrand), &alignInfo.seqScores.front(), &alignInfo.refLengths.front());
 	}
 	else
 	{
 		alignInfo = AlignInfo(alignment.region.end, alignment.strand, reads.ReadLength(alignment.readEnd));
 		
-		const char* refPtr = references.Get(alignment.reference, alignment.region.end);
+		const char* refPtr = references.GetWindow(alignment.reference, alignment.region.end, reads.ReadLength(alignment.readEnd) + cReferenceWindowSlack, refBuffer);
 		aligner.AlignBandedSSE2BW7ScoreRev(refPtr, reads.StartPtr(alignment.readEnd, MinusStrand), reads.EndPtr(alignment.readEnd, MinusStrand), &alignInfo.seqScores.front(), &alignInfo.refLengths.front());
 	}
 	
@@ -274,11 +294,13 @@ AlignInfo AlignSelfFullSSE(SimpleAligner& aligner, const RawAlignment& alignment
 
 void AlignMate3PrimeSeed16SSE(SimpleAligner& aligner, const RawAlignment& alignment, const Sequences& references, const PreppedReads& reads, int searchLength, int& score, int& refPosition)
 {
+	string refBuffer;
+	
 	int mateEnd = OtherReadEnd(alignment.readEnd);
 	
 	if (alignment.strand == PlusStrand)
 	{
-		const char* refPtr = references.Get(alignment.reference, alignment.region.start);
+		const char* refPtr = references.GetWindow(alignment.reference, alignment.region.start, searchLength + cReferenceWindowSlack, refBuffer);
 		
 		vector<short int> refLengthScores(searchLength + 1 + 32);
 		aligner.Align16baseSSE2Rev(refPtr, refPtr + searchLength, reads.StartPtr3PrimeSeed16(mateEnd, MinusStrand), &refLengthScores.front());
@@ -290,7 +312,7 @@ void AlignMate3PrimeSeed16SSE(SimpleAligner& aligner, const RawAlignment& alignm
 	}
 	else
 	{
-		const char* refPtr = references.Get(alignment.reference, alignment.region.end);
+		const char* refPtr = references.GetWindow(alignment.reference, alignment.region.end, searchLength + cReferenceWindowSlack, refBuffer);
 		
 		vector<short int> refLengthScores(searchLength + 1 + 32);
 		aligner.Align16baseSSE2Fwd(refPtr - searchLength + 1, refPtr + 1, reads.StartPtr3PrimeSeed16(mateEnd, PlusStrand), &refLengthScores.front());
@@ -304,6 +326,8 @@ void AlignMate3PrimeSeed16SSE(SimpleAligner& aligner, const RawAlignment& alignm
 
 void AlignMate3PrimeSeed16SSE(SimpleAligner& aligner, const RawAlignment& alignment, const Sequences& references, const PreppedReads& reads, int minFragmentLength, int maxFragmentLength, int& score, int& refPosition)
 {
+	string refBuffer;
+	
 	int mateEnd = OtherReadEnd(alignment.readEnd);
 	
 	int searchLength = maxFragmentLength - minFragmentLength + 16;
@@ -312,7 +336,7 @@ void AlignMate3PrimeSeed16SSE(SimpleAligner& aligner, const RawAlignment& alignm
 	{
 		int searchStart = alignment.region.start + minFragmentLength - reads.ReadLength(mateEnd);
 		
-		const char* refPtr = references.Get(alignment.reference, searchStart);
+		const char* refPtr = references.GetWindow(alignment.reference, searchStart, searchLength + cReferenceWindowSlack, refBuffer);
 		
 		vector<short int> refLengthScores(searchLength + 1 + 32);
 		aligner.Align16baseSSE2Rev(refPtr, refPtr + searchLength, reads.StartPtr3PrimeSeed16(mateEnd, MinusStrand), &refLengthScores.front());
@@ -326,7 +350,7 @@ void AlignMate3PrimeSeed16SSE(SimpleAligner& aligner, const RawAlignment& alignm
 	{
 		int searchEnd = alignment.region.end - minFragmentLength + reads.ReadLength(mateEnd);
 		
-		const char* refPtr = references.Get(alignment.reference, searchEnd);
+		const char* refPtr = references.GetWindow(alignment.reference, searchEnd, searchLength + cReferenceWindowSlack, refBuffer);
 		
 		vector<short int> refLengthScores(searchLength + 1 + 32);
 		aligner.Align16baseSSE2Fwd(refPtr - searchLength + 1, refPtr + 1, reads.StartPtr3PrimeSeed16(mateEnd, PlusStrand), &refLengthScores.front());
@@ -340,11 +364,13 @@ void AlignMate3PrimeSeed16SSE(SimpleAligner& aligner, const RawAlignment& alignm
 
 AlignInfo AlignFwdMateFullSSE(SimpleAligner& aligner, const RawAlignment& alignment, const Sequences& references, const PreppedReads& reads, int refPosition)
 {
+	string refBuffer;
+	
 	int mateEnd = OtherReadEnd(alignment.readEnd);
 	
 	AlignInfo alignInfo(refPosition, alignment.strand, reads.ReadLength(mateEnd));
 	
-	const char* refPtr = references.Get(alignment.reference, refPosition);
+	const char* refPtr = references.GetWindow(alignment.reference, refPosition, reads.ReadLength(mateEnd) + cReferenceWindowSlack, refBuffer);
 	
 	if (alignment.strand == PlusStrand)
 	{
@@ -360,11 +386,13 @@ AlignInfo AlignFwdMateFullSSE(SimpleAligner& aligner, const RawAlignment& alignm
 
 AlignInfo AlignRevMateFullSSE(SimpleAligner& aligner, const RawAlignment& alignment, const Sequences& references, const PreppedReads& reads, int refPosition)
 {
+	string refBuffer;
+	
 	int mateEnd = OtherReadEnd(alignment.readEnd);
 	
 	AlignInfo alignInfo(refPosition, OtherStrand(alignment.strand), reads.ReadLength(mateEnd));
 	
-	const char* refPtr = references.Get(alignment.reference, refPosition);
+	const char* refPtr = references.GetWindow(alignment.reference, refPosition, reads.ReadLength(mateEnd) + cReferenceWindowSlack, refBuffer);
 	
 	if (alignment.strand == PlusStrand)
 	{
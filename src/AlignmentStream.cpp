@@ -6,7 +6,10 @@
 #include "AlignmentStream.h"
 
 #include <fstream>
+#include <cstring>
+#include <stdint.h>
 #include <boost/algorithm/string.hpp>
+#include <boost/lexical_cast.hpp>
 
 using namespace boost;
 using namespace std;
@@ -212,6 +215,229 @@ bool CompactAlignmentStream::GetNextAlignment(RawAlignment& alignment)
 
 
 
+namespace
+{
+	const char kBinaryAlignmentMagic[] = {'D', 'B', 'A', '1'};
+	const char kReferenceRecord = 'R';
+	const char kAlignmentRecord = 'A';
+	const size_t kAlignmentRecordSize = 16;
+	const size_t kBinaryBufferSize = 1 << 20;
+	
+	template <typename TValue>
+	inline void AppendValue(string& buffer, TValue value)
+	{
+		buffer.append((const char*)&value, sizeof(TValue));
+	}
+	
+	template <typename TValue>
+	inline TValue ExtractValue(const char* data)
+	{
+		TValue value;
+		memcpy(&value, data, sizeof(TValue));
+		return value;
+	}
+}
+
+
+BinaryAlignmentStream::BinaryAlignmentStream(const string& alignFilename)
+	: mStream(0), mFileStream(0), mBuffer(kBinaryBufferSize), mPosition(0), mEnd(0), mFragmentID(-1)
+{
+	if (alignFilename == "-")
+	{
+		mStream = &cin;
+	}
+	else
+	{
+		mFileStream = new ifstream(alignFilename.c_str(), ios::in | ios::binary);
+		mStream = mFileStream;
+		
+		if (!mStream->good())
+		{
+			cerr << "Error: Unable to open alignment file " << alignFilename << endl;
+			exit(1);
+		}
+	}
+	
+	if (!FillBuffer(sizeof(kBinaryAlignmentMagic)) || memcmp(&mBuffer[0], kBinaryAlignmentMagic, sizeof(kBinaryAlignmentMagic)) != 0)
+	{
+		cerr << "Error: " << alignFilename << " is not a binary alignment stream" << endl;
+		exit(1);
+	}
+	
+	mPosition += sizeof(kBinaryAlignmentMagic);
+}
+
+BinaryAlignmentStream::~BinaryAlignmentStream()
+{
+	delete mFileStream;
+}
+
+bool BinaryAlignmentStream::GetNextAlignment(RawAlignment& alignment)
+{
+	while (FillBuffer(1))
+	{
+		char recordType = mBuffer[mPosition];
+		
+		if (recordType == kReferenceRecord)
+		{
+			if (!FillBuffer(3))
+			{
+				break;
+			}
+			
+			size_t length = ExtractValue<uint16_t>(&mBuffer[mPosition + 1]);
+			
+			if (!FillBuffer(3 + length))
+			{
+				break;
+			}
+			
+			mReferences.push_back(string(&mBuffer[mPosition + 3], length));
+			mPosition += 3 + length;
+		}
+		else if (recordType == kAlignmentRecord)
+		{
+			if (!FillBuffer(kAlignmentRecordSize))
+			{
+				break;
+			}
+			
+			const char* record = &mBuffer[mPosition];
+			int fragmentID = ExtractValue<int32_t>(record + 1);
+			int start = ExtractValue<int32_t>(record + 5);
+			int end = ExtractValue<int32_t>(record + 9);
+			size_t referenceIndex = ExtractValue<uint16_t>(record + 13);
+			unsigned char flags = record[15];
+			mPosition += kAlignmentRecordSize;
+			
+			if (referenceIndex >= mReferences.size())
+			{
+				cerr << "Error: Undefined reference in binary alignment stream" << endl;
+				exit(1);
+			}
+			
+			// Alignments of a fragment are contiguous, format the id once
+			if (fragmentID != mFragmentID)
+			{
+				mFragmentID = fragmentID;
+				mFragment = lexical_cast<string>(fragmentID);
+			}
+			
+			alignment.fragment = mFragment;
+			alignment.readEnd = flags & 1;
+			alignment.reference = mReferences[referenceIndex];
+			alignment.strand = (flags & 2) ? MinusStrand : PlusStrand;
+			alignment.region.start = start;
+			alignment.region.end = end;
+			alignment.readLength = 0;
+			alignment.alignedLength = 0;
+			alignment.score = 0;
+			alignment.alignProb = 0.0;
+			alignment.chimericProb = 0.0;
+			alignment.validProb = 0.0;
+			alignment.sequence.clear();
+			alignment.quality.clear();
+			alignment.line.clear();
+			
+			return true;
+		}
+		else
+		{
+			cerr << "Error: Invalid record in binary alignment stream" << endl;
+			exit(1);
+		}
+	}
+	
+	if (mPosition != mEnd)
+	{
+		cerr << "Error: Truncated binary alignment stream" << endl;
+		exit(1);
+	}
+	
+	return false;
+}
+
+bool BinaryAlignmentStream::FillBuffer(size_t length)
+{
+	if (mEnd - mPosition >= length)
+	{
+		return true;
+	}
+	
+	// Move the partial record to the start of the buffer and read more
+	memmove(&mBuffer[0], &mBuffer[mPosition], mEnd - mPosition);
+	mEnd -= mPosition;
+	mPosition = 0;
+	
+	while (mEnd < length && mStream->good())
+	{
+		mStream->read(&mBuffer[mEnd], mBuffer.size() - mEnd);
+		mEnd += mStream->gcount();
+	}
+	
+	return mEnd >= length;
+}
+
+
+BinaryAlignmentWriter::BinaryAlignmentWriter(ostream& stream) : mStream(stream)
+{
+	mBuffer.reserve(kBinaryBufferSize);
+	mBuffer.append(kBinaryAlignmentMagic, sizeof(kBinaryAlignmentMagic));
+}
+
+BinaryAlignmentWriter::~BinaryAlignmentWriter()
+{
+	Flush();
+}
+
+void BinaryAlignmentWriter::Write(int fragmentID, int readEnd, const string& reference, int strand, int start, int end)
+{
+	unordered_map<string,int>::const_iterator referenceIter = mReferenceIndices.find(reference);
+	
+	// Define each reference the first time it is used
+	if (referenceIter == mReferenceIndices.end())
+	{
+		if (mReferenceIndices.size() > 0xFFFF || reference.size() > 0xFFFF)
+		{
+			cerr << "Error: Too many or too long references for binary alignment stream" << endl;
+			exit(1);
+		}
+		
+		referenceIter = mReferenceIndices.insert(make_pair(reference, (int)mReferenceIndices.size())).first;
+		
+		mBuffer.push_back(kReferenceRecord);
+		AppendValue<uint16_t>(mBuffer, reference.size());
+		mBuffer.append(reference);
+	}
+	
+	mBuffer.push_back(kAlignmentRecord);
+	AppendValue<int32_t>(mBuffer, fragmentID);
+	AppendValue<int32_t>(mBuffer, start);
+	AppendValue<int32_t>(mBuffer, end);
+	AppendValue<uint16_t>(mBuffer, referenceIter->second);
+	mBuffer.push_back((char)((readEnd & 1) | ((strand == MinusStrand) ? 2 : 0)));
+	
+	if (mBuffer.size() >= kBinaryBufferSize)
+	{
+		Flush();
+	}
+}
+
+void BinaryAlignmentWriter::Flush()
+{
+	mStream.write(mBuffer.data(), mBuffer.size());
+	mStream.flush();
+	mBuffer.clear();
+	
+	if (!mStream.good())
+	{
+		cerr << "Error: Unable to write binary alignment stream" << endl;
+		exit(1);
+	}
+}
+
+
+
 FragmentAlignmentStream::FragmentAlignmentStream(AlignmentStream* alignmentStream) : mAlignmentStream(alignmentStream)
 {
 	mGood = mAlignmentStream->GetNextAlignment(mNextAlignment);
@@ -75,6 +75,46 @@ protected:
 };
 
 
+// Compact binary stream of seed alignments, retaining only the fields
+// used for realignment, as written by BinaryAlignmentWriter
+class BinaryAlignmentStream : public AlignmentStream
+{
+public:
+	BinaryAlignmentStream(const string& alignFilename);
+	~BinaryAlignmentStream();
+	
+	bool GetNextAlignment(RawAlignment& alignment);
+	
+protected:
+	bool FillBuffer(size_t length);
+	
+	istream* mStream;
+	istream* mFileStream;
+	vector<char> mBuffer;
+	size_t mPosition;
+	size_t mEnd;
+	vector<string> mReferences;
+	int mFragmentID;
+	string mFragment;
+};
+
+
+class BinaryAlignmentWriter
+{
+public:
+	BinaryAlignmentWriter(ostream& stream);
+	~BinaryAlignmentWriter();
+	
+	void Write(int fragmentID, int readEnd, const string& reference, int strand, int start, int end);
+	void Flush();
+	
+protected:
+	ostream& mStream;
+	string mBuffer;
+	unordered_map<string,int> mReferenceIndices;
+};
+
+
 class FragmentAlignmentStream
 {
 public:
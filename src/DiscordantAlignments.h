@@ -107,9 +107,10 @@ public:
 	: mFragmentMeans(fragmentMeans), mFragmentStdDevs(fragmentStdDevs), mMaxFragmentLength(maxFragmentLength), mFragmentCount(0)
 	{}
 
-	void SetIncludedChromosomePair(const string& chromosome1, const string& chromosome2)
+	void AddIncludedChromosomePair(const string& chromosome1, const string& chromosome2)
 	{
-		mIncludedChromosomePair = pair<string,string>(chromosome1, chromosome2);
+		mIncludedChromosomePairs.insert(pair<string,string>(chromosome1, chromosome2));
+		mIncludedChromosomePairs.insert(pair<string,string>(chromosome2, chromosome1));
 	}
 
 	void SetExcludedChromosomePairs(const vector<string>& chromosomes)
@@ -119,10 +120,9 @@ public:
 
 	bool IsExcluded(const string& chromosome1, const string& chromosome2) const
 	{
-		if (!mIncludedChromosomePair.first.empty() && !mIncludedChromosomePair.second.empty())
+		if (!mIncludedChromosomePairs.empty())
 		{
-			if ((chromosome1 == mIncludedChromosomePair.first && chromosome2 == mIncludedChromosomePair.second) || 
-				(chromosome2 == mIncludedChromosomePair.first && chromosome1 == mIncludedChromosomePair.second))
+			if (mIncludedChromosomePairs.find(pair<string,string>(chromosome1, chromosome2)) != mIncludedChromosomePairs.end())
 			{
 				return false;
 			}
@@ -236,10 +236,18 @@ public:
 			uint32_t chrStrIdx1 = mChrStrIndex.Index(alignment1.chromosome, alignment1.strand);
 			uint32_t chrStrIdx2 = mChrStrIndex.Index(alignment2.chromosome, alignment2.strand);
 
+			// Order by chromosome and strand names rather than index so that the
+			// orientation of a pair does not depend on which alignments were read first
+			int chrStrCompare = alignment1.chromosome.compare(alignment2.chromosome);
+			if (chrStrCompare == 0)
+			{
+				chrStrCompare = alignment1.strand.compare(alignment2.strand);
+			}
+
 			pair<uint32_t,uint32_t> chrStrIdxPair;
 			pair<size_t,size_t> alignmentIdxPair;
-			if ((chrStrIdx1 < chrStrIdx2) || 
-				((chrStrIdx1 == chrStrIdx2) && alignment1.position < alignment2.position))
+			if ((chrStrCompare < 0) || 
+				((chrStrCompare == 0) && alignment1.position < alignment2.position))
 			{
 				chrStrIdxPair = pair<uint32_t,uint32_t>(chrStrIdx1, chrStrIdx2);
 				alignmentIdxPair = pair<size_t,size_t>(idx1 + idxOffset, idx2 + idxOffset);
@@ -376,7 +384,7 @@ private:
 
 	unordered_map<pair<uint32_t,uint32_t>,vector<pair<size_t,size_t> > > mPaired;
 
-	pair<string,string> mIncludedChromosomePair;
+	unordered_set<pair<string,string> > mIncludedChromosomePairs;
 	unordered_set<string> mExcludedChromosomePairs;
 };
 
@@ -0,0 +1,435 @@
+/*
+ *  DiscordantReads.h
+ *
+ *  Shared by destruct_bamdiscordantfastq and destruct_mergediscordantfastq
+ *
+ */
+
+#ifndef DISCORDANTREADS_H_
+#define DISCORDANTREADS_H_
+
+#include "Common.h"
+#include "ThreadPool.h"
+#include "ParallelGzip.h"
+#include "SpillFile.h"
+
+#include <fstream>
+#include <iostream>
+#include <sstream>
+#include <string>
+#include <boost/algorithm/string.hpp>
+#include <boost/iostreams/filtering_stream.hpp>
+#include <boost/iostreams/filtering_streambuf.hpp>
+#include <boost/iostreams/filter/gzip.hpp>
+
+using namespace boost;
+using namespace std;
+
+
+// Store minimal read info
+struct ReadInfo
+{
+	ReadInfo() : IsFailedQC(false) {}
+
+	string Name;
+	string Sequence;
+	string Qualities;
+	bool IsFailedQC;
+
+	// Used for sorting by read name
+	bool operator<(const ReadInfo& other) const
+	{
+		return Name < other.Name;
+	}
+
+	// Serialization for on disk sort
+	void Encode(RecordEncoder& writer) const
+	{
+		writer.WriteString(Name);
+		writer.WriteSequence(Sequence);
+		writer.WriteQualities(Qualities);
+		writer.WriteBool(IsFailedQC);
+	}
+
+	void Decode(RecordDecoder& reader)
+	{
+		reader.ReadString(Name);
+		reader.ReadSequence(Sequence);
+		reader.ReadQualities(Qualities);
+		IsFailedQC = reader.ReadBool();
+	}
+
+	size_t MemorySize() const
+	{
+		return sizeof(ReadInfo) + Name.capacity() + Sequence.capacity() + Qualities.capacity();
+	}
+};
+
+// Read from a region shard with a mate outside the shard,
+// paired with its mate when shards are merged
+struct OrphanRead
+{
+	OrphanRead() : ReadEnd(0), IsProperPair(false), IsConcordant(false), FragmentLength(0) {}
+
+	ReadInfo Read;
+	int ReadEnd;
+	bool IsProperPair;
+	bool IsConcordant;
+	int FragmentLength;
+
+	// Used for sorting by read name
+	bool operator<(const OrphanRead& other) const
+	{
+		return Read.Name < other.Read.Name;
+	}
+
+	// Serialization for on disk sort
+	void Encode(RecordEncoder& writer) const
+	{
+		Read.Encode(writer);
+		writer.WriteInt(ReadEnd);
+		writer.WriteBool(IsProperPair);
+		writer.WriteBool(IsConcordant);
+		writer.WriteInt(FragmentLength);
+	}
+
+	void Decode(RecordDecoder& reader)
+	{
+		Read.Decode(reader);
+		ReadEnd = reader.ReadInt();
+		IsProperPair = reader.ReadBool();
+		IsConcordant = reader.ReadBool();
+		FragmentLength = reader.ReadInt();
+	}
+
+	size_t MemorySize() const
+	{
+		return sizeof(OrphanRead) - sizeof(ReadInfo) + Read.MemorySize();
+	}
+};
+
+inline ostream& operator<<(ostream& stream, const OrphanRead& orphan)
+{
+	stream << orphan.Read.Name << "\t";
+	stream << orphan.ReadEnd << "\t";
+	stream << orphan.IsProperPair << "\t";
+	stream << orphan.IsConcordant << "\t";
+	stream << orphan.Read.IsFailedQC << "\t";
+	stream << orphan.FragmentLength << "\t";
+	stream << orphan.Read.Sequence << "\t";
+	stream << orphan.Read.Qualities << endl;
+	return stream;
+}
+
+inline bool ReadOrphan(istream& stream, OrphanRead& orphan)
+{
+	StringVec fields;
+	if (!ReadTSV(stream, fields))
+	{
+		return false;
+	}
+
+	if (fields.size() < 8)
+	{
+		cerr << "Error: Format error for orphan read " << fields[0] << endl;
+		exit(1);
+	}
+
+	orphan.Read.Name = fields[0];
+	orphan.ReadEnd = SAFEPARSE(int, fields[1]);
+	orphan.IsProperPair = (fields[2] == "1");
+	orphan.IsConcordant = (fields[3] == "1");
+	orphan.Read.IsFailedQC = (fields[4] == "1");
+	orphan.FragmentLength = SAFEPARSE(int, fields[5]);
+	orphan.Read.Sequence = fields[6];
+	orphan.Read.Qualities = fields[7];
+
+	return true;
+}
+
+template<typename T>
+struct ReservoirSampler
+{
+	ReservoirSampler(int numSamples) : mNumSamples(numSamples), mNumValues(0) {}
+
+	void AddSample(const T& value)
+	{
+		T* sample = NextSample();
+
+		if (sample != 0)
+		{
+			*sample = value;
+		}
+	}
+
+	// Count a value, returning the slot the value should be stored in,
+	// or null if it is not sampled, to avoid creating unsampled values
+	T* NextSample()
+	{
+		mNumValues++;
+
+		if (mSamples.size() < mNumSamples)
+		{
+			mSamples.push_back(T());
+			return &mSamples.back();
+		}
+
+		long sampleIndex = mRNG.Next((long)0, mNumValues - 1);
+		if (sampleIndex < mNumSamples)
+		{
+			return &mSamples[sampleIndex];
+		}
+
+		return 0;
+	}
+
+	int mNumSamples;
+	long mNumValues;
+	vector<T> mSamples;
+	RandomNumberGenerator mRNG;
+};
+
+// Read counts and length histograms
+struct ConcordantStats
+{
+	ConcordantStats() : ConcordantReadCount(0), DiscordantReadCount(0), SampledReadCount(0) {}
+
+	void AddReadLength(int length)
+	{
+		ReadLengthHist.insert(make_pair(length, 0)).first->second++;
+	}
+
+	void AddFragmentLength(int length)
+	{
+		FragmentLengthHist.insert(make_pair(length, 0)).first->second++;
+	}
+
+	// Accumulate stats from a stats file
+	void Read(const string& statsFilename)
+	{
+		ifstream statsFile(statsFilename.c_str());
+		CheckFile(statsFile, statsFilename);
+
+		StringVec fields;
+		int lineNumber = 0;
+		while (ReadTSV(statsFile, fields))
+		{
+			lineNumber++;
+
+			if (lineNumber == 1 || fields.size() < 3)
+			{
+				continue;
+			}
+
+			const string& type = fields[0];
+			const string& key = fields[1];
+			long value = SAFEPARSEFIELD(long, fields[2], statsFilename, lineNumber);
+
+			if (type == "read_count" && key == "concordant")
+			{
+				ConcordantReadCount += value;
+			}
+			else if (type == "read_count" && key == "discordant")
+			{
+				DiscordantReadCount += value;
+			}
+			else if (type == "sample_count")
+			{
+				SampledReadCount += value;
+			}
+			else if (type == "read_length")
+			{
+				ReadLengthHist[SAFEPARSEFIELD(int, key, statsFilename, lineNumber)] += value;
+			}
+			else if (type == "fragment_length")
+			{
+				FragmentLengthHist[SAFEPARSEFIELD(int, key, statsFilename, lineNumber)] += value;
+			}
+		}
+	}
+
+	void Write(const string& statsFilename, bool writeSampleCount) const
+	{
+		ofstream statsFile(statsFilename.c_str());
+		CheckFile(statsFile, statsFilename);
+		statsFile << "type\tkey\tvalue\n";
+
+		// Output read counts
+		statsFile << "read_count\ttotal\t" << ConcordantReadCount + DiscordantReadCount << endl;
+		statsFile << "read_count\tconcordant\t" << ConcordantReadCount << endl;
+		statsFile << "read_count\tdiscordant\t" << DiscordantReadCount << endl;
+
+		// Output number of pairs the reservoir sample was drawn from
+		if (writeSampleCount)
+		{
+			statsFile << "sample_count\ttotal\t" << SampledReadCount << endl;
+		}
+
+		// Output read lengths
+		for (unordered_map<int,long>::const_iterator iter = ReadLengthHist.begin(); iter != ReadLengthHist.end(); iter++)
+		{
+			statsFile << "read_length\t" << iter->first << "\t" << iter->second << endl;
+		}
+
+		// Output fragment lengths
+		for (unordered_map<int,long>::const_iterator iter = FragmentLengthHist.begin(); iter != FragmentLengthHist.end(); iter++)
+		{
+			statsFile << "fragment_length\t" << iter->first << "\t" << iter->second << endl;
+		}
+	}
+
+	long ConcordantReadCount;
+	long DiscordantReadCount;
+	long SampledReadCount;
+	unordered_map<int,long> ReadLengthHist;
+	unordered_map<int,long> FragmentLengthHist;
+};
+
+const char empty_gz[] = {
+	0x1f,
+	(char)0x8b,
+	0x8,
+	0x8,
+	0x34,
+	0x1d,
+	0x1e,
+	0x5e,
+	0x0,
+	0x3,
+	0x61,
+	0x73,
+	0x64,
+	0x66,
+	0x0,
+	0x3,
+	0x0,
+	0x0,
+	0x0,
+	0x0,
+	0x0,
+	0x0,
+	0x0,
+	0x0,
+	0x0,
+};
+const unsigned int empty_gz_len = 25;
+
+inline void write_empty_gz(ofstream& file)
+{
+	file.write(empty_gz, empty_gz_len);
+}
+
+// Paired gzipped fastq output, optionally compressed on a thread pool
+class PairedFastqWriter
+{
+public:
+	PairedFastqWriter(const string& fastq1Filename, const string& fastq2Filename, ThreadPool& threadPool)
+		: mCount(0)
+	{
+		mFilenames[0] = fastq1Filename;
+		mFilenames[1] = fastq2Filename;
+
+		for (int readEnd = 0; readEnd <= 1; readEnd++)
+		{
+			mFiles[readEnd].open(mFilenames[readEnd].c_str(), std::ios_base::out | std::ios_base::binary);
+			CheckFile(mFiles[readEnd], mFilenames[readEnd]);
+
+			if (threadPool.NumThreads() > 0)
+			{
+				mStreams[readEnd].push(ParallelGzipCompressor(mFiles[readEnd], threadPool));
+			}
+			else
+			{
+				mStreams[readEnd].push(iostreams::gzip_compressor());
+				mStreams[readEnd].push(mFiles[readEnd]);
+			}
+		}
+	}
+
+	void Write(const string& fragment, const ReadInfo& read1, const ReadInfo& read2)
+	{
+		mStreams[0] << "@" << fragment << "/1" << endl;
+		mStreams[0] << read1.Sequence << endl;
+		mStreams[0] << "+" << read1.Name << endl;
+		mStreams[0] << read1.Qualities << endl;
+
+		mStreams[1] << "@" << fragment << "/2" << endl;
+		mStreams[1] << read2.Sequence << endl;
+		mStreams[1] << "+" << read2.Name << endl;
+		mStreams[1] << read2.Qualities << endl;
+
+		mCount++;
+	}
+
+	// Flush and close, ensuring we have valid output on empty input
+	void Close()
+	{
+		for (int readEnd = 0; readEnd <= 1; readEnd++)
+		{
+			mStreams[readEnd].flush();
+			mStreams[readEnd].reset();
+
+			mFiles[readEnd].close();
+
+			if (mCount == 0)
+			{
+				ofstream emptyFile(mFilenames[readEnd].c_str(), std::ios_base::out | std::ios_base::binary);
+				CheckFile(emptyFile, mFilenames[readEnd]);
+				write_empty_gz(emptyFile);
+			}
+		}
+	}
+
+	long Count() const
+	{
+		return mCount;
+	}
+
+private:
+	string mFilenames[2];
+	ofstream mFiles[2];
+	iostreams::filtering_ostream mStreams[2];
+	long mCount;
+};
+
+// Gzipped fastq input, one record at a time
+class GzipFastqReader
+{
+public:
+	explicit GzipFastqReader(const string& fastqFilename)
+		: mFile(fastqFilename.c_str(), std::ios_base::in | std::ios_base::binary),
+		  mStream(&mStreamBuf)
+	{
+		CheckFile(mFile, fastqFilename);
+
+		mStreamBuf.push(iostreams::gzip_decompressor());
+		mStreamBuf.push(mFile);
+	}
+
+	// Read name without the leading @ and trailing /1 or /2, and the read info
+	bool Next(string& fragment, ReadInfo& read)
+	{
+		string lines[4];
+		for (int lineIndex = 0; lineIndex < 4; lineIndex++)
+		{
+			if (!getline(mStream, lines[lineIndex]))
+			{
+				return false;
+			}
+		}
+
+		fragment = lines[0].substr(1, lines[0].find_last_of('/') - 1);
+		read.Name = lines[2].substr(1);
+		read.Sequence = lines[1];
+		read.Qualities = lines[3];
+
+		return true;
+	}
+
+private:
+	ifstream mFile;
+	iostreams::filtering_streambuf<iostreams::input> mStreamBuf;
+	istream mStream;
+};
+
+#endif
@@ -5,83 +5,83 @@
  *
  */
 
+#include "SpillFile.h"
+
 #include <stdio.h>
 #include <fstream>
 #include <iostream>
+#include <sstream>
 #include <string>
 #include <queue>
 #include <boost/shared_ptr.hpp>
-#include <boost/archive/binary_oarchive.hpp>
-#include <boost/archive/binary_iarchive.hpp>
-#include <boost/iostreams/filtering_streambuf.hpp>
-#include <boost/iostreams/filter/gzip.hpp>
 
 
 using namespace boost;
 using namespace std;
 
 
-template <typename TType, class Compare>
+// Elements are required to implement Encode(RecordEncoder&), Decode(RecordDecoder&)
+// and MemorySize() for on disk storage and memory accounting
+
+template <typename TType>
 struct FileStack
 {
-	FileStack(const string& filename) : mLen(0), mIdx(0)
+	FileStack(const string& filename) : mReader(new SpillReader(filename)), mGood(false)
 	{
-		mFile = boost::shared_ptr<ifstream>(new ifstream(filename.c_str(), ios::in|ios::binary));
-		if (mFile->good())
-		{
-			// Stream via a gzip decompressor
-			mStream = boost::shared_ptr<iostreams::filtering_streambuf<iostreams::input> >(new iostreams::filtering_streambuf<iostreams::input>());
-			mStream->push(iostreams::gzip_decompressor());
-			mStream->push(*mFile);
-
-			// Input archive in binary from the stream
-			mArchive = boost::shared_ptr<archive::binary_iarchive>(new archive::binary_iarchive(*mStream));
-
-			// Number of elements at the top of the archive
-			(*mArchive) >> mLen;
-		}
-
 		Pop();
 	}
 
 	void Pop()
 	{
-		if (Good())
-		{
-			(*mArchive) >> Top;
+		mGood = mReader->NextRecord();
 
-			mIdx++;
+		if (mGood)
+		{
+			Top.Decode(*mReader);
 		}
 	}
 
 	bool Good() const
 	{
-		return mFile->good() && mIdx < mLen;
-	}
-
-	bool operator<(const FileStack<TType,Compare>& other) const
-	{
-		return !Compare()(Top, other.Top);
+		return mGood;
 	}
 
-	boost::shared_ptr<ifstream> mFile;
-	boost::shared_ptr<iostreams::filtering_streambuf<iostreams::input> > mStream;
-	boost::shared_ptr<archive::binary_iarchive> mArchive;
-	size_t mLen;
-	size_t mIdx;
+	boost::shared_ptr<SpillReader> mReader;
+	bool mGood;
 
 	TType Top;
 };
 
+template <typename TType, class Compare>
+struct FileStackGreater
+{
+	bool operator()(const boost::shared_ptr<FileStack<TType> >& a, const boost::shared_ptr<FileStack<TType> >& b) const
+	{
+		return Compare()(b->Top, a->Top);
+	}
+};
+
 template <typename TType, class Compare=less<TType> >
 struct DiskPriorityQueue
 {
-	DiskPriorityQueue(const string& prefix, int maxSize) : mPrefix(prefix), mMaxSize(maxSize), mSuffix(0)
+	typedef boost::shared_ptr<FileStack<TType> > FileStackPtr;
+	typedef priority_queue<FileStackPtr,vector<FileStackPtr>,FileStackGreater<TType,Compare> > FileStackQueue;
+
+	// Sorted runs are spilled when buffered elements exceed maxMemory bytes,
+	// and merged in passes of at most maxFanIn files
+	DiskPriorityQueue(const string& prefix, long maxMemory, int maxFanIn = 64)
+		: mPrefix(prefix), mMaxMemory(maxMemory), mMaxFanIn(max(2, maxFanIn)), mSuffix(0), mBufferMemory(0)
 	{
 	}
 
 	~DiskPriorityQueue()
 	{
+		// Close files before deleting
+		while (!mQueue.empty())
+		{
+			mQueue.pop();
+		}
+
 		// Delete alll temporary files
 		for (vector<string>::const_iterator iter = mFilenames.begin(); iter != mFilenames.end(); iter++)
 		{
@@ -96,8 +96,9 @@ struct DiskPriorityQueue
 	void Push(const TType& a)
 	{
 		mBuffer.push_back(a);
+		mBufferMemory += a.MemorySize();
 
-		if (mBuffer.size() >= mMaxSize)
+		if (mBufferMemory >= mMaxMemory)
 		{
 			Flush();
 		}
@@ -107,71 +108,57 @@ struct DiskPriorityQueue
 	{
 		Flush();
 
-		for (vector<string>::const_iterator iter = mFilenames.begin(); iter != mFilenames.end(); iter++)
+		// Merge the oldest runs until the remaining runs can be merged at once
+		while (mFilenames.size() > mMaxFanIn)
 		{
-			mQueue.push(FileStack<TType,Compare>(*iter));
+			vector<string> mergeFilenames(mFilenames.begin(), mFilenames.begin() + mMaxFanIn);
+			mFilenames.erase(mFilenames.begin(), mFilenames.begin() + mMaxFanIn);
+
+			MergeFiles(mergeFilenames);
 		}
+
+		OpenFiles(mFilenames, mQueue);
 	}
 	
 	void Flush()
 	{
-		sort(mBuffer.begin(), mBuffer.end(), Compare());
-
-		// Create filename with numeric suffix
-		ostringstream suffixConvert;
-		suffixConvert << mSuffix;
-		string outFilename = mPrefix + suffixConvert.str();
-		mSuffix++;
-
-		// Maintain a list of temp filenames, deleted by destructor
-		mFilenames.push_back(outFilename);
-
-		ofstream outFile(outFilename.c_str(), ios::out|ios::binary|ios::trunc);
+		// Avoid empty files, which would leave an invalid top element
+		if (mBuffer.empty())
+		{
+			return;
+		}
 
-		// Stream via a gzip compressor
-		iostreams::filtering_streambuf<iostreams::output> outStream;
-		outStream.push(iostreams::gzip_compressor());
-		outStream.push(outFile);
+		sort(mBuffer.begin(), mBuffer.end(), Compare());
 
-		// Archive in binary to the stream
-		archive::binary_oarchive outArchive(outStream);
-		
-		// Number of elements at the top of the archive
-		size_t len = mBuffer.size();
-		outArchive << len;
+		SpillWriter writer(NextFilename());
 
-		// Archive sorted list
 		for (typename vector<TType>::const_iterator iter = mBuffer.begin(); iter != mBuffer.end(); iter++)
 		{
-			outArchive << *iter;
+			writer.BeginRecord();
+			iter->Encode(writer);
+			writer.EndRecord();
 		}
 
 		mBuffer.clear();
+		mBufferMemory = 0;
 	}
 
 	const TType& Top()
 	{
-		return mQueue.top().Top;
+		return mQueue.top()->Top;
 	}
 
 	void Pop()
 	{
-		if (mQueue.top().Good())
-		{
-			// Pop from the priority queue but store as temp
-			FileStack<TType,Compare> tempStack = mQueue.top();
-			mQueue.pop();
+		// Pop from the priority queue, and add back unless end of file
+		FileStackPtr stack = mQueue.top();
+		mQueue.pop();
 
-			// Pop from the file
-			tempStack.Pop();
+		stack->Pop();
 
-			// Add back to the priority queue
-			mQueue.push(tempStack);
-		}
-		else
+		if (stack->Good())
 		{
-			// End of file, just pop from the priority queue
-			mQueue.pop();
+			mQueue.push(stack);
 		}
 	}
 
@@ -180,12 +167,77 @@ struct DiskPriorityQueue
 		return mQueue.empty();
 	}
 
+	string NextFilename()
+	{
+		// Create filename with numeric suffix
+		ostringstream suffixConvert;
+		suffixConvert << mSuffix;
+		string outFilename = mPrefix + suffixConvert.str();
+		mSuffix++;
+
+		// Maintain a list of temp filenames, deleted by destructor
+		mFilenames.push_back(outFilename);
+
+		return outFilename;
+	}
+
+	void OpenFiles(const vector<string>& filenames, FileStackQueue& queue)
+	{
+		for (vector<string>::const_iterator iter = filenames.begin(); iter != filenames.end(); iter++)
+		{
+			FileStackPtr stack(new FileStack<TType>(*iter));
+
+			if (stack->Good())
+			{
+				queue.push(stack);
+			}
+		}
+	}
+
+	void MergeFiles(const vector<string>& filenames)
+	{
+		{
+			FileStackQueue queue;
+			OpenFiles(filenames, queue);
+
+			SpillWriter writer(NextFilename());
+
+			while (!queue.empty())
+			{
+				FileStackPtr stack = queue.top();
+				queue.pop();
+
+				writer.BeginRecord();
+				stack->Top.Encode(writer);
+				writer.EndRecord();
+
+				stack->Pop();
+
+				if (stack->Good())
+				{
+					queue.push(stack);
+				}
+			}
+		}
+
+		for (vector<string>::const_iterator iter = filenames.begin(); iter != filenames.end(); iter++)
+		{
+			if(remove(iter->c_str()) != 0)
+			{
+				string errorMsg = "Error deleting file " + *iter;
+				perror(errorMsg.c_str());
+			}
+		}
+	}
+
 	const string mPrefix;
-	int mMaxSize;
+	long mMaxMemory;
+	int mMaxFanIn;
 	int mSuffix;
 	vector<TType> mBuffer;
+	long mBufferMemory;
 	vector<string> mFilenames;
-	priority_queue<FileStack<TType,Compare> > mQueue;
+	FileStackQueue mQueue;
 };
 
 
@@ -0,0 +1,197 @@
+/*
+ *  ParallelGzip.cpp
+ *
+ */
+
+#include "ParallelGzip.h"
+
+#include <deque>
+#include <cstring>
+#include <zlib.h>
+#include <boost/bind.hpp>
+#include <boost/enable_shared_from_this.hpp>
+
+using namespace std;
+using namespace boost;
+
+
+// Compress a buffer into a complete gzip member
+void DeflateGzip(const string& data, string& compressed)
+{
+	z_stream zs;
+	memset(&zs, 0, sizeof(zs));
+
+	// Window bits of 15 + 16 requests a gzip header and trailer
+	if (deflateInit2(&zs, Z_DEFAULT_COMPRESSION, Z_DEFLATED, 15 + 16, 8, Z_DEFAULT_STRATEGY) != Z_OK)
+	{
+		cerr << "Error: Unable to initialize gzip compression" << endl;
+		exit(1);
+	}
+
+	compressed.resize(deflateBound(&zs, data.size()));
+
+	zs.next_in = (Bytef*)data.data();
+	zs.avail_in = data.size();
+	zs.next_out = (Bytef*)&compressed[0];
+	zs.avail_out = compressed.size();
+
+	if (deflate(&zs, Z_FINISH) != Z_STREAM_END)
+	{
+		cerr << "Error: Gzip compression failed" << endl;
+		exit(1);
+	}
+
+	compressed.resize(zs.total_out);
+
+	deflateEnd(&zs);
+}
+
+
+struct ParallelGzipCompressor::Impl : boost::enable_shared_from_this<ParallelGzipCompressor::Impl>
+{
+	struct Block
+	{
+		Block() : done(false) {}
+
+		string data;
+		string compressed;
+		bool done;
+	};
+
+	typedef boost::shared_ptr<Block> BlockPtr;
+
+	Impl(ostream& stream, ThreadPool& threadPool, int blockSize)
+		: mStream(stream),
+		  mThreadPool(threadPool),
+		  mBlockSize(blockSize),
+		  mMaxPending(2 * threadPool.NumThreads() + 1),
+		  mClosed(false)
+	{
+		mBuffer.reserve(mBlockSize);
+	}
+
+	void Write(const char* s, streamsize n)
+	{
+		mBuffer.append(s, n);
+
+		if (mBuffer.size() >= mBlockSize)
+		{
+			Submit();
+		}
+
+		WriteCompleted();
+	}
+
+	void Close()
+	{
+		if (mClosed)
+		{
+			return;
+		}
+
+		if (!mBuffer.empty())
+		{
+			Submit();
+		}
+
+		while (!mPending.empty())
+		{
+			WriteFront();
+		}
+
+		mStream.flush();
+
+		mClosed = true;
+	}
+
+	void Submit()
+	{
+		BlockPtr block(new Block());
+		block->data.swap(mBuffer);
+		mBuffer.reserve(mBlockSize);
+
+		// Bound the number of blocks held in memory
+		while (mPending.size() >= mMaxPending)
+		{
+			WriteFront();
+		}
+
+		mPending.push_back(block);
+		mThreadPool.Submit(boost::bind(&Impl::Compress, shared_from_this(), block));
+	}
+
+	void Compress(BlockPtr block)
+	{
+		string compressed;
+		DeflateGzip(block->data, compressed);
+
+		boost::mutex::scoped_lock lock(mMutex);
+
+		block->compressed.swap(compressed);
+		block->data.clear();
+		block->done = true;
+
+		mBlockDone.notify_all();
+	}
+
+	// Write the oldest block, waiting for its compression to finish
+	void WriteFront()
+	{
+		BlockPtr block = mPending.front();
+
+		{
+			boost::mutex::scoped_lock lock(mMutex);
+			while (!block->done)
+			{
+				mBlockDone.wait(lock);
+			}
+		}
+
+		mStream.write(block->compressed.data(), block->compressed.size());
+		mPending.pop_front();
+	}
+
+	// Write blocks that have already been compressed, preserving order
+	void WriteCompleted()
+	{
+		while (!mPending.empty())
+		{
+			{
+				boost::mutex::scoped_lock lock(mMutex);
+				if (!mPending.front()->done)
+				{
+					return;
+				}
+			}
+
+			WriteFront();
+		}
+	}
+
+	ostream& mStream;
+	ThreadPool& mThreadPool;
+	int mBlockSize;
+	int mMaxPending;
+	bool mClosed;
+	string mBuffer;
+	deque<BlockPtr> mPending;
+	boost::mutex mMutex;
+	boost::condition_variable mBlockDone;
+};
+
+
+ParallelGzipCompressor::ParallelGzipCompressor(ostream& stream, ThreadPool& threadPool, int blockSize)
+	: mImpl(new Impl(stream, threadPool, blockSize))
+{
+}
+
+streamsize ParallelGzipCompressor::write(const char* s, streamsize n)
+{
+	mImpl->Write(s, n);
+	return n;
+}
+
+void ParallelGzipCompressor::close()
+{
+	mImpl->Close();
+}
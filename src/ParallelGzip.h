@@ -0,0 +1,39 @@
+/*
+ *  ParallelGzip.h
+ *
+ */
+
+#ifndef PARALLELGZIP_H_
+#define PARALLELGZIP_H_
+
+#include "ThreadPool.h"
+
+#include <iostream>
+#include <string>
+#include <boost/shared_ptr.hpp>
+#include <boost/iostreams/categories.hpp>
+
+using namespace std;
+using namespace boost;
+
+
+// Gzip sink compressing fixed size blocks on a thread pool.  Each block
+// is written as a separate gzip member, in order, so the output is a
+// standard multi-member gzip file readable by gzip, zlib and python.
+class ParallelGzipCompressor
+{
+public:
+	typedef char char_type;
+	struct category : iostreams::sink_tag, iostreams::closable_tag {};
+
+	ParallelGzipCompressor(ostream& stream, ThreadPool& threadPool, int blockSize = 4 * 1024 * 1024);
+
+	streamsize write(const char* s, streamsize n);
+	void close();
+
+private:
+	struct Impl;
+	boost::shared_ptr<Impl> mImpl;
+};
+
+#endif
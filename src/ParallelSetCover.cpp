@@ -0,0 +1,122 @@
+/*
+ *  ParallelSetCover.cpp
+ *
+ */
+
+#include "ParallelSetCover.h"
+#include "Algorithms.h"
+#include "ThreadPool.h"
+
+#include <boost/bind.hpp>
+
+using namespace std;
+using namespace boost;
+
+
+// Solve the set cover of each of a range of connected components, components share
+// no reads so each assigns a disjoint subset of reads and local read ids.  Clusters
+// are given local ids in increasing order of their global index, so ties are broken
+// as in a single solve
+void ComponentSetCover(const vector<uint32_t>& clusterOffsets, const vector<uint32_t>& clusterReads, const vector<double>& weights,
+                       const vector<int>* componentBegin, const vector<int>* componentEnd,
+                       vector<uint32_t>& localReads, vector<int>& readAssignments)
+{
+	for (const vector<int>* componentIter = componentBegin; componentIter != componentEnd; componentIter++)
+	{
+		const vector<int>& clusters = *componentIter;
+
+		vector<uint32_t> globalReads;
+		vector<uint32_t> offsets(1, 0);
+		vector<uint32_t> reads;
+		vector<double> componentWeights;
+
+		for (vector<int>::const_iterator clusterIter = clusters.begin(); clusterIter != clusters.end(); clusterIter++)
+		{
+			for (uint32_t offset = clusterOffsets[*clusterIter]; offset < clusterOffsets[*clusterIter + 1]; offset++)
+			{
+				uint32_t readIdx = clusterReads[offset];
+
+				// Reads given a local id are marked until assigned
+				if (readAssignments[readIdx] == -1)
+				{
+					readAssignments[readIdx] = -2;
+					localReads[readIdx] = globalReads.size();
+					globalReads.push_back(readIdx);
+				}
+
+				reads.push_back(localReads[readIdx]);
+			}
+
+			offsets.push_back(reads.size());
+			componentWeights.push_back(weights[*clusterIter]);
+		}
+
+		vector<int> solution;
+		vector<int> assignments;
+		LazySetCover(offsets, reads, globalReads.size(), componentWeights, solution, assignments);
+
+		for (int localIdx = 0; localIdx < (int)globalReads.size(); localIdx++)
+		{
+			readAssignments[globalReads[localIdx]] = clusters[assignments[localIdx]];
+		}
+	}
+}
+
+void ParallelSetCover(const vector<uint32_t>& clusterOffsets, const vector<uint32_t>& clusterReads, int numReads,
+                      const vector<double>& weights, int numThreads, vector<int>& readAssignments)
+{
+	if (numThreads <= 1)
+	{
+		vector<int> solution;
+		LazySetCover(clusterOffsets, clusterReads, numReads, weights, solution, readAssignments);
+		return;
+	}
+
+	// Greedy choices in one component do not change costs in another, so solving
+	// components independently gives the same assignments as a single solve
+	vector<int> clusterComponents;
+	int numComponents = SetCoverComponents(clusterOffsets, clusterReads, numReads, clusterComponents);
+
+	// Clusters of each component in increasing index
+	vector<vector<int> > componentClusters(numComponents);
+	for (int clusterIdx = 0; clusterIdx < (int)clusterComponents.size(); clusterIdx++)
+	{
+		if (clusterComponents[clusterIdx] >= 0)
+		{
+			componentClusters[clusterComponents[clusterIdx]].push_back(clusterIdx);
+		}
+	}
+
+	// Each component writes only the assignments of its own reads, so the result
+	// does not depend on the order in which batches complete
+	readAssignments = vector<int>(numReads, -1);
+	vector<uint32_t> localReads(numReads);
+
+	// Batch small components to limit the number of tasks
+	size_t batchMembers = clusterReads.size() / (16 * numThreads) + 1;
+
+	ThreadPool threadPool(numThreads);
+
+	int batchBegin = 0;
+	size_t numMembers = 0;
+	for (int componentIdx = 0; componentIdx < numComponents; componentIdx++)
+	{
+		const vector<int>& clusters = componentClusters[componentIdx];
+		for (vector<int>::const_iterator clusterIter = clusters.begin(); clusterIter != clusters.end(); clusterIter++)
+		{
+			numMembers += clusterOffsets[*clusterIter + 1] - clusterOffsets[*clusterIter];
+		}
+
+		if (numMembers >= batchMembers || componentIdx + 1 == numComponents)
+		{
+			threadPool.Submit(boost::bind(ComponentSetCover, boost::cref(clusterOffsets), boost::cref(clusterReads), boost::cref(weights),
+			                              &componentClusters.front() + batchBegin, &componentClusters.front() + componentIdx + 1,
+			                              boost::ref(localReads), boost::ref(readAssignments)));
+
+			batchBegin = componentIdx + 1;
+			numMembers = 0;
+		}
+	}
+
+	threadPool.Join();
+}
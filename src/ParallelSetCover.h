@@ -0,0 +1,23 @@
+/*
+ *  ParallelSetCover.h
+ *
+ */
+
+#ifndef PARALLELSETCOVER_H_
+#define PARALLELSETCOVER_H_
+
+#include <vector>
+#include <stdint.h>
+
+using namespace std;
+
+
+// Greedy weighted set cover of dense read ids, with clusters given as offsets
+// into an array of reads, assigning each read to a cluster or -1 if in none.
+// With multiple threads, connected components of clusters sharing reads are
+// solved in parallel.  Ties are broken by lowest cluster index in each component,
+// as in a single solve, so the assignments do not depend on the number of threads.
+void ParallelSetCover(const vector<uint32_t>& clusterOffsets, const vector<uint32_t>& clusterReads, int numReads,
+                      const vector<double>& weights, int numThreads, vector<int>& readAssignments);
+
+#endif
@@ -9,33 +9,20 @@
 #include "Common.h"
 #include "DebugCheck.h"
 
+#include <algorithm>
+#include <cstring>
 #include <fstream>
 #include <iostream>
 #include <string>
+#include <sys/stat.h>
 #include <boost/algorithm/string.hpp>
 #include <boost/unordered_map.hpp>
 
 using namespace boost;
 using namespace std;
 
-	
-void RegionDB::Add(const CompactSimpleRegion& region)
-{
-	for (int bin = region.start / mBinSpacing; bin <= region.end / mBinSpacing; bin++)
-	{
-		mBinned[RefBin(region.ref,bin)].push_back(StartEnd(region.start,region.end));
-	}
-}
 
-void RegionDB::Add(const CompactSimpleRegionVec& regions)
-{
-	for (CompactSimpleRegionVec::const_iterator regionIter = regions.begin(); regionIter != regions.end(); regionIter++)
-	{
-		Add(*regionIter);
-	}
-}
-
-void RegionDB::Add(const string& regionsFilename)
+void ReadRegions(const string& regionsFilename, CompactSimpleRegionVec& regions)
 {
 	// Open regions file
 	ifstream regionsFile(regionsFilename.c_str());
@@ -72,10 +59,34 @@ void RegionDB::Add(const string& regionsFilename)
 		region.start = SAFEPARSE(int, regionFields[1]);
 		region.end = SAFEPARSE(int, regionFields[2]);
 		
-		Add(region);
+		regions.push_back(region);
 	}
 	
 	regionsFile.close();
+}
+	
+void RegionDB::Add(const CompactSimpleRegion& region)
+{
+	for (int bin = region.start / mBinSpacing; bin <= region.end / mBinSpacing; bin++)
+	{
+		mBinned[RefBin(region.ref,bin)].push_back(StartEnd(region.start,region.end));
+	}
+}
+
+void RegionDB::Add(const CompactSimpleRegionVec& regions)
+{
+	for (CompactSimpleRegionVec::const_iterator regionIter = regions.begin(); regionIter != regions.end(); regionIter++)
+	{
+		Add(*regionIter);
+	}
+}
+
+void RegionDB::Add(const string& regionsFilename)
+{
+	CompactSimpleRegionVec regions;
+	ReadRegions(regionsFilename, regions);
+	
+	Add(regions);
 }	
 
 bool RegionDB::Contained(string ref, int start, int end) const
@@ -129,3 +140,142 @@ void RegionDB::Clear()
 	mBinned.clear();
 }
 
+void RegionIndex::Add(const CompactSimpleRegionVec& regions)
+{
+	unordered_map<string,vector<pair<int,int> > > refStartEnds;
+	
+	for (CompactSimpleRegionVec::const_iterator regionIter = regions.begin(); regionIter != regions.end(); regionIter++)
+	{
+		refStartEnds[regionIter->ref].push_back(make_pair(regionIter->start, regionIter->end));
+	}
+	
+	for (unordered_map<string,RefRegions>::const_iterator refIter = mRegions.begin(); refIter != mRegions.end(); refIter++)
+	{
+		for (int idx = 0; idx < (int)refIter->second.starts.size(); idx++)
+		{
+			refStartEnds[refIter->first].push_back(make_pair(refIter->second.starts[idx], refIter->second.ends[idx]));
+		}
+	}
+	
+	mRegions.clear();
+	
+	// Merge overlapping regions so that both starts and ends are sorted
+	for (unordered_map<string,vector<pair<int,int> > >::iterator refIter = refStartEnds.begin(); refIter != refStartEnds.end(); refIter++)
+	{
+		vector<pair<int,int> >& startEnds = refIter->second;
+		sort(startEnds.begin(), startEnds.end());
+		
+		RefRegions& refRegions = mRegions[refIter->first];
+		
+		for (vector<pair<int,int> >::const_iterator startEndIter = startEnds.begin(); startEndIter != startEnds.end(); startEndIter++)
+		{
+			if (startEndIter->first > startEndIter->second)
+			{
+				continue;
+			}
+			
+			if (!refRegions.starts.empty() && startEndIter->first <= refRegions.ends.back())
+			{
+				refRegions.ends.back() = max(refRegions.ends.back(), startEndIter->second);
+			}
+			else
+			{
+				refRegions.starts.push_back(startEndIter->first);
+				refRegions.ends.push_back(startEndIter->second);
+			}
+		}
+	}
+}
+
+void RegionIndex::Load(const string& regionsFilename)
+{
+	string indexFilename = regionsFilename + ".index";
+	
+	struct stat regionsStat;
+	struct stat indexStat;
+	if (stat(regionsFilename.c_str(), &regionsStat) == 0 && stat(indexFilename.c_str(), &indexStat) == 0 && indexStat.st_mtime >= regionsStat.st_mtime)
+	{
+		ReadIndex(indexFilename);
+	}
+	else
+	{
+		CompactSimpleRegionVec regions;
+		ReadRegions(regionsFilename, regions);
+		
+		Add(regions);
+	}
+}
+
+// Read a little endian integer from the region index
+template <typename TInteger>
+TInteger ReadIndexInteger(istream& indexFile)
+{
+	TInteger value;
+	indexFile.read((char*)&value, sizeof(TInteger));
+	return value;
+}
+
+void RegionIndex::ReadIndex(const string& indexFilename)
+{
+	// Region index format, see destruct/utils/regions.py
+	ifstream indexFile(indexFilename.c_str(), ios::binary);
+	CheckFile(indexFile, indexFilename);
+	
+	char magic[4];
+	indexFile.read(magic, 4);
+	
+	if (!indexFile || memcmp(magic, "DRI1", 4) != 0)
+	{
+		cerr << "Error: Invalid region index " << indexFilename << endl;
+		exit(1);
+	}
+	
+	mRegions.clear();
+	
+	uint32_t numRefs = ReadIndexInteger<uint32_t>(indexFile);
+	
+	for (uint32_t refIdx = 0; refIdx < numRefs; refIdx++)
+	{
+		uint32_t nameLength = ReadIndexInteger<uint32_t>(indexFile);
+		
+		string ref(nameLength, ' ');
+		indexFile.read(&ref[0], nameLength);
+		
+		uint64_t numRegions = ReadIndexInteger<uint64_t>(indexFile);
+		
+		RefRegions& refRegions = mRegions[ref];
+		
+		refRegions.starts.resize(numRegions);
+		refRegions.ends.resize(numRegions);
+		
+		if (numRegions > 0)
+		{
+			indexFile.read((char*)&refRegions.starts.front(), numRegions * sizeof(int32_t));
+			indexFile.read((char*)&refRegions.ends.front(), numRegions * sizeof(int32_t));
+		}
+	}
+	
+	if (!indexFile)
+	{
+		cerr << "Error: Truncated region index " << indexFilename << endl;
+		exit(1);
+	}
+}
+
+bool RegionIndex::Overlapped(const string& ref, int start, int end) const
+{
+	unordered_map<string,RefRegions>::const_iterator refIter = mRegions.find(ref);
+	
+	if (refIter == mRegions.end())
+	{
+		return false;
+	}
+	
+	const vector<int>& starts = refIter->second.starts;
+	const vector<int>& ends = refIter->second.ends;
+	
+	// Last region starting at or before the query end, the only candidate given sorted ends
+	int idx = upper_bound(starts.begin(), starts.end(), end) - starts.begin() - 1;
+	
+	return idx >= 0 && ends[idx] >= start;
+}
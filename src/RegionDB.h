@@ -28,6 +28,8 @@ struct CompactSimpleRegion
 
 typedef vector<CompactSimpleRegion> CompactSimpleRegionVec;
 
+void ReadRegions(const string& regionsFilename, CompactSimpleRegionVec& regions);
+
 class RegionDB
 {
 public:
@@ -61,5 +63,27 @@ private:
 	unordered_map<RefBin,StartEndVec> mBinned;
 };
 
+// Sorted non overlapping regions of each reference, queried by binary search
+class RegionIndex
+{
+public:
+	void Add(const CompactSimpleRegionVec& regions);
+	
+	// Load the index created alongside the regions file if it is up to date
+	void Load(const string& regionsFilename);
+	void ReadIndex(const string& indexFilename);
+	
+	bool Overlapped(const string& ref, int start, int end) const;
+	
+private:
+	struct RefRegions
+	{
+		vector<int> starts;
+		vector<int> ends;
+	};
+	
+	unordered_map<string,RefRegions> mRegions;
+};
+
 #endif
 
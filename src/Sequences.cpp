@@ -10,6 +10,8 @@
 
 #include <fstream>
 #include <algorithm>
+#include <cstring>
+#include <sys/stat.h>
 #include <boost/unordered_map.hpp>
 #include <boost/algorithm/string.hpp>
 
@@ -70,6 +72,131 @@ void Sequences::Read(const string& fastaFilename)
 	}
 }
 
+void Sequences::Load(const string& fastaFilename)
+{
+	// Use the packed genome created alongside the fasta if it is up to date
+	string packedFilename = fastaFilename + ".packed";
+	
+	struct stat fastaStat;
+	struct stat packedStat;
+	if (stat(fastaFilename.c_str(), &fastaStat) == 0 && stat(packedFilename.c_str(), &packedStat) == 0 && packedStat.st_mtime >= fastaStat.st_mtime)
+	{
+		ReadPacked(packedFilename);
+	}
+	else
+	{
+		Read(fastaFilename);
+	}
+}
+
+// Read a little endian integer from the packed index
+template <typename TInteger>
+TInteger ReadPackedInteger(const char*& ptr)
+{
+	TInteger value;
+	memcpy(&value, ptr, sizeof(TInteger));
+	ptr += sizeof(TInteger);
+	return value;
+}
+
+void Sequences::ReadPacked(const string& packedFilename)
+{
+	// Packed genome format, see destruct/utils/genome.py
+	try
+	{
+		mPackedFile.open(packedFilename);
+	}
+	catch (std::exception& e)
+	{
+		ReportFailure("Error: Unable to map packed genome " << packedFilename << ": " << e.what());
+	}
+	
+	const char* data = mPackedFile.data();
+	
+	if (mPackedFile.size() < 16 || memcmp(data, "DGN1", 4) != 0)
+	{
+		ReportFailure("Error: Invalid packed genome " << packedFilename);
+	}
+	
+	const char* ptr = data + 4;
+	uint32_t numSequences = ReadPackedInteger<uint32_t>(ptr);
+	uint64_t indexOffset = ReadPackedInteger<uint64_t>(ptr);
+	
+	ptr = data + indexOffset;
+	for (uint32_t seqIndex = 0; seqIndex < numSequences; seqIndex++)
+	{
+		uint32_t nameLength = ReadPackedInteger<uint32_t>(ptr);
+		string id(ptr, nameLength);
+		ptr += nameLength;
+		
+		PackedSequence packed;
+		
+		packed.length = (int)ReadPackedInteger<uint64_t>(ptr);
+		packed.bases = (const uint8_t*)(data + ReadPackedInteger<uint64_t>(ptr));
+		
+		packed.numExceptions = (int)ReadPackedInteger<uint64_t>(ptr);
+		packed.exceptionStarts = (const uint32_t*)(data + ReadPackedInteger<uint64_t>(ptr));
+		packed.exceptionEnds = packed.exceptionStarts + packed.numExceptions;
+		packed.exceptionBytes = (const uint8_t*)(packed.exceptionEnds + packed.numExceptions);
+		
+		packed.numLowercase = (int)ReadPackedInteger<uint64_t>(ptr);
+		packed.lowercaseStarts = (const uint32_t*)(data + ReadPackedInteger<uint64_t>(ptr));
+		packed.lowercaseEnds = packed.lowercaseStarts + packed.numLowercase;
+		
+		mPackedSequences[id] = packed;
+		mNames.push_back(id);
+	}
+}
+
+const Sequences::PackedSequence& Sequences::GetPacked(const string& id) const
+{
+	unordered_map<string,PackedSequence>::const_iterator packedIter = mPackedSequences.find(id);
+	
+	if (packedIter == mPackedSequences.end())
+	{
+		ReportFailure("Error: Unable to find sequence " << id);
+	}
+	
+	return packedIter->second;
+}
+
+void Sequences::DecodePacked(const PackedSequence& packed, int start, int end, char* sequence) const
+{
+	// Decode 0-based positions [start,end), positions beyond the sequence are N as for padding
+	static const char cBases[] = {'A','C','G','T'};
+	
+	memset(sequence, 'N', end - start);
+	
+	int clipStart = max(start, 0);
+	int clipEnd = min(end, packed.length);
+	
+	for (int pos = clipStart; pos < clipEnd; pos++)
+	{
+		sequence[pos - start] = cBases[(packed.bases[pos >> 2] >> ((pos & 3) << 1)) & 3];
+	}
+	
+	int exceptionIndex = upper_bound(packed.exceptionEnds, packed.exceptionEnds + packed.numExceptions, (uint32_t)clipStart) - packed.exceptionEnds;
+	for (; exceptionIndex < packed.numExceptions && (int)packed.exceptionStarts[exceptionIndex] < clipEnd; exceptionIndex++)
+	{
+		int runStart = max(clipStart, (int)packed.exceptionStarts[exceptionIndex]);
+		int runEnd = min(clipEnd, (int)packed.exceptionEnds[exceptionIndex]);
+		
+		memset(sequence + runStart - start, packed.exceptionBytes[exceptionIndex], runEnd - runStart);
+	}
+	
+	int lowercaseIndex = upper_bound(packed.lowercaseEnds, packed.lowercaseEnds + packed.numLowercase, (uint32_t)clipStart) - packed.lowercaseEnds;
+	for (; lowercaseIndex < packed.numLowercase && (int)packed.lowercaseStarts[lowercaseIndex] < clipEnd; lowercaseIndex++)
+	{
+		int runStart = max(clipStart, (int)packed.lowercaseStarts[lowercaseIndex]);
+		int runEnd = min(clipEnd, (int)packed.lowercaseEnds[lowercaseIndex]);
+		
+		for (int pos = runStart; pos < runEnd; pos++)
+		{
+			sequence[pos - start] = tolower(sequence[pos - start]);
+		}
+	}
+}
+
 void Sequences::ReadMappabilityBedGraph(const string& bedGraphFilename)
 {
 	ifstream bedGraphFile(bedGraphFilename.c_str());
@@ -115,6 +242,11 @@ void Sequences::ReadMappabilityBedGraph(const string& bedGraphFilename)
 
 const string& Sequences::Get(const string& id) const
 {
+	if (IsPacked())
+	{
+		ReportFailure("Error: Full sequence access unsupported for packed genome");
+	}
+	
 	if (mSequences.find(id) == mSequences.end())
 	{
 		ReportFailure("Error: Unable to find sequence " << id);
@@ -125,6 +257,16 @@ const string& Sequences::Get(const string& id) const
 
 void Sequences::Get(const string& id, int start, int end, string& sequence) const
 {
+	if (IsPacked())
+	{
+		sequence.assign(max(0, end - start + 1), 'N');
+		if (!sequence.empty())
+		{
+			DecodePacked(GetPacked(id), start - 1, end, &sequence[0]);
+		}
+		return;
+	}
+	
 	if (mSequences.find(id) == mSequences.end())
 	{
 		ReportFailure("Error: Unable to find sequence " << id);
@@ -138,6 +280,11 @@ void Sequences::Get(const string& id, int start, int end, string& sequence) cons
 
 const char* Sequences::Get(const string& id, int pos) const
 {
+	if (IsPacked())
+	{
+		ReportFailure("Error: Unbuffered sequence access unsupported for packed genome");
+	}
+	
 	if (mSequences.find(id) == mSequences.end())
 	{
 		ReportFailure("Error: Unable to find sequence " << id);
@@ -148,8 +295,42 @@ const char* Sequences::Get(const string& id, int pos) const
 	return fullSequence.c_str() + pos - 1 + mPadding;
 }
 
+const char* Sequences::GetWindow(const string& id, int pos, int reach, string& buffer) const
+{
+	if (!IsPacked())
+	{
+		return Get(id, pos);
+	}
+	
+	buffer.resize(2 * reach + 1);
+	DecodePacked(GetPacked(id), pos - 1 - reach, pos + reach, &buffer[0]);
+	
+	return buffer.data() + reach;
+}
+
 void Sequences::Get(const string& id, int strand, int& start, int& length, string& sequence) const
 {
+	if (IsPacked())
+	{
+		int end = min(GetPacked(id).length, start + length - 1);
+		
+		start = max(1, start);
+		length = max(0, end - start + 1);
+		
+		sequence.assign(length, 'N');
+		if (!sequence.empty())
+		{
+			DecodePacked(GetPacked(id), start - 1, start - 1 + length, &sequence[0]);
+		}
+		
+		if (strand == MinusStrand)
+		{
+			ReverseComplement(sequence);
+		}
+		
+		return;
+	}
+	
 	if (mSequences.find(id) == mSequences.end())
 	{
 		ReportFailure("Error: Unable to find sequence " << id);
@@ -13,6 +13,7 @@
 #include <map>
 #include <string>
 #include <iostream>
+#include <boost/iostreams/device/mapped_file.hpp>
 
 using namespace std;
 using namespace boost;
@@ -22,20 +23,43 @@ class Sequences
 public:
 	explicit Sequences(int padding = 0) : mPadding(padding), mConcatSize(0) {}
 	void Read(const string& fastaFilename);
+	void Load(const string& fastaFilename);
 	void ReadMappabilityBedGraph(const string& bedGraphFilename);
 	const string& Get(const string& id) const;
 	void Get(const string& id, int start, int end, string& sequence) const;
 	void Get(const string& id, int start, int end, vector<uint8_t>& sequence) const;
 	void GetWithDefault(const string& id, int start, int end, uint8_t dval, vector<uint8_t>& sequence) const;
 	const char* Get(const string& id, int pos) const;
+	const char* GetWindow(const string& id, int pos, int reach, string& buffer) const;
 	void Get(const string& id, int strand, int& start, int& length, string& sequence) const;
 	const vector<string>& GetNames() const;
 	
 private:
+	struct PackedSequence
+	{
+		int length;
+		const uint8_t* bases;
+		int numExceptions;
+		const uint32_t* exceptionStarts;
+		const uint32_t* exceptionEnds;
+		const uint8_t* exceptionBytes;
+		int numLowercase;
+		const uint32_t* lowercaseStarts;
+		const uint32_t* lowercaseEnds;
+	};
+	
+	void ReadPacked(const string& packedFilename);
+	bool IsPacked() const { return mPackedFile.is_open(); }
+	const PackedSequence& GetPacked(const string& id) const;
+	void DecodePacked(const PackedSequence& packed, int start, int end, char* sequence) const;
+	
 	int mPadding;
 	vector<string> mNames;
 	unordered_map<string,string> mSequences;
 	int mConcatSize;
+	
+	iostreams::mapped_file_source mPackedFile;
+	unordered_map<string,PackedSequence> mPackedSequences;
 };
 
 #endif
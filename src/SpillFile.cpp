@@ -0,0 +1,376 @@
+/*
+ *  SpillFile.cpp
+ *
+ */
+
+#include "SpillFile.h"
+#include "Common.h"
+
+#include <iostream>
+#include <stdint.h>
+#include <lz4.h>
+
+using namespace std;
+
+
+namespace
+{
+	const char kNucleotides[] = "ACGT";
+
+	inline int NucleotideCode(char nucleotide)
+	{
+		switch (nucleotide)
+		{
+			case 'A': return 0;
+			case 'C': return 1;
+			case 'G': return 2;
+			case 'T': return 3;
+			default: return -1;
+		}
+	}
+
+	inline void AppendUInt(string& buffer, unsigned long value)
+	{
+		while (value >= 0x80)
+		{
+			buffer.push_back((char)((value & 0x7F) | 0x80));
+			value >>= 7;
+		}
+		buffer.push_back((char)value);
+	}
+}
+
+
+void RecordEncoder::WriteUInt(unsigned long value)
+{
+	AppendUInt(mBuffer, value);
+}
+
+void RecordEncoder::WriteInt(long value)
+{
+	// Zig zag encoding keeps small negative values small
+	WriteUInt(((unsigned long)value << 1) ^ (unsigned long)(value >> (sizeof(long) * 8 - 1)));
+}
+
+void RecordEncoder::WriteBool(bool value)
+{
+	mBuffer.push_back(value ? 1 : 0);
+}
+
+void RecordEncoder::WriteString(const string& value)
+{
+	WriteUInt(value.size());
+	mBuffer.append(value);
+}
+
+void RecordEncoder::WriteSequence(const string& sequence)
+{
+	WriteUInt(sequence.size());
+
+	size_t packedStart = mBuffer.size();
+	mBuffer.resize(packedStart + (sequence.size() + 3) / 4, 0);
+
+	size_t numExceptions = 0;
+	for (size_t seqIndex = 0; seqIndex < sequence.size(); seqIndex++)
+	{
+		int code = NucleotideCode(sequence[seqIndex]);
+
+		if (code < 0)
+		{
+			numExceptions++;
+			code = 0;
+		}
+
+		mBuffer[packedStart + seqIndex / 4] |= (char)(code << (2 * (seqIndex % 4)));
+	}
+
+	// Positions of non ACGT nucleotides as deltas from the previous exception
+	WriteUInt(numExceptions);
+
+	size_t lastException = 0;
+	for (size_t seqIndex = 0; numExceptions > 0 && seqIndex < sequence.size(); seqIndex++)
+	{
+		if (NucleotideCode(sequence[seqIndex]) < 0)
+		{
+			WriteUInt(seqIndex - lastException);
+			mBuffer.push_back(sequence[seqIndex]);
+			lastException = seqIndex;
+		}
+	}
+}
+
+void RecordEncoder::WriteQualities(const string& qualities)
+{
+	size_t numRuns = 0;
+	for (size_t qualIndex = 0; qualIndex < qualities.size(); qualIndex++)
+	{
+		if (qualIndex == 0 || qualities[qualIndex] != qualities[qualIndex - 1])
+		{
+			numRuns++;
+		}
+	}
+
+	// Each run costs at least two bytes, fall back to raw qualities
+	// for the unbinned qualities of older sequencers
+	if (2 * numRuns >= qualities.size())
+	{
+		WriteBool(false);
+		WriteString(qualities);
+		return;
+	}
+
+	WriteBool(true);
+	WriteUInt(qualities.size());
+	WriteUInt(numRuns);
+
+	size_t runStart = 0;
+	for (size_t qualIndex = 1; qualIndex <= qualities.size(); qualIndex++)
+	{
+		if (qualIndex == qualities.size() || qualities[qualIndex] != qualities[runStart])
+		{
+			mBuffer.push_back(qualities[runStart]);
+			WriteUInt(qualIndex - runStart);
+			runStart = qualIndex;
+		}
+	}
+}
+
+
+unsigned long RecordDecoder::ReadUInt()
+{
+	unsigned long value = 0;
+	int shift = 0;
+
+	unsigned char byte;
+	do
+	{
+		byte = ReadByte();
+		value |= (unsigned long)(byte & 0x7F) << shift;
+		shift += 7;
+	}
+	while (byte & 0x80);
+
+	return value;
+}
+
+long RecordDecoder::ReadInt()
+{
+	unsigned long value = ReadUInt();
+	return (long)(value >> 1) ^ -(long)(value & 1);
+}
+
+bool RecordDecoder::ReadBool()
+{
+	return ReadByte() != 0;
+}
+
+void RecordDecoder::ReadString(string& value)
+{
+	size_t length = ReadUInt();
+	value.assign(ReadBytes(length), length);
+}
+
+void RecordDecoder::ReadSequence(string& sequence)
+{
+	size_t length = ReadUInt();
+	const char* packed = ReadBytes((length + 3) / 4);
+
+	sequence.resize(length);
+	for (size_t seqIndex = 0; seqIndex < length; seqIndex++)
+	{
+		sequence[seqIndex] = kNucleotides[(packed[seqIndex / 4] >> (2 * (seqIndex % 4))) & 3];
+	}
+
+	size_t numExceptions = ReadUInt();
+
+	size_t seqIndex = 0;
+	for (size_t exceptionIndex = 0; exceptionIndex < numExceptions; exceptionIndex++)
+	{
+		seqIndex += ReadUInt();
+
+		if (seqIndex >= length)
+		{
+			cerr << "Error: Invalid sequence record" << endl;
+			exit(1);
+		}
+
+		sequence[seqIndex] = ReadByte();
+	}
+}
+
+void RecordDecoder::ReadQualities(string& qualities)
+{
+	if (!ReadBool())
+	{
+		ReadString(qualities);
+		return;
+	}
+
+	size_t length = ReadUInt();
+	size_t numRuns = ReadUInt();
+
+	qualities.clear();
+	qualities.reserve(length);
+	for (size_t runIndex = 0; runIndex < numRuns; runIndex++)
+	{
+		char quality = ReadByte();
+		size_t runLength = ReadUInt();
+		qualities.append(runLength, quality);
+	}
+
+	if (qualities.size() != length)
+	{
+		cerr << "Error: Invalid qualities record" << endl;
+		exit(1);
+	}
+}
+
+unsigned char RecordDecoder::ReadByte()
+{
+	return *ReadBytes(1);
+}
+
+const char* RecordDecoder::ReadBytes(size_t length)
+{
+	if (length > (size_t)(mEnd - mPosition))
+	{
+		cerr << "Error: Read past end of record" << endl;
+		exit(1);
+	}
+
+	const char* bytes = mPosition;
+	mPosition += length;
+
+	return bytes;
+}
+
+
+SpillWriter::SpillWriter(const string& filename, int blockSize)
+	: mFilename(filename),
+	  mFile(filename.c_str(), ios::out | ios::binary | ios::trunc),
+	  mBlockSize(blockSize)
+{
+	CheckFile(mFile, mFilename);
+
+	mBlock.reserve(mBlockSize);
+}
+
+SpillWriter::~SpillWriter()
+{
+	Close();
+}
+
+void SpillWriter::BeginRecord()
+{
+	mBuffer.clear();
+}
+
+void SpillWriter::EndRecord()
+{
+	AppendUInt(mBlock, mBuffer.size());
+	mBlock.append(mBuffer);
+
+	if (mBlock.size() >= mBlockSize)
+	{
+		FlushBlock();
+	}
+}
+
+void SpillWriter::Close()
+{
+	if (!mFile.is_open())
+	{
+		return;
+	}
+
+	FlushBlock();
+
+	mFile.close();
+}
+
+void SpillWriter::FlushBlock()
+{
+	if (mBlock.empty())
+	{
+		return;
+	}
+
+	mCompressed.resize(LZ4_compressBound(mBlock.size()));
+
+	int compressedSize = LZ4_compress_default(mBlock.data(), &mCompressed[0], mBlock.size(), mCompressed.size());
+	if (compressedSize <= 0)
+	{
+		cerr << "Error: Unable to compress block for " << mFilename << endl;
+		exit(1);
+	}
+
+	uint32_t header[2];
+	header[0] = mBlock.size();
+	header[1] = compressedSize;
+
+	mFile.write((const char*)header, sizeof(header));
+	mFile.write(mCompressed.data(), compressedSize);
+
+	if (!mFile.good())
+	{
+		cerr << "Error: Unable to write to " << mFilename << endl;
+		exit(1);
+	}
+
+	mBlock.clear();
+}
+
+
+SpillReader::SpillReader(const string& filename)
+	: mFilename(filename),
+	  mFile(filename.c_str(), ios::in | ios::binary),
+	  mBlockPosition(0)
+{
+	CheckFile(mFile, mFilename);
+}
+
+bool SpillReader::NextRecord()
+{
+	if (mBlockPosition >= mBlock.size() && !ReadBlock())
+	{
+		return false;
+	}
+
+	// Decode the record length from the remainder of the block
+	Reset(mBlock.data() + mBlockPosition, mBlock.data() + mBlock.size());
+	size_t length = ReadUInt();
+
+	if (length > (size_t)(mEnd - mPosition))
+	{
+		cerr << "Error: Truncated record in " << mFilename << endl;
+		exit(1);
+	}
+
+	Reset(mPosition, mPosition + length);
+	mBlockPosition = mEnd - mBlock.data();
+
+	return true;
+}
+
+bool SpillReader::ReadBlock()
+{
+	uint32_t header[2];
+	if (!mFile.read((char*)header, sizeof(header)))
+	{
+		return false;
+	}
+
+	mCompressed.resize(header[1]);
+	mBlock.resize(header[0]);
+
+	if (!mFile.read(&mCompressed[0], header[1]) ||
+	    LZ4_decompress_safe(mCompressed.data(), &mBlock[0], header[1], header[0]) != (int)header[0])
+	{
+		cerr << "Error: Corrupt block in " << mFilename << endl;
+		exit(1);
+	}
+
+	mBlockPosition = 0;
+
+	return true;
+}
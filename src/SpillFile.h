@@ -0,0 +1,105 @@
+/*
+ *  SpillFile.h
+ *
+ *  Compact on disk format for temporary sorted runs.  Records are length
+ *  prefixed and grouped into LZ4 compressed blocks, with specialized
+ *  encodings for nucleotide sequences and quality strings.
+ *
+ */
+
+#ifndef SPILLFILE_H_
+#define SPILLFILE_H_
+
+#include <fstream>
+#include <string>
+#include <boost/noncopyable.hpp>
+
+using namespace std;
+
+
+// Field encodings for a single record, shared by spill files
+// and records packed in memory
+class RecordEncoder
+{
+public:
+	void WriteUInt(unsigned long value);
+	void WriteInt(long value);
+	void WriteBool(bool value);
+	void WriteString(const string& value);
+
+	// Sequence packed at 2 bits per nucleotide, with non ACGT exceptions
+	void WriteSequence(const string& sequence);
+
+	// Qualities run length encoded if it results in a smaller record
+	void WriteQualities(const string& qualities);
+
+	string& Buffer() { return mBuffer; }
+
+protected:
+	string mBuffer;
+};
+
+class RecordDecoder
+{
+public:
+	RecordDecoder() : mPosition(0), mEnd(0) {}
+	explicit RecordDecoder(const string& record) { Reset(record.data(), record.data() + record.size()); }
+
+	void Reset(const char* begin, const char* end) { mPosition = begin; mEnd = end; }
+
+	unsigned long ReadUInt();
+	long ReadInt();
+	bool ReadBool();
+	void ReadString(string& value);
+	void ReadSequence(string& sequence);
+	void ReadQualities(string& qualities);
+
+protected:
+	unsigned char ReadByte();
+	const char* ReadBytes(size_t length);
+
+	const char* mPosition;
+	const char* mEnd;
+};
+
+class SpillWriter : public RecordEncoder, boost::noncopyable
+{
+public:
+	explicit SpillWriter(const string& filename, int blockSize = 1024 * 1024);
+	~SpillWriter();
+
+	// Records are written between calls to BeginRecord and EndRecord
+	void BeginRecord();
+	void EndRecord();
+
+	void Close();
+
+private:
+	void FlushBlock();
+
+	string mFilename;
+	ofstream mFile;
+	int mBlockSize;
+	string mBlock;
+	string mCompressed;
+};
+
+class SpillReader : public RecordDecoder, boost::noncopyable
+{
+public:
+	explicit SpillReader(const string& filename);
+
+	// Advance to the next record, false at end of file
+	bool NextRecord();
+
+private:
+	bool ReadBlock();
+
+	string mFilename;
+	ifstream mFile;
+	string mBlock;
+	string mCompressed;
+	size_t mBlockPosition;
+};
+
+#endif
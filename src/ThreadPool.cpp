@@ -0,0 +1,77 @@
+/*
+ *  ThreadPool.cpp
+ *
+ */
+
+#include "ThreadPool.h"
+
+#include <boost/bind.hpp>
+
+using namespace std;
+
+
+ThreadPool::ThreadPool(int numThreads) : mNumThreads(numThreads), mStopping(false)
+{
+	for (int threadIndex = 0; threadIndex < mNumThreads; threadIndex++)
+	{
+		mThreads.create_thread(boost::bind(&ThreadPool::Run, this));
+	}
+}
+
+ThreadPool::~ThreadPool()
+{
+	Join();
+}
+
+void ThreadPool::Submit(const boost::function<void()>& task)
+{
+	{
+		boost::mutex::scoped_lock lock(mMutex);
+		mTasks.push_back(task);
+	}
+
+	mTaskAvailable.notify_one();
+}
+
+void ThreadPool::Join()
+{
+	{
+		boost::mutex::scoped_lock lock(mMutex);
+		if (mStopping)
+		{
+			return;
+		}
+		mStopping = true;
+	}
+
+	mTaskAvailable.notify_all();
+	mThreads.join_all();
+}
+
+void ThreadPool::Run()
+{
+	while (true)
+	{
+		boost::function<void()> task;
+
+		{
+			boost::mutex::scoped_lock lock(mMutex);
+
+			while (mTasks.empty() && !mStopping)
+			{
+				mTaskAvailable.wait(lock);
+			}
+
+			// Remaining tasks are drained before stopping
+			if (mTasks.empty())
+			{
+				return;
+			}
+
+			task = mTasks.front();
+			mTasks.pop_front();
+		}
+
+		task();
+	}
+}
@@ -0,0 +1,43 @@
+/*
+ *  ThreadPool.h
+ *
+ */
+
+#ifndef THREADPOOL_H_
+#define THREADPOOL_H_
+
+#include <deque>
+#include <boost/function.hpp>
+#include <boost/thread/thread.hpp>
+#include <boost/thread/mutex.hpp>
+#include <boost/thread/condition_variable.hpp>
+
+using namespace std;
+
+
+class ThreadPool
+{
+public:
+	explicit ThreadPool(int numThreads);
+	~ThreadPool();
+
+	// Queue a task to be run by the next free worker
+	void Submit(const boost::function<void()>& task);
+
+	// Wait for all queued tasks to complete and stop the workers
+	void Join();
+
+	int NumThreads() const { return mNumThreads; }
+
+private:
+	void Run();
+
+	int mNumThreads;
+	bool mStopping;
+	deque<boost::function<void()> > mTasks;
+	boost::mutex mMutex;
+	boost::condition_variable mTaskAvailable;
+	boost::thread_group mThreads;
+};
+
+#endif
@@ -25,6 +25,9 @@ using namespace std;
 
 int main(int argc, char* argv[])
 {
+	// Alignments are usually streamed on stdin
+	ios::sync_with_stdio(false);
+
 	int matchScore;
 	int misMatchScore;
 	int gapScore;
@@ -34,6 +37,7 @@ int main(int argc, char* argv[])
 	string reads1Filename;
 	string reads2Filename;
 	string alignmentsFilename;
+	bool binaryAlignments;
 	string scoresFilename;
 	
 	try
@@ -48,6 +52,7 @@ int main(int argc, char* argv[])
 		TCLAP::ValueArg<string> reads1FilenameArg("1","reads1","Read End 1 Fastq",true,"","string",cmd);
 		TCLAP::ValueArg<string> reads2FilenameArg("2","reads2","Read End 2 Fastq",true,"","string",cmd);
 		TCLAP::ValueArg<string> alignmentsFilenameArg("a","align","Sam Alignments",true,"","string",cmd);
+		TCLAP::SwitchArg binaryAlignmentsArg("","binary","Alignments in Binary Format from destruct_samtobinary",cmd);
 		TCLAP::ValueArg<string> scoresFilenameArg("s","scores","Output Scores Filename",true,"","string",cmd);
 		cmd.parse(argc,argv);
 		
@@ -60,6 +65,7 @@ int main(int argc, char* argv[])
 		reads1Filename = reads1FilenameArg.getValue();
 		reads2Filename = reads2FilenameArg.getValue();
 		alignmentsFilename = alignmentsFilenameArg.getValue();
+		binaryAlignments = binaryAlignmentsArg.getValue();
 		scoresFilename = scoresFilenameArg.getValue();
 	}
 	catch (TCLAP::ArgException &e)
@@ -73,7 +79,7 @@ int main(int argc, char* argv[])
 	cerr << "Reading reference fasta" << endl;
 	
 	Sequences referenceSequences(1000);
-	referenceSequences.Read(referenceFasta);
+	referenceSequences.Load(referenceFasta);
 	
 	cerr << "Reading fastq sequences" << endl;
 	
@@ -91,8 +97,17 @@ int main(int argc, char* argv[])
 	
 	SimpleAligner aligner(matchScore, misMatchScore, gapScore);
 	
-	SamAlignmentStream alignmentStream(alignmentsFilename);
-	FragmentAlignmentStream fragmentAlignmentStream(&alignmentStream);
+	AlignmentStream* alignmentStream;
+	if (binaryAlignments)
+	{
+		alignmentStream = new BinaryAlignmentStream(alignmentsFilename);
+	}
+	else
+	{
+		alignmentStream = new SamAlignmentStream(alignmentsFilename);
+	}
+	
+	FragmentAlignmentStream fragmentAlignmentStream(alignmentStream);
 	
 	RawAlignmentVec alignments;
 	while (fragmentAlignmentStream.GetNextAlignments(alignments))
@@ -185,6 +200,8 @@ int main(int argc, char* argv[])
 			}
 		}
 	}
+
+	delete alignmentStream;
 }
 
 
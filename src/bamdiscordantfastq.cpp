@@ -11,7 +11,11 @@
 #include "RegionDB.h"
 #include "api/BamReader.h"
 #include "DiskPriorityQueue.h"
+#include "DiscordantReads.h"
+#include "ThreadPool.h"
+#include "ParallelGzip.h"
 
+#include <cstring>
 #include <fstream>
 #include <iostream>
 #include <string>
@@ -25,11 +29,15 @@
 #include <boost/accumulators/statistics/max.hpp>
 #include <boost/accumulators/statistics/mean.hpp>
 #include <boost/accumulators/statistics/variance.hpp>
-#include <boost/archive/binary_oarchive.hpp>
-#include <boost/archive/binary_iarchive.hpp>
 #include <boost/iostreams/filtering_stream.hpp>
 #include <boost/iostreams/filtering_streambuf.hpp>
 #include <boost/iostreams/filter/gzip.hpp>
+#include <boost/bind.hpp>
+#include <boost/shared_ptr.hpp>
+#include <boost/thread/thread.hpp>
+#include <boost/thread/mutex.hpp>
+#include <boost/thread/condition_variable.hpp>
+#include <zlib.h>
 
 using namespace boost;
 using namespace std;
@@ -80,85 +88,687 @@ inline bool IsConcordant(const BamAlignment& alignment, int maxFragmentLength, i
 	return concordant;
 }
 
+// Check if an alignment is the primary record of its read, neither secondary
+// nor supplementary (flag 0x800, not provided by bamtools)
+inline bool IsPrimaryRecord(const BamAlignment& alignment)
+{
+	return alignment.IsPrimaryAlignment() && (alignment.AlignmentFlag & 0x800) == 0;
+}
+
 // Store minimal read info
-struct ReadInfo
+inline ReadInfo CreateReadInfo(const BamAlignment& alignment)
+{
+	ReadInfo read;
+	read.Name = alignment.Name;
+	read.Sequence = GetSequence(alignment);
+	read.Qualities = GetQualities(alignment);
+	read.IsFailedQC = alignment.IsFailedQC();
+	return read;
+}
+
+// Fields of a proper pair read needed to classify the pair, with name, sequence
+// and qualities packed, to be unpacked only for sampled or written pairs
+struct BufferedMate
 {
-	ReadInfo() {}
+	BufferedMate() : Length(0), InsertSize(0), IsFailedQC(false), IsConcordant(false) {}
 
-	ReadInfo(const BamAlignment& alignment)
-		: Name(alignment.Name), 
-		  Sequence(GetSequence(alignment)),
-		  Qualities(GetQualities(alignment)),
-		  IsFailedQC(alignment.IsFailedQC())
+	BufferedMate(const BamAlignment& alignment, int maxFragmentLength, int maxSoftClipped)
+		: Length(alignment.Length),
+		  InsertSize(alignment.InsertSize),
+		  IsFailedQC(alignment.IsFailedQC()),
+		  IsConcordant(::IsConcordant(alignment, maxFragmentLength, maxSoftClipped))
 	{
+		RecordEncoder encoder;
+		encoder.WriteString(alignment.Name);
+		encoder.WriteSequence(GetSequence(alignment));
+		encoder.WriteQualities(GetQualities(alignment));
+		PackedRead.swap(encoder.Buffer());
 	}
 
-	string Name;
-	string Sequence;
-	string Qualities;
+	bool HasName(const string& name) const
+	{
+		RecordDecoder decoder(PackedRead);
+		string packedName;
+		decoder.ReadString(packedName);
+		return packedName == name;
+	}
+
+	void Unpack(ReadInfo& read) const
+	{
+		RecordDecoder decoder(PackedRead);
+		decoder.ReadString(read.Name);
+		decoder.ReadSequence(read.Sequence);
+		decoder.ReadQualities(read.Qualities);
+		read.IsFailedQC = IsFailedQC;
+	}
+
+	int Length;
+	int InsertSize;
 	bool IsFailedQC;
+	bool IsConcordant;
+	string PackedRead;
+};
+
+// Read a little endian integer from a bai index
+template <typename TInteger>
+TInteger ReadIndexInteger(istream& indexFile)
+{
+	TInteger value = 0;
+	indexFile.read((char*)&value, sizeof(TInteger));
+	return value;
+}
+
+// Bai index filename, as located by bamtools
+string GetIndexFilename(const string& bamFilename)
+{
+	string indexFilename = bamFilename + ".bai";
+	if (ifstream(indexFilename.c_str()))
+	{
+		return indexFilename;
+	}
+
+	if (bamFilename.length() > 4 && bamFilename.substr(bamFilename.length() - 4) == ".bam")
+	{
+		indexFilename = bamFilename.substr(0, bamFilename.length() - 4) + ".bai";
+		if (ifstream(indexFilename.c_str()))
+		{
+			return indexFilename;
+		}
+	}
+
+	cerr << "Error: Unable to find index for bam file" << endl;
+	exit(1);
+}
+
+// Virtual file offset following the last placed read, the largest chunk end in
+// the bai index, or 0 if no reads are placed
+uint64_t ReadUnplacedOffset(const string& indexFilename)
+{
+	ifstream indexFile(indexFilename.c_str(), ios::binary);
+	CheckFile(indexFile, indexFilename);
+
+	char magic[4];
+	indexFile.read(magic, 4);
+
+	if (!indexFile || memcmp(magic, "BAI\1", 4) != 0)
+	{
+		cerr << "Error: Invalid bam index " << indexFilename << endl;
+		exit(1);
+	}
+
+	// Pseudo bin holding the reference extent followed by mapped and unmapped counts
+	const uint32_t cMetadataBin = 37450;
+
+	uint64_t unplacedOffset = 0;
+
+	int32_t numRefs = ReadIndexInteger<int32_t>(indexFile);
+	for (int32_t refIdx = 0; refIdx < numRefs; refIdx++)
+	{
+		int32_t numBins = ReadIndexInteger<int32_t>(indexFile);
+		for (int32_t binIdx = 0; binIdx < numBins; binIdx++)
+		{
+			uint32_t bin = ReadIndexInteger<uint32_t>(indexFile);
+			int32_t numChunks = ReadIndexInteger<int32_t>(indexFile);
+			for (int32_t chunkIdx = 0; chunkIdx < numChunks; chunkIdx++)
+			{
+				ReadIndexInteger<uint64_t>(indexFile);
+				uint64_t chunkEnd = ReadIndexInteger<uint64_t>(indexFile);
+
+				if (bin != cMetadataBin || chunkIdx == 0)
+				{
+					unplacedOffset = max(unplacedOffset, chunkEnd);
+				}
+			}
+		}
+
+		int32_t numIntervals = ReadIndexInteger<int32_t>(indexFile);
+		indexFile.ignore(numIntervals * sizeof(uint64_t));
+	}
+
+	// Skipping past the end of the file sets only eof
+	if (!indexFile || indexFile.eof())
+	{
+		cerr << "Error: Truncated bam index " << indexFilename << endl;
+		exit(1);
+	}
+
+	return unplacedOffset;
+}
+
+// Reader of the unplaced reads at the end of a bam file, from a virtual file
+// offset taken from the bai index.  bamtools random access stops at the first
+// unplaced read and has no public seek, so bgzf blocks are decompressed and
+// alignment records decoded here, filling the public fields of BamAlignment
+class UnplacedBamReader
+{
+public:
+	UnplacedBamReader() : mOpen(false), mPosition(0) {}
+
+	void Open(const string& bamFilename, uint64_t virtualOffset)
+	{
+		mBamFile.open(bamFilename.c_str(), ios::binary);
+		CheckFile(mBamFile, bamFilename);
+
+		// Block offset in the upper 48 bits, offset within the block in the lower 16
+		mBamFile.seekg(virtualOffset >> 16);
+
+		if (!ReadBlock() || (virtualOffset & 0xFFFF) > mBlock.size())
+		{
+			cerr << "Error: Unable to seek to unplaced reads" << endl;
+			exit(1);
+		}
+
+		mPosition = virtualOffset & 0xFFFF;
+		mOpen = true;
+	}
+
+	bool IsOpen() const
+	{
+		return mOpen;
+	}
+
+	bool GetNextAlignment(BamAlignment& alignment)
+	{
+		int32_t blockSize;
+		if (!ReadBytes((char*)&blockSize, sizeof(blockSize)))
+		{
+			return false;
+		}
+
+		if (blockSize < 32)
+		{
+			cerr << "Error: Invalid bam record" << endl;
+			exit(1);
+		}
+
+		string record(blockSize, '\0');
+		if (!ReadBytes(&record[0], blockSize))
+		{
+			cerr << "Error: Truncated bam record" << endl;
+			exit(1);
+		}
+
+		const char* data = record.data();
+
+		uint8_t nameLength = data[8];
+		uint16_t numCigarOps = *(const uint16_t*)(data + 12);
+		int32_t sequenceLength = *(const int32_t*)(data + 16);
+
+		if (32 + nameLength + 4 * numCigarOps + (sequenceLength + 1) / 2 + sequenceLength > blockSize)
+		{
+			cerr << "Error: Invalid bam record" << endl;
+			exit(1);
+		}
+
+		alignment.RefID = *(const int32_t*)(data + 0);
+		alignment.Position = *(const int32_t*)(data + 4);
+		alignment.MapQuality = (uint8_t)data[9];
+		alignment.Bin = *(const uint16_t*)(data + 10);
+		alignment.AlignmentFlag = *(const uint16_t*)(data + 14);
+		alignment.Length = sequenceLength;
+		alignment.MateRefID = *(const int32_t*)(data + 20);
+		alignment.MatePosition = *(const int32_t*)(data + 24);
+		alignment.InsertSize = *(const int32_t*)(data + 28);
+
+		data += 32;
+
+		alignment.Name.assign(data, nameLength > 0 ? nameLength - 1 : 0);
+		data += nameLength;
+
+		const char* cigarOpTypes = "MIDNSHP=X";
+
+		alignment.CigarData.clear();
+		for (int cigarOpIdx = 0; cigarOpIdx < numCigarOps; cigarOpIdx++)
+		{
+			uint32_t cigarOp = *(const uint32_t*)(data + 4 * cigarOpIdx);
+			alignment.CigarData.push_back(CigarOp(cigarOpTypes[min(cigarOp & 0xF, 8u)], cigarOp >> 4));
+		}
+		data += 4 * numCigarOps;
+
+		const char* bases = "=ACMGRSVTWYHKDBN";
+
+		alignment.QueryBases.resize(sequenceLength);
+		for (int position = 0; position < sequenceLength; position++)
+		{
+			uint8_t packed = data[position / 2];
+			alignment.QueryBases[position] = bases[(position % 2 == 0) ? (packed >> 4) : (packed & 0xF)];
+		}
+		data += (sequenceLength + 1) / 2;
+
+		// Missing qualities are kept as 0xFF, as by bamtools
+		alignment.Qualities.assign(data, sequenceLength);
+		if (sequenceLength > 0 && (uint8_t)data[0] != 0xFF)
+		{
+			for (int position = 0; position < sequenceLength; position++)
+			{
+				alignment.Qualities[position] += 33;
+			}
+		}
+
+		return true;
+	}
+
+private:
+	// Read and decompress the next bgzf block, false at the end of the file
+	bool ReadBlock()
+	{
+		char header[18];
+		mBamFile.read(header, sizeof(header));
+
+		if (mBamFile.gcount() == 0)
+		{
+			return false;
+		}
+
+		// Gzip member with a single BC extra subfield holding the block size
+		if (!mBamFile || (uint8_t)header[0] != 31 || (uint8_t)header[1] != 139 || *(const uint16_t*)(header + 10) != 6 || header[12] != 'B' || header[13] != 'C')
+		{
+			cerr << "Error: Invalid bgzf block" << endl;
+			exit(1);
+		}
+
+		uint16_t blockSize = *(const uint16_t*)(header + 16);
+
+		string compressed(blockSize + 1 - sizeof(header), '\0');
+		mBamFile.read(&compressed[0], compressed.size());
+
+		if (!mBamFile)
+		{
+			cerr << "Error: Truncated bgzf block" << endl;
+			exit(1);
+		}
+
+		uint32_t uncompressedSize = *(const uint32_t*)(compressed.data() + compressed.size() - 4);
+
+		mBlock.resize(uncompressedSize);
+		mPosition = 0;
+
+		if (uncompressedSize == 0)
+		{
+			return true;
+		}
+
+		z_stream stream;
+		memset(&stream, 0, sizeof(stream));
+
+		stream.next_in = (Bytef*)compressed.data();
+		stream.avail_in = compressed.size() - 8;
+		stream.next_out = (Bytef*)&mBlock[0];
+		stream.avail_out = uncompressedSize;
+
+		if (inflateInit2(&stream, -15) != Z_OK || inflate(&stream, Z_FINISH) != Z_STREAM_END || stream.total_out != uncompressedSize)
+		{
+			cerr << "Error: Unable to decompress bgzf block" << endl;
+			exit(1);
+		}
+
+		inflateEnd(&stream);
+
+		return true;
+	}
+
+	// Read bytes spanning blocks, false if no bytes remain
+	bool ReadBytes(char* data, size_t length)
+	{
+		size_t numRead = 0;
+		while (numRead < length)
+		{
+			if (mPosition == mBlock.size() && !ReadBlock())
+			{
+				if (numRead > 0)
+				{
+					cerr << "Error: Truncated bam record" << endl;
+					exit(1);
+				}
+
+				return false;
+			}
+
+			size_t numCopy = min(length - numRead, mBlock.size() - mPosition);
+			memcpy(data + numRead, mBlock.data() + mPosition, numCopy);
+
+			mPosition += numCopy;
+			numRead += numCopy;
+		}
+
+		return true;
+	}
+
+	bool mOpen;
+	ifstream mBamFile;
+	string mBlock;
+	size_t mPosition;
+};
+
+// Region of the bam owned by a shard.  Alignments are owned by the shard
+// containing their start position, unmapped pairs have their own shard
+class BamShard
+{
+public:
+	BamShard() : mWholeBam(true), mUnmapped(false), mRefID(-1), mStart(0), mEnd(0) {}
+
+	// Parse region as ref:start-end, 0-based half open, or * for unmapped pairs
+	void SetRegion(BamReader& bamReader, UnplacedBamReader& unplacedReader, const string& bamFilename, const string& region)
+	{
+		mWholeBam = false;
+
+		if (region == "*")
+		{
+			mUnmapped = true;
+
+			// Unplaced reads follow all placed reads, start reading after the placed
+			// reads, or read the whole bam if none are placed
+			uint64_t unplacedOffset = ReadUnplacedOffset(GetIndexFilename(bamFilename));
+			if (unplacedOffset != 0)
+			{
+				unplacedReader.Open(bamFilename, unplacedOffset);
+			}
+
+			return;
+		}
+
+		string::size_type refEnd = region.find_last_of(':');
+		string::size_type startEnd = region.find_last_of('-');
+		if (refEnd == string::npos || startEnd == string::npos || startEnd < refEnd)
+		{
+			cerr << "Error: Unable to interpret region " << region << endl;
+			exit(1);
+		}
+
+		string refName = region.substr(0, refEnd);
+		mStart = SAFEPARSE(int, region.substr(refEnd + 1, startEnd - refEnd - 1));
+		mEnd = SAFEPARSE(int, region.substr(startEnd + 1));
+
+		mRefID = bamReader.GetReferenceID(refName);
+		if (mRefID < 0)
+		{
+			cerr << "Error: Unable to find reference " << refName << endl;
+			exit(1);
+		}
+
+		if (!bamReader.LocateIndex())
+		{
+			cerr << "Error: Unable to find index for bam file" << endl;
+			exit(1);
+		}
+
+		if (!bamReader.SetRegion(BamRegion(mRefID, mStart, mRefID, mEnd)))
+		{
+			cerr << "Error: Unable to set region " << region << endl;
+			exit(1);
+		}
+	}
+
+	bool IsWholeBam() const
+	{
+		return mWholeBam;
+	}
+
+	bool IsUnmapped() const
+	{
+		return mUnmapped;
+	}
+
+	bool Contains(int refID, int position) const
+	{
+		if (mWholeBam)
+		{
+			return true;
+		}
+
+		if (mUnmapped)
+		{
+			return refID == -1;
+		}
+
+		return refID == mRefID && position >= mStart && position < mEnd;
+	}
+
+private:
+	bool mWholeBam;
+	bool mUnmapped;
+	int mRefID;
+	int mStart;
+	int mEnd;
+};
+
+// Optionally decode alignments on a dedicated thread, handing them over in
+// batches so that bgzf decompression overlaps pairing and fastq output
+class PrefetchBamReader
+{
+public:
+	PrefetchBamReader(BamReader& bamReader, UnplacedBamReader& unplacedReader, const BamShard& shard, bool prefetch,
+	                  int batchSize = 4096, int maxBatches = 16)
+		: mBamReader(bamReader),
+		  mUnplacedReader(unplacedReader),
+		  mShard(shard),
+		  mPrefetch(prefetch),
+		  mBatchSize(batchSize),
+		  mMaxBatches(maxBatches),
+		  mFinished(false),
+		  mStopping(false),
+		  mCurrentIndex(0)
+	{
+		if (mPrefetch)
+		{
+			mThread = boost::thread(boost::bind(&PrefetchBamReader::Run, this));
+		}
+	}
+
+	~PrefetchBamReader()
+	{
+		if (mPrefetch)
+		{
+			{
+				boost::mutex::scoped_lock lock(mMutex);
+				mStopping = true;
+			}
+
+			mBatchConsumed.notify_all();
+			mThread.join();
+		}
+	}
+
+	bool GetNextAlignment(BamAlignment& alignment)
+	{
+		if (!mPrefetch)
+		{
+			return ReadOwnedAlignment(alignment);
+		}
+
+		if (!mCurrent || mCurrentIndex >= mCurrent->size())
+		{
+			boost::mutex::scoped_lock lock(mMutex);
+
+			while (mBatches.empty() && !mFinished)
+			{
+				mBatchAvailable.wait(lock);
+			}
+
+			if (mBatches.empty())
+			{
+				return false;
+			}
+
+			mCurrent = mBatches.front();
+			mCurrentIndex = 0;
+
+			mBatches.pop_front();
+			mBatchConsumed.notify_one();
+		}
+
+		alignment = (*mCurrent)[mCurrentIndex++];
+
+		return true;
+	}
+
+private:
+	typedef boost::shared_ptr<vector<BamAlignment> > BatchPtr;
+
+	bool ReadOwnedAlignment(BamAlignment& alignment)
+	{
+		if (mShard.IsUnmapped())
+		{
+			if (mUnplacedReader.IsOpen())
+			{
+				while (mUnplacedReader.GetNextAlignment(alignment))
+				{
+					if (alignment.RefID == -1)
+					{
+						return true;
+					}
+				}
 
-	// Used for sorting by read name
-	bool operator<(const ReadInfo& other) const
+				return false;
+			}
+
+			// Skip decoding the character data of alignments with a reference
+			while (mBamReader.GetNextAlignmentCore(alignment))
+			{
+				if (alignment.RefID == -1)
+				{
+					alignment.BuildCharData();
+					return true;
+				}
+			}
+
+			return false;
+		}
+
+		while (mBamReader.GetNextAlignment(alignment))
+		{
+			if (mShard.Contains(alignment.RefID, alignment.Position))
+			{
+				return true;
+			}
+		}
+
+		return false;
+	}
+
+	void Run()
 	{
-		return Name < other.Name;
+		bool good = true;
+		while (good)
+		{
+			BatchPtr batch(new vector<BamAlignment>(mBatchSize));
+
+			int batchCount = 0;
+			while (batchCount < mBatchSize && (good = ReadOwnedAlignment((*batch)[batchCount])))
+			{
+				batchCount++;
+			}
+			batch->resize(batchCount);
+
+			boost::mutex::scoped_lock lock(mMutex);
+
+			while (mBatches.size() >= mMaxBatches && !mStopping)
+			{
+				mBatchConsumed.wait(lock);
+			}
+
+			if (mStopping)
+			{
+				break;
+			}
+
+			if (batchCount > 0)
+			{
+				mBatches.push_back(batch);
+				mBatchAvailable.notify_one();
+			}
+		}
+
+		boost::mutex::scoped_lock lock(mMutex);
+		mFinished = true;
+		mBatchAvailable.notify_all();
 	}
 
-	// Serialization for on disk sort
-    template<class Archive>
-    void serialize(Archive & ar, const unsigned int version)
-    {
-        ar & Name;
-        ar & Sequence;
-        ar & Qualities;
-        ar & IsFailedQC;
-    }
+	BamReader& mBamReader;
+	UnplacedBamReader& mUnplacedReader;
+	const BamShard& mShard;
+	bool mPrefetch;
+	int mBatchSize;
+	int mMaxBatches;
+	bool mFinished;
+	bool mStopping;
+	deque<BatchPtr> mBatches;
+	BatchPtr mCurrent;
+	size_t mCurrentIndex;
+	boost::mutex mMutex;
+	boost::condition_variable mBatchAvailable;
+	boost::condition_variable mBatchConsumed;
+	boost::thread mThread;
 };
 
 class PairedBamReader
 {
 public:
-	PairedBamReader(BamReader& bamReader, const string& tempsPrefix)
+	PairedBamReader(PrefetchBamReader& bamReader, const BamShard& shard, const string& tempsPrefix,
+	                int maxFragmentLength, int maxSoftClipped, long spillMemory, int spillFanIn)
 		: mBamReader(bamReader),
+		  mShard(shard),
 		  mBamReadFinished(false),
-		  mDiscordantReadQueue1(tempsPrefix + "_1_", 1024*1024),
-		  mDiscordantReadQueue2(tempsPrefix + "_2_", 1024*1024)
+		  mMaxFragmentLength(maxFragmentLength),
+		  mMaxSoftClipped(maxSoftClipped),
+		  mDiscordantReadQueue1(tempsPrefix + "_1_", spillMemory / 3, spillFanIn),
+		  mDiscordantReadQueue2(tempsPrefix + "_2_", spillMemory / 3, spillFanIn),
+		  mOrphanReadQueue(tempsPrefix + "_orphan_", spillMemory / 3, spillFanIn)
 	{
 	}
 	
-	bool NextConcordant(BamAlignment& alignment1, BamAlignment& alignment2)
+	// Next proper pair as the current alignment and its buffered mate
+	bool NextConcordant(BamAlignment& alignment, BufferedMate& mate)
 	{
 		if (!mBamReadFinished)
 		{
-			BamAlignment alignment;
 			while (mBamReader.GetNextAlignment(alignment))
 			{
-				if (alignment.IsProperPair())
+				if (!mShard.Contains(alignment.MateRefID, alignment.MatePosition))
+				{
+					// Mate is owned by another shard, store in an on disk
+					// priority queue to be paired when shards are merged
+
+					OrphanRead orphan;
+					orphan.Read = CreateReadInfo(alignment);
+					orphan.ReadEnd = alignment.IsFirstMate() ? 0 : 1;
+					orphan.IsProperPair = alignment.IsProperPair();
+					orphan.IsConcordant = IsConcordant(alignment, mMaxFragmentLength, mMaxSoftClipped);
+					orphan.FragmentLength = abs(alignment.InsertSize);
+
+					mOrphanReadQueue.Push(orphan);
+				}
+				else if (alignment.IsProperPair())
 				{
 					// Proper pairs should be close to each other in the bam file
-					// store proper pairs in a buffer and match them on the fly
+					// store proper pairs in a compact buffer keyed by a hash of
+					// the read name, and match them on the fly by full name
 
 					int readEnd = alignment.IsFirstMate() ? 0 : 1;
 					int otherReadEnd = 1 - readEnd;
 
-					// Search for other end already in the buffer
-					unordered_map<string,BamAlignment>::iterator otherEndIter = mConcordantReadBuffer[otherReadEnd].find(alignment.Name);
+					size_t nameHash = hash_value(alignment.Name);
+
+					// Search for other end already in the buffer, reads with
+					// colliding name hashes share a key
+					pair<BufferedMateMap::iterator,BufferedMateMap::iterator> otherEndRange = mConcordantReadBuffer[otherReadEnd].equal_range(nameHash);
+					
+					BufferedMateMap::iterator otherEndIter = otherEndRange.first;
+					while (otherEndIter != otherEndRange.second && !otherEndIter->second.HasName(alignment.Name))
+					{
+						otherEndIter++;
+					}
 					
-					if (otherEndIter != mConcordantReadBuffer[otherReadEnd].end())
+					if (otherEndIter != otherEndRange.second)
 					{
-						// Return this alignment and other end alignment
+						// Return this alignment and other end,
 						// erase other end from the buffer
 
-						if (alignment.IsFirstMate())
-						{
-							alignment1 = alignment;
-							alignment2 = otherEndIter->second;
-						}
-						else
-						{
-							alignment1 = otherEndIter->second;
-							alignment2 = alignment;
-						}
+						mate.PackedRead.swap(otherEndIter->second.PackedRead);
+						mate.Length = otherEndIter->second.Length;
+						mate.InsertSize = otherEndIter->second.InsertSize;
+						mate.IsFailedQC = otherEndIter->second.IsFailedQC;
+						mate.IsConcordant = otherEndIter->second.IsConcordant;
 						
 						mConcordantReadBuffer[otherReadEnd].erase(otherEndIter);
 						
@@ -167,7 +777,7 @@ public:
 					else
 					{
 						// Insert alignment into the buffer
-						mConcordantReadBuffer[readEnd].insert(make_pair(alignment.Name, alignment));
+						mConcordantReadBuffer[readEnd].insert(make_pair(nameHash, BufferedMate(alignment, mMaxFragmentLength, mMaxSoftClipped)));
 					}
 				}
 				else
@@ -177,11 +787,11 @@ public:
 
 					if (alignment.IsFirstMate())
 					{
-						mDiscordantReadQueue1.Push(ReadInfo(alignment));
+						mDiscordantReadQueue1.Push(CreateReadInfo(alignment));
 					}
 					else
 					{
-						mDiscordantReadQueue2.Push(ReadInfo(alignment));
+						mDiscordantReadQueue2.Push(CreateReadInfo(alignment));
 					}
 				}
 			}
@@ -189,6 +799,7 @@ public:
 			// If we just read the last alignment, finalize the on disk priority queue
 			mDiscordantReadQueue1.Finalize();
 			mDiscordantReadQueue2.Finalize();
+			mOrphanReadQueue.Finalize();
 
 			mBamReadFinished = true;
 		}
@@ -227,79 +838,216 @@ public:
 
 		return false;
 	}
+
+	bool NextOrphan(OrphanRead& orphan)
+	{
+		assert(mBamReadFinished);
+
+		if (mOrphanReadQueue.Empty())
+		{
+			return false;
+		}
+
+		orphan = mOrphanReadQueue.Top();
+		mOrphanReadQueue.Pop();
+
+		return true;
+	}
 	
 private:
-	BamReader& mBamReader;
+	PrefetchBamReader& mBamReader;
+	const BamShard& mShard;
 	bool mBamReadFinished;
+	int mMaxFragmentLength;
+	int mMaxSoftClipped;
 
-	unordered_map<string,BamAlignment> mConcordantReadBuffer[2];
+	typedef unordered_multimap<size_t,BufferedMate> BufferedMateMap;
+	BufferedMateMap mConcordantReadBuffer[2];
 
 	DiskPriorityQueue<ReadInfo> mDiscordantReadQueue1;
 	DiskPriorityQueue<ReadInfo> mDiscordantReadQueue2;
+	DiskPriorityQueue<OrphanRead> mOrphanReadQueue;
 };
 
-template<typename T>
-struct ReservoirSampler
+// Pairs from a queryname sorted or collated bam, in which all alignments
+// of a fragment are adjacent
+class CollatedPairReader
 {
-	ReservoirSampler(int numSamples) : mNumSamples(numSamples), mNumValues(0) {}
-
-	void AddSample(const T& value)
+public:
+	explicit CollatedPairReader(PrefetchBamReader& bamReader)
+		: mBamReader(bamReader)
 	{
-		mNumValues++;
+		mHasNext = NextPrimary(mNext);
+	}
 
-		if (mSamples.size() < mNumSamples)
+	bool NextPair(BamAlignment& alignment1, BamAlignment& alignment2)
+	{
+		while (mHasNext)
 		{
-			mSamples.push_back(value);
+			// Take the primary alignment of each end from the alignments
+			// sharing the next name, skipping fragments missing an end
+			string name = mNext.Name;
+			bool found[2] = {false, false};
+
+			while (mHasNext && mNext.Name == name)
+			{
+				int readEnd = mNext.IsFirstMate() ? 0 : 1;
+
+				if (!found[readEnd])
+				{
+					if (readEnd == 0)
+					{
+						alignment1 = mNext;
+					}
+					else
+					{
+						alignment2 = mNext;
+					}
+
+					found[readEnd] = true;
+				}
+
+				mHasNext = NextPrimary(mNext);
+			}
+
+			if (found[0] && found[1])
+			{
+				return true;
+			}
 		}
-		else
+
+		return false;
+	}
+
+private:
+	// Next alignment, skipping secondary and supplementary alignments
+	bool NextPrimary(BamAlignment& alignment)
+	{
+		while (mBamReader.GetNextAlignment(alignment))
 		{
-			long sampleIndex = mRNG.Next((long)0, mNumValues - 1);
-			if (sampleIndex < mNumSamples)
+			if (IsPrimaryRecord(alignment))
 			{
-				mSamples[sampleIndex] = value;
+				return true;
 			}
 		}
-	}
 
-	int mNumSamples;
-	long mNumValues;
-	vector<T> mSamples;
-	RandomNumberGenerator mRNG;	
-};
+		return false;
+	}
 
-const char empty_gz[] = {
-	0x1f,
-	0x8b,
-	0x8,
-	0x8,
-	0x34,
-	0x1d,
-	0x1e,
-	0x5e,
-	0x0,
-	0x3,
-	0x61,
-	0x73,
-	0x64,
-	0x66,
-	0x0,
-	0x3,
-	0x0,
-	0x0,
-	0x0,
-	0x0,
-	0x0,
-	0x0,
-	0x0,
-	0x0,
-	0x0,
+	PrefetchBamReader& mBamReader;
+	bool mHasNext;
+	BamAlignment mNext;
 };
-unsigned int empty_gz_len = 25;
 
-void write_empty_gz(ofstream& file)
+// Classify read pairs, update stats and the reservoir sample,
+// and write discordant pairs to fastq
+class ReadPairClassifier
 {
-	file.write(empty_gz, empty_gz_len);
-}
+public:
+	ReadPairClassifier(ConcordantStats& stats, ReservoirSampler<pair<ReadInfo,ReadInfo> >& sampledReads,
+	                   PairedFastqWriter& fastqWriter, bool renameReads, int maxFragmentLength, int maxSoftClipped)
+		: mStats(stats),
+		  mSampledReads(sampledReads),
+		  mFastqWriter(fastqWriter),
+		  mRenameReads(renameReads),
+		  mMaxFragmentLength(maxFragmentLength),
+		  mMaxSoftClipped(maxSoftClipped),
+		  mFragmentIndex(0)
+	{
+	}
+
+	void AddProperPair(const BamAlignment& alignment, const BufferedMate& mate)
+	{
+		// Ignore all failed reads
+		if (alignment.IsFailedQC() || mate.IsFailedQC)
+		{
+			return;
+		}
+
+		mStats.ConcordantReadCount++;
+
+		pair<ReadInfo,ReadInfo>* sample = mSampledReads.NextSample();
+
+		// Update read length histogram for all reads
+		mStats.AddReadLength(alignment.Length);
+		mStats.AddReadLength(mate.Length);
+
+		bool concordant = IsConcordant(alignment, mMaxFragmentLength, mMaxSoftClipped) && mate.IsConcordant;
+
+		// Reads are only required for sampled or discordant pairs
+		if (sample != 0 || !concordant)
+		{
+			ReadInfo read = CreateReadInfo(alignment);
+			ReadInfo mateRead;
+			mate.Unpack(mateRead);
+
+			const ReadInfo& read1 = alignment.IsFirstMate() ? read : mateRead;
+			const ReadInfo& read2 = alignment.IsFirstMate() ? mateRead : read;
+
+			if (sample != 0)
+			{
+				*sample = make_pair(read1, read2);
+			}
+
+			if (!concordant)
+			{
+				WriteFastq(read1, read2);
+			}
+		}
+
+		if (concordant)
+		{
+			// Update fragment length histogram for concordant reads
+			mStats.AddFragmentLength(abs(alignment.InsertSize));
+		}
+		else
+		{
+			mStats.DiscordantReadCount++;
+		}
+	}
+
+	void AddImproperPair(const ReadInfo& read1, const ReadInfo& read2)
+	{
+		// Ignore all failed reads
+		if (read1.IsFailedQC || read2.IsFailedQC)
+		{
+			return;
+		}
+
+		mStats.DiscordantReadCount++;
+
+		mSampledReads.AddSample(make_pair(read1, read2));
+
+		// Update read length histogram for all reads
+		mStats.AddReadLength(read1.Sequence.length());
+		mStats.AddReadLength(read2.Sequence.length());
+
+		WriteFastq(read1, read2);
+	}
+
+private:
+	void WriteFastq(const ReadInfo& read1, const ReadInfo& read2)
+	{
+		// Optionally change the fragment name
+		string fragment = read1.Name;
+		if (mRenameReads)
+		{
+			fragment = lexical_cast<string>(mFragmentIndex);
+		}
+
+		mFastqWriter.Write(fragment, read1, read2);
+
+		mFragmentIndex++;
+	}
+
+	ConcordantStats& mStats;
+	ReservoirSampler<pair<ReadInfo,ReadInfo> >& mSampledReads;
+	PairedFastqWriter& mFastqWriter;
+	bool mRenameReads;
+	int mMaxFragmentLength;
+	int mMaxSoftClipped;
+	long mFragmentIndex;
+};
 
 int main(int argc, char* argv[])
 {
@@ -314,6 +1062,12 @@ int main(int argc, char* argv[])
 	string sample2Filename;
 	int numSamples;
 	bool renameReads;
+	int numThreads;
+	string region;
+	string orphansFilename;
+	int spillMemoryMB;
+	int spillFanIn;
+	bool collated;
 	
 	try
 	{
@@ -329,6 +1083,12 @@ int main(int argc, char* argv[])
 		TCLAP::ValueArg<string> sample2FilenameArg("","sample2","Sample Fastq End 2 Filename",true,"","string",cmd);
 		TCLAP::ValueArg<int> numSamplesArg("n","num","Number of Samples",true,0,"integer",cmd);
 		TCLAP::SwitchArg renameReadsArg("r","rename","Rename With Integer IDs",cmd);
+		TCLAP::ValueArg<int> numThreadsArg("","threads","Number of Threads for Bam Decoding and Fastq Compression",false,1,"integer",cmd);
+		TCLAP::ValueArg<string> regionArg("","region","Shard Region as ref:start-end (0-based, half open), or * for Unmapped Pairs",false,"","string",cmd);
+		TCLAP::ValueArg<string> orphansFilenameArg("","orphans","Orphan Reads Filename for Shard Region",false,"","string",cmd);
+		TCLAP::ValueArg<int> spillMemoryMBArg("","spillmem","Memory Budget in MB for Buffering Discordant Reads Before Spilling to Disk",false,1024,"integer",cmd);
+		TCLAP::ValueArg<int> spillFanInArg("","spillfanin","Maximum Number of Spill Files Merged at Once",false,64,"integer",cmd);
+		TCLAP::SwitchArg collatedArg("","collated","Bam is Queryname Sorted or Collated, Detected From the Header if Not Set",cmd);
 		cmd.parse(argc,argv);
 		
 		bamFilename = bamFilenameArg.getValue();
@@ -342,17 +1102,29 @@ int main(int argc, char* argv[])
 		sample2Filename = sample2FilenameArg.getValue();
 		numSamples = numSamplesArg.getValue();
 		renameReads = renameReadsArg.getValue();
+		numThreads = numThreadsArg.getValue();
+		region = regionArg.getValue();
+		orphansFilename = orphansFilenameArg.getValue();
+		spillMemoryMB = spillMemoryMBArg.getValue();
+		spillFanIn = spillFanInArg.getValue();
+		collated = collatedArg.getValue();
 	}
 	catch (TCLAP::ArgException &e)
 	{
 		cerr << "error: " << e.error() << " for arg " << e.argId() << endl;
 		exit(1);
 	}
+
+	bool isShard = !region.empty();
+
+	// Shards keep original read names, renaming is done by the merge
+	if (isShard && (orphansFilename.empty() || renameReads))
+	{
+		cerr << "Error: --region requires --orphans and is incompatible with --rename" << endl;
+		exit(1);
+	}
 	
-	long concordantReadCount = 0;
-	long discordantReadCount = 0;
-	unordered_map<int,int> readLengthHist;
-	unordered_map<int,int> fragmentLengthHist;
+	ConcordantStats stats;
 	
 	BamReader bamReader;
 	if (!bamReader.Open(bamFilename))
@@ -361,236 +1133,140 @@ int main(int argc, char* argv[])
 		exit(1);
 	}
 
-	PairedBamReader pairedReader(bamReader, tempsPrefix);
+	// Mates are adjacent in queryname sorted and collated bams
+	const SamHeader header = bamReader.GetHeader();
+	if (header.SortOrder == "queryname" || header.GroupOrder == "query")
+	{
+		collated = true;
+	}
 
-	ofstream fastq1File(fastq1Filename.c_str(), std::ios_base::out | std::ios_base::binary);
-	ofstream fastq2File(fastq2Filename.c_str(), std::ios_base::out | std::ios_base::binary);
+	if (isShard && collated)
+	{
+		cerr << "Error: --region requires a coordinate sorted bam" << endl;
+		exit(1);
+	}
 
-	CheckFile(fastq1File, fastq1Filename);
-	CheckFile(fastq2File, fastq2Filename);
-	
-	iostreams::filtering_ostream fastq1Stream;
-	iostreams::filtering_ostream fastq2Stream;
+	BamShard shard;
+	UnplacedBamReader unplacedReader;
+	if (isShard)
+	{
+		shard.SetRegion(bamReader, unplacedReader, bamFilename, region);
+	}
 
-	fastq1Stream.push(iostreams::gzip_compressor());
-	fastq2Stream.push(iostreams::gzip_compressor());
+	// With multiple threads, decode the bam on its own thread and
+	// compress output blocks on the remaining threads
+	bool multiThreaded = (numThreads > 1);
+	ThreadPool compressPool(multiThreaded ? max(1, numThreads - 1) : 0);
 
-	fastq1Stream.push(fastq1File);
-	fastq2Stream.push(fastq2File);
+	PrefetchBamReader prefetchReader(bamReader, unplacedReader, shard, multiThreaded);
+
+	PairedFastqWriter fastqWriter(fastq1Filename, fastq2Filename, compressPool);
 
 	ReservoirSampler<pair<ReadInfo,ReadInfo> > sampledReads(numSamples);
 
-	long fragmentIndex = 0;
+	ReadPairClassifier classifier(stats, sampledReads, fastqWriter, renameReads, maxFragmentLength, maxSoftClipped);
 
-	BamAlignment alignment1;
-	BamAlignment alignment2;
-	while (pairedReader.NextConcordant(alignment1, alignment2))
+	if (collated)
 	{
-		// Ignore all failed reads
-		if (alignment1.IsFailedQC() || alignment2.IsFailedQC())
-		{
-			continue;
-		}
-
-		concordantReadCount++;
-
-		sampledReads.AddSample(make_pair(ReadInfo(alignment1), ReadInfo(alignment2)));
-
-		// Update read length histogram for all reads
-		readLengthHist.insert(make_pair(alignment1.Length, 0)).first->second++;
-		readLengthHist.insert(make_pair(alignment2.Length, 0)).first->second++;
+		// Mates are adjacent, pair them in a single streaming pass
+		CollatedPairReader pairReader(prefetchReader);
 
-		if (IsConcordant(alignment1, maxFragmentLength, maxSoftClipped) && IsConcordant(alignment2, maxFragmentLength, maxSoftClipped))
+		BamAlignment alignment1;
+		BamAlignment alignment2;
+		while (pairReader.NextPair(alignment1, alignment2))
 		{
-			// Update fragment length histogram for concordant reads
-			fragmentLengthHist.insert(make_pair(abs(alignment1.InsertSize), 0)).first->second++;
-		}
-		else
-		{
-			discordantReadCount++;
-
-			// Optionally change the fragment name
-			string fragment = alignment1.Name;
-			if (renameReads)
+			if (alignment1.IsProperPair())
 			{
-				stringstream fragmentStream;
-				fragmentStream << fragmentIndex;
-				fragment = fragmentStream.str();
+				classifier.AddProperPair(alignment2, BufferedMate(alignment1, maxFragmentLength, maxSoftClipped));
+			}
+			else
+			{
+				classifier.AddImproperPair(CreateReadInfo(alignment1), CreateReadInfo(alignment2));
 			}
-
-			// Write fastq
-			
-			fastq1Stream << "@" << fragment << "/1" << endl;
-			fastq1Stream << GetSequence(alignment1) << endl;
-			fastq1Stream << "+" << alignment1.Name << endl;
-			fastq1Stream << GetQualities(alignment1) << endl;
-			
-			fastq2Stream << "@" << fragment << "/2" << endl;
-			fastq2Stream << GetSequence(alignment2) << endl;
-			fastq2Stream << "+" << alignment2.Name << endl;
-			fastq2Stream << GetQualities(alignment2) << endl;
-			
-			fragmentIndex++;
 		}
-	}
 
-	ReadInfo discordantRead1;
-	ReadInfo discordantRead2;
-	while (pairedReader.NextDiscordant(discordantRead1, discordantRead2))
+		fastqWriter.Close();
+	}
+	else
 	{
-		// Ignore all failed reads
-		if (discordantRead1.IsFailedQC || discordantRead2.IsFailedQC)
+		PairedBamReader pairedReader(prefetchReader, shard, tempsPrefix, maxFragmentLength, maxSoftClipped,
+		                             (long)spillMemoryMB * 1024 * 1024, spillFanIn);
+
+		BamAlignment alignment;
+		BufferedMate mate;
+		while (pairedReader.NextConcordant(alignment, mate))
 		{
-			continue;
+			classifier.AddProperPair(alignment, mate);
 		}
 
-		discordantReadCount++;
-
-		sampledReads.AddSample(make_pair(discordantRead1, discordantRead2));
-
-		// Update read length histogram for all reads
-		readLengthHist.insert(make_pair(alignment1.Length, 0)).first->second++;
-		readLengthHist.insert(make_pair(alignment2.Length, 0)).first->second++;
-
-		// Optionally change the fragment name
-		string fragment = discordantRead1.Name;
-		if (renameReads)
+		ReadInfo discordantRead1;
+		ReadInfo discordantRead2;
+		while (pairedReader.NextDiscordant(discordantRead1, discordantRead2))
 		{
-			stringstream fragmentStream;
-			fragmentStream << fragmentIndex;
-			fragment = fragmentStream.str();
+			classifier.AddImproperPair(discordantRead1, discordantRead2);
 		}
 
-		// Write fastq
-		
-		fastq1Stream << "@" << fragment << "/1" << endl;
-		fastq1Stream << discordantRead1.Sequence << endl;
-		fastq1Stream << "+" << discordantRead1.Name << endl;
-		fastq1Stream << discordantRead1.Qualities << endl;
-		
-		fastq2Stream << "@" << fragment << "/2" << endl;
-		fastq2Stream << discordantRead2.Sequence << endl;
-		fastq2Stream << "+" << discordantRead2.Name << endl;
-		fastq2Stream << discordantRead2.Qualities << endl;
-		
-		fragmentIndex++;
-	}
-
-	fastq1Stream.flush();
-	fastq1Stream.reset();
-
-	fastq2Stream.flush();
-	fastq2Stream.reset();
+		fastqWriter.Close();
 
-	fastq1File.close();
-	fastq2File.close();
+		// Write reads with mates in other shards, sorted by name
+		if (isShard)
+		{
+			ofstream orphansFile(orphansFilename.c_str(), std::ios_base::out | std::ios_base::binary);
+			CheckFile(orphansFile, orphansFilename);
 
-	// Ensure we have valid output on empty input
-	if (discordantReadCount == 0)
-	{
-		ofstream fastq1File(fastq1Filename.c_str(), std::ios_base::out | std::ios_base::binary);
-		ofstream fastq2File(fastq2Filename.c_str(), std::ios_base::out | std::ios_base::binary);
+			iostreams::filtering_ostream orphansStream;
+			orphansStream.push(iostreams::gzip_compressor());
+			orphansStream.push(orphansFile);
 
-		CheckFile(fastq1File, fastq1Filename);
-		CheckFile(fastq2File, fastq2Filename);
+			OrphanRead orphan;
+			while (pairedReader.NextOrphan(orphan))
+			{
+				orphansStream << orphan;
+			}
 
-		write_empty_gz(fastq1File);
-		write_empty_gz(fastq2File);
-	}
+			orphansStream.flush();
+			orphansStream.reset();
 
-	// Check for an empty bam file (fail, somethings wrong)
-	if (concordantReadCount + discordantReadCount == 0)
-	{
-		cerr << "Error: No reads" << endl;
-	}
-	
-	// Check for a bam file with no concordant reads (fail, somethings wrong)
-	if (concordantReadCount == 0)
-	{
-		cerr << "Warning: No concordant reads" << endl;
-	}
-	
-	// Check for a bam file with no discordant reads (usually somethings wrong)
-	if (discordantReadCount == 0)
-	{
-		cerr << "Error: No discordant reads" << endl;
+			orphansFile.close();
+		}
 	}
-	
-	// Output stats
-	ofstream statsFile(statsFilename.c_str());
-	CheckFile(statsFile, statsFilename);
-	statsFile << "type\tkey\tvalue\n";
 
-	// Output read counts
-	statsFile << "read_count\ttotal\t" << concordantReadCount + discordantReadCount << endl;
-	statsFile << "read_count\tconcordant\t" << concordantReadCount << endl;
-	statsFile << "read_count\tdiscordant\t" << discordantReadCount << endl;
-
-	// Output read lengths
-	for (unordered_map<int,int>::const_iterator iter = readLengthHist.begin(); iter != readLengthHist.end(); iter++)
+	// Shards of the bam may legitimately be empty
+	if (!isShard)
 	{
-		statsFile << "read_length\t" << iter->first << "\t" << iter->second << endl;
+		// Check for an empty bam file (fail, somethings wrong)
+		if (stats.ConcordantReadCount + stats.DiscordantReadCount == 0)
+		{
+			cerr << "Error: No reads" << endl;
+		}
+		
+		// Check for a bam file with no concordant reads (fail, somethings wrong)
+		if (stats.ConcordantReadCount == 0)
+		{
+			cerr << "Warning: No concordant reads" << endl;
+		}
+		
+		// Check for a bam file with no discordant reads (usually somethings wrong)
+		if (stats.DiscordantReadCount == 0)
+		{
+			cerr << "Error: No discordant reads" << endl;
+		}
 	}
 	
-	// Output fragment lengths
-	for (unordered_map<int,int>::const_iterator iter = fragmentLengthHist.begin(); iter != fragmentLengthHist.end(); iter++)
-	{
-		statsFile << "fragment_length\t" << iter->first << "\t" << iter->second << endl;
-	}
+	// Output stats, including the number of pairs sampled from for shards
+	stats.SampledReadCount = sampledReads.mNumValues;
+	stats.Write(statsFilename, isShard);
 
 	// Write out sampled reads
-	ofstream sample1File(sample1Filename.c_str(), std::ios_base::out | std::ios_base::binary);
-	ofstream sample2File(sample2Filename.c_str(), std::ios_base::out | std::ios_base::binary);
-
-	CheckFile(sample1File, sample1Filename);
-	CheckFile(sample2File, sample2Filename);
-	
-	iostreams::filtering_ostream sample1Stream;
-	iostreams::filtering_ostream sample2Stream;
-
-	sample1Stream.push(iostreams::gzip_compressor());
-	sample2Stream.push(iostreams::gzip_compressor());
+	PairedFastqWriter sampleWriter(sample1Filename, sample2Filename, compressPool);
 
-	sample1Stream.push(sample1File);
-	sample2Stream.push(sample2File);
-
-	int sampleIndex = 0;
-	for (; sampleIndex < sampledReads.mSamples.size(); sampleIndex++)
+	for (int sampleIndex = 0; sampleIndex < sampledReads.mSamples.size(); sampleIndex++)
 	{
 		const ReadInfo& read1 = sampledReads.mSamples[sampleIndex].first;
 		const ReadInfo& read2 = sampledReads.mSamples[sampleIndex].second;
 
-		sample1Stream << "@" << sampleIndex << "/1" << endl;
-		sample1Stream << read1.Sequence << endl;
-		sample1Stream << "+" << read1.Name << endl;
-		sample1Stream << read1.Qualities << endl;
-		
-		sample2Stream << "@" << sampleIndex << "/2" << endl;
-		sample2Stream << read2.Sequence << endl;
-		sample2Stream << "+" << read2.Name << endl;
-		sample2Stream << read2.Qualities << endl;
+		sampleWriter.Write(lexical_cast<string>(sampleIndex), read1, read2);
 	}
 
-	sample1Stream.flush();
-	sample1Stream.reset();
-
-	sample2Stream.flush();
-	sample2Stream.reset();
-
-	sample1File.close();
-	sample2File.close();
-
-	// Ensure we have valid output on empty input
-	if (sampleIndex == 0)
-	{
-		ofstream sample1File(sample1Filename.c_str(), std::ios_base::out | std::ios_base::binary);
-		ofstream sample2File(sample2Filename.c_str(), std::ios_base::out | std::ios_base::binary);
-
-		CheckFile(sample1File, sample1Filename);
-		CheckFile(sample2File, sample2Filename);
-
-		write_empty_gz(sample1File);
-		write_empty_gz(sample2File);
-	}
+	sampleWriter.Close();
 }
-
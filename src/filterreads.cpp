@@ -22,7 +22,7 @@ using namespace boost;
 using namespace std;
 
 
-bool IsFiltered(const vector<SpanningAlignmentRecord>& alignments, const RegionDB& excludedRegions, int numEnds)
+bool IsFiltered(const vector<SpanningAlignmentRecord>& alignments, const RegionIndex& excludedRegions, int numEnds)
 {
 	int excluded[] = {0,0};
 	for (vector<SpanningAlignmentRecord>::const_iterator alignmentIter = alignments.begin(); alignmentIter != alignments.end(); alignmentIter++)
@@ -65,8 +65,8 @@ int main(int argc, char* argv[])
 		exit(1);
 	}
 	
-	RegionDB excludedRegions;
-	excludedRegions.Add(regionsFilename);
+	RegionIndex excludedRegions;
+	excludedRegions.Load(regionsFilename);
 	
 	ifstream alignmentsFile(alignmentsFilename.c_str());
 	CheckFile(alignmentsFile, alignmentsFilename);
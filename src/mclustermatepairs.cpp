@@ -10,6 +10,7 @@
 #include "MatePairDelauny.h"
 #include "MatePairGibbs.h"
 
+#include <cstdlib>
 #include <fstream>
 #include <iostream>
 #include <string>
@@ -78,7 +79,7 @@ int main(int argc, char* argv[])
 		TCLAP::ValueArg<string> clustersFilenameArg("c","clusters","Clusters Filename",true,"","string",cmd);
 		TCLAP::ValueArg<int> minClusterSizeArg("","clustmin","Minimum Cluster Size",true,-1,"integer",cmd);
 		TCLAP::ValueArg<int> maxFragmentLengthArg("","fragmax","Maximum Fragment Length",true,-1,"integer",cmd);
-		TCLAP::ValueArg<string> chromPairArg("","inclchrompair","Include Chromosome Pair (comma separated)",false,"","string",cmd);
+		TCLAP::ValueArg<string> chromPairArg("","inclchrompair","Include Chromosome Pairs (comma separated, pairs separated by semicolon)",false,"","string",cmd);
 		TCLAP::ValueArg<string> exclChromPairsArg("","exclchrompairs","Exclude Chromosome Pairs from Set (comma separated)",false,"","string",cmd);
 		cmd.parse(argc,argv);
 		
@@ -104,19 +105,28 @@ int main(int argc, char* argv[])
 
 	if (!chromPair.empty())
 	{
-		vector<string> chromPairFields;
-		split(chromPairFields, chromPair, is_any_of(","));
+		vector<string> chromPairs;
+		split(chromPairs, chromPair, is_any_of(";"));
 
-		if (chromPairFields.size() != 2)
+		cout << "Restricting analysis to alignments connecting chromosomes";
+
+		for (vector<string>::const_iterator chromPairIter = chromPairs.begin(); chromPairIter != chromPairs.end(); chromPairIter++)
 		{
-			cerr << "Error: Require 2 chromosomes separated by comma for chrompair argument" << endl;
-			exit(1);
-		}
+			vector<string> chromPairFields;
+			split(chromPairFields, *chromPairIter, is_any_of(","));
+
+			if (chromPairFields.size() != 2)
+			{
+				cerr << "Error: Require 2 chromosomes separated by comma for chrompair argument" << endl;
+				exit(1);
+			}
 
-		cout << "Restricting analysis to alignments connecting chromosomes ";
-		cout << chromPairFields[0] << " and " << chromPairFields[1] << endl;
+			cout << " " << chromPairFields[0] << " and " << chromPairFields[1];
 
-		discordantAlignments.SetIncludedChromosomePair(chromPairFields[0], chromPairFields[1]);
+			discordantAlignments.AddIncludedChromosomePair(chromPairFields[0], chromPairFields[1]);
+		}
+
+		cout << endl;
 	}
 
 	if (!exclChromPairs.empty())
@@ -158,6 +168,9 @@ int main(int argc, char* argv[])
 
 	for (vector<pair<uint32_t,uint32_t> >::const_iterator chrStrIdxPairIter = chrStrIdxPairs.begin(); chrStrIdxPairIter != chrStrIdxPairs.end(); chrStrIdxPairIter++)
 	{
+		// Reseed for each pair so that clusters do not depend on the other pairs clustered by this job
+		srand(1);
+
 		pair<string,string> chromosomes = discordantAlignments.GetChromosomePair(*chrStrIdxPairIter);
 		pair<string,string> strands = discordantAlignments.GetStrandPair(*chrStrIdxPairIter);
 		vector<MatePair> matePairs = discordantAlignments.CreateMatePairs(*chrStrIdxPairIter);
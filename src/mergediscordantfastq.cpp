@@ -0,0 +1,405 @@
+/*
+ *  mergediscordantfastq.cpp
+ *
+ */
+
+#include "Common.h"
+#include "DiscordantReads.h"
+#include "ThreadPool.h"
+
+#include <fstream>
+#include <iostream>
+#include <string>
+#include <queue>
+#include <vector>
+#include <tclap/CmdLine.h>
+#include <boost/algorithm/string.hpp>
+#include <boost/iostreams/filtering_stream.hpp>
+#include <boost/iostreams/filter/gzip.hpp>
+#include <boost/lexical_cast.hpp>
+#include <boost/shared_ptr.hpp>
+
+using namespace boost;
+using namespace std;
+
+
+// Gzipped name sorted orphan reads from a single shard
+class OrphanFileReader
+{
+public:
+	explicit OrphanFileReader(const string& orphansFilename)
+		: mFile(orphansFilename.c_str(), std::ios_base::in | std::ios_base::binary),
+		  mStream(&mStreamBuf)
+	{
+		CheckFile(mFile, orphansFilename);
+
+		mStreamBuf.push(iostreams::gzip_decompressor());
+		mStreamBuf.push(mFile);
+	}
+
+	bool Next(OrphanRead& orphan)
+	{
+		return ReadOrphan(mStream, orphan);
+	}
+
+private:
+	ifstream mFile;
+	iostreams::filtering_streambuf<iostreams::input> mStreamBuf;
+	istream mStream;
+};
+
+typedef pair<OrphanRead,int> OrphanEntry;
+
+struct OrphanEntryGreater
+{
+	bool operator()(const OrphanEntry& entry1, const OrphanEntry& entry2) const
+	{
+		return entry2.first < entry1.first;
+	}
+};
+
+// Merge name sorted orphan files, returning all orphans sharing a read name
+class OrphanMerger
+{
+public:
+	explicit OrphanMerger(const vector<string>& orphansFilenames)
+	{
+		for (int fileIndex = 0; fileIndex < orphansFilenames.size(); fileIndex++)
+		{
+			mReaders.push_back(boost::shared_ptr<OrphanFileReader>(new OrphanFileReader(orphansFilenames[fileIndex])));
+			Advance(fileIndex);
+		}
+	}
+
+	bool NextGroup(vector<OrphanRead>& group)
+	{
+		group.clear();
+
+		if (mHeap.empty())
+		{
+			return false;
+		}
+
+		string name = mHeap.top().first.Read.Name;
+		while (!mHeap.empty() && mHeap.top().first.Read.Name == name)
+		{
+			int fileIndex = mHeap.top().second;
+			group.push_back(mHeap.top().first);
+			mHeap.pop();
+			Advance(fileIndex);
+		}
+
+		return true;
+	}
+
+private:
+	void Advance(int fileIndex)
+	{
+		OrphanRead orphan;
+		if (mReaders[fileIndex]->Next(orphan))
+		{
+			mHeap.push(make_pair(orphan, fileIndex));
+		}
+	}
+
+	vector<boost::shared_ptr<OrphanFileReader> > mReaders;
+	priority_queue<OrphanEntry,vector<OrphanEntry>,OrphanEntryGreater> mHeap;
+};
+
+// Find the first pair of ends of the same kind in a group of orphans
+bool PairOrphans(const vector<OrphanRead>& group, OrphanRead& orphan1, OrphanRead& orphan2)
+{
+	for (int properPair = 1; properPair >= 0; properPair--)
+	{
+		const OrphanRead* ends[2] = {0, 0};
+
+		for (vector<OrphanRead>::const_iterator orphanIter = group.begin(); orphanIter != group.end(); orphanIter++)
+		{
+			if (orphanIter->IsProperPair == (bool)properPair && ends[orphanIter->ReadEnd] == 0)
+			{
+				ends[orphanIter->ReadEnd] = &(*orphanIter);
+			}
+		}
+
+		if (ends[0] != 0 && ends[1] != 0)
+		{
+			orphan1 = *ends[0];
+			orphan2 = *ends[1];
+			return true;
+		}
+	}
+
+	return false;
+}
+
+int main(int argc, char* argv[])
+{
+	vector<string> shardFastq1Filenames;
+	vector<string> shardFastq2Filenames;
+	vector<string> shardStatsFilenames;
+	vector<string> shardSample1Filenames;
+	vector<string> shardSample2Filenames;
+	vector<string> orphansFilenames;
+	string fastq1Filename;
+	string fastq2Filename;
+	string statsFilename;
+	string sample1Filename;
+	string sample2Filename;
+	int numSamples;
+	bool renameReads;
+	int numThreads;
+
+	try
+	{
+		TCLAP::CmdLine cmd("Merge Shards of Discordant Fastq Tool");
+		TCLAP::MultiArg<string> shardFastq1FilenamesArg("","shardfastq1","Shard Fastq End 1 Filenames",true,"string",cmd);
+		TCLAP::MultiArg<string> shardFastq2FilenamesArg("","shardfastq2","Shard Fastq End 2 Filenames",true,"string",cmd);
+		TCLAP::MultiArg<string> shardStatsFilenamesArg("","shardstats","Shard Concordant Stats Filenames",true,"string",cmd);
+		TCLAP::MultiArg<string> shardSample1FilenamesArg("","shardsample1","Shard Sample Fastq End 1 Filenames",true,"string",cmd);
+		TCLAP::MultiArg<string> shardSample2FilenamesArg("","shardsample2","Shard Sample Fastq End 2 Filenames",true,"string",cmd);
+		TCLAP::MultiArg<string> orphansFilenamesArg("","orphans","Shard Orphan Reads Filenames",true,"string",cmd);
+		TCLAP::ValueArg<string> fastq1FilenameArg("","fastq1","Fastq End 1 Filename",true,"","string",cmd);
+		TCLAP::ValueArg<string> fastq2FilenameArg("","fastq2","Fastq End 2 Filename",true,"","string",cmd);
+		TCLAP::ValueArg<string> statsFilenameArg("s","stats","Concordant Stats Filename",true,"","string",cmd);
+		TCLAP::ValueArg<string> sample1FilenameArg("","sample1","Sample Fastq End 1 Filename",true,"","string",cmd);
+		TCLAP::ValueArg<string> sample2FilenameArg("","sample2","Sample Fastq End 2 Filename",true,"","string",cmd);
+		TCLAP::ValueArg<int> numSamplesArg("n","num","Number of Samples",true,0,"integer",cmd);
+		TCLAP::SwitchArg renameReadsArg("r","rename","Rename With Integer IDs",cmd);
+		TCLAP::ValueArg<int> numThreadsArg("","threads","Number of Threads for Fastq Compression",false,1,"integer",cmd);
+		cmd.parse(argc,argv);
+
+		shardFastq1Filenames = shardFastq1FilenamesArg.getValue();
+		shardFastq2Filenames = shardFastq2FilenamesArg.getValue();
+		shardStatsFilenames = shardStatsFilenamesArg.getValue();
+		shardSample1Filenames = shardSample1FilenamesArg.getValue();
+		shardSample2Filenames = shardSample2FilenamesArg.getValue();
+		orphansFilenames = orphansFilenamesArg.getValue();
+		fastq1Filename = fastq1FilenameArg.getValue();
+		fastq2Filename = fastq2FilenameArg.getValue();
+		statsFilename = statsFilenameArg.getValue();
+		sample1Filename = sample1FilenameArg.getValue();
+		sample2Filename = sample2FilenameArg.getValue();
+		numSamples = numSamplesArg.getValue();
+		renameReads = renameReadsArg.getValue();
+		numThreads = numThreadsArg.getValue();
+	}
+	catch (TCLAP::ArgException &e)
+	{
+		cerr << "error: " << e.error() << " for arg " << e.argId() << endl;
+		exit(1);
+	}
+
+	int numShards = shardStatsFilenames.size();
+
+	if (shardFastq1Filenames.size() != numShards || shardFastq2Filenames.size() != numShards ||
+	    shardSample1Filenames.size() != numShards || shardSample2Filenames.size() != numShards ||
+	    orphansFilenames.size() != numShards)
+	{
+		cerr << "Error: Mismatched number of shard files" << endl;
+		exit(1);
+	}
+
+	ThreadPool compressPool(numThreads > 1 ? numThreads : 0);
+
+	PairedFastqWriter fastqWriter(fastq1Filename, fastq2Filename, compressPool);
+
+	long fragmentIndex = 0;
+
+	// Concatenate discordant reads paired within each shard
+	for (int shardIndex = 0; shardIndex < numShards; shardIndex++)
+	{
+		GzipFastqReader fastq1Reader(shardFastq1Filenames[shardIndex]);
+		GzipFastqReader fastq2Reader(shardFastq2Filenames[shardIndex]);
+
+		string fragment1;
+		string fragment2;
+		ReadInfo read1;
+		ReadInfo read2;
+		while (fastq1Reader.Next(fragment1, read1) && fastq2Reader.Next(fragment2, read2))
+		{
+			if (renameReads)
+			{
+				fragment1 = lexical_cast<string>(fragmentIndex);
+			}
+
+			fastqWriter.Write(fragment1, read1, read2);
+
+			fragmentIndex++;
+		}
+	}
+
+	ConcordantStats stats;
+
+	// Pair reads with mates in different shards, and classify
+	// them as they would have been classified in a single pass
+	ReservoirSampler<pair<ReadInfo,ReadInfo> > orphanSampledReads(numSamples);
+
+	OrphanMerger orphanMerger(orphansFilenames);
+
+	vector<OrphanRead> orphanGroup;
+	while (orphanMerger.NextGroup(orphanGroup))
+	{
+		OrphanRead orphan1;
+		OrphanRead orphan2;
+		if (!PairOrphans(orphanGroup, orphan1, orphan2))
+		{
+			continue;
+		}
+
+		// Ignore all failed reads
+		if (orphan1.Read.IsFailedQC || orphan2.Read.IsFailedQC)
+		{
+			continue;
+		}
+
+		if (orphan1.IsProperPair)
+		{
+			stats.ConcordantReadCount++;
+		}
+
+		orphanSampledReads.AddSample(make_pair(orphan1.Read, orphan2.Read));
+
+		// Update read length histogram for all reads
+		stats.AddReadLength(orphan1.Read.Sequence.length());
+		stats.AddReadLength(orphan2.Read.Sequence.length());
+
+		if (orphan1.IsProperPair && orphan1.IsConcordant && orphan2.IsConcordant)
+		{
+			// Update fragment length histogram for concordant reads
+			stats.AddFragmentLength(orphan1.FragmentLength);
+			continue;
+		}
+
+		stats.DiscordantReadCount++;
+
+		// Optionally change the fragment name
+		string fragment = orphan1.Read.Name;
+		if (renameReads)
+		{
+			fragment = lexical_cast<string>(fragmentIndex);
+		}
+
+		// Write fastq
+		fastqWriter.Write(fragment, orphan1.Read, orphan2.Read);
+
+		fragmentIndex++;
+	}
+
+	fastqWriter.Close();
+
+	// Sum the stats of all shards
+	vector<long> sourceCounts;
+	for (int shardIndex = 0; shardIndex < numShards; shardIndex++)
+	{
+		ConcordantStats shardStats;
+		shardStats.Read(shardStatsFilenames[shardIndex]);
+
+		stats.ConcordantReadCount += shardStats.ConcordantReadCount;
+		stats.DiscordantReadCount += shardStats.DiscordantReadCount;
+
+		for (unordered_map<int,long>::const_iterator iter = shardStats.ReadLengthHist.begin(); iter != shardStats.ReadLengthHist.end(); iter++)
+		{
+			stats.ReadLengthHist[iter->first] += iter->second;
+		}
+
+		for (unordered_map<int,long>::const_iterator iter = shardStats.FragmentLengthHist.begin(); iter != shardStats.FragmentLengthHist.end(); iter++)
+		{
+			stats.FragmentLengthHist[iter->first] += iter->second;
+		}
+
+		sourceCounts.push_back(shardStats.SampledReadCount);
+	}
+	sourceCounts.push_back(orphanSampledReads.mNumValues);
+
+	// Check for an empty bam file (fail, somethings wrong)
+	if (stats.ConcordantReadCount + stats.DiscordantReadCount == 0)
+	{
+		cerr << "Error: No reads" << endl;
+	}
+
+	// Check for a bam file with no concordant reads (fail, somethings wrong)
+	if (stats.ConcordantReadCount == 0)
+	{
+		cerr << "Warning: No concordant reads" << endl;
+	}
+
+	// Check for a bam file with no discordant reads (usually somethings wrong)
+	if (stats.DiscordantReadCount == 0)
+	{
+		cerr << "Error: No discordant reads" << endl;
+	}
+
+	stats.Write(statsFilename, false);
+
+	// Combine reservoir samples, equivalent to sampling without replacement
+	// from all pairs, by allocating samples to each source in proportion
+	// to the number of pairs remaining in that source
+	RandomNumberGenerator rng;
+
+	long totalCount = accumulate(sourceCounts.begin(), sourceCounts.end(), 0L);
+	long numMergedSamples = min((long)numSamples, totalCount);
+
+	vector<long> remainingCounts = sourceCounts;
+	vector<long> allocatedCounts(sourceCounts.size(), 0);
+	for (long sampleIndex = 0; sampleIndex < numMergedSamples; sampleIndex++)
+	{
+		long position = rng.Next(0L, totalCount - sampleIndex - 1);
+
+		int sourceIndex = 0;
+		while (position >= remainingCounts[sourceIndex])
+		{
+			position -= remainingCounts[sourceIndex];
+			sourceIndex++;
+		}
+
+		remainingCounts[sourceIndex]--;
+		allocatedCounts[sourceIndex]++;
+	}
+
+	PairedFastqWriter sampleWriter(sample1Filename, sample2Filename, compressPool);
+
+	long mergedSampleIndex = 0;
+	for (int sourceIndex = 0; sourceIndex <= numShards; sourceIndex++)
+	{
+		vector<pair<ReadInfo,ReadInfo> > sourceSamples;
+
+		if (sourceIndex < numShards)
+		{
+			GzipFastqReader sample1Reader(shardSample1Filenames[sourceIndex]);
+			GzipFastqReader sample2Reader(shardSample2Filenames[sourceIndex]);
+
+			string fragment1;
+			string fragment2;
+			ReadInfo read1;
+			ReadInfo read2;
+			while (sample1Reader.Next(fragment1, read1) && sample2Reader.Next(fragment2, read2))
+			{
+				sourceSamples.push_back(make_pair(read1, read2));
+			}
+		}
+		else
+		{
+			sourceSamples.swap(orphanSampledReads.mSamples);
+		}
+
+		if (allocatedCounts[sourceIndex] > sourceSamples.size())
+		{
+			cerr << "Error: Too few samples for shard " << sourceIndex << endl;
+			exit(1);
+		}
+
+		// Partial shuffle to select a random subset of the source samples
+		for (long selectIndex = 0; selectIndex < allocatedCounts[sourceIndex]; selectIndex++)
+		{
+			long swapIndex = rng.Next(selectIndex, (long)sourceSamples.size() - 1);
+			swap(sourceSamples[selectIndex], sourceSamples[swapIndex]);
+
+			sampleWriter.Write(lexical_cast<string>(mergedSampleIndex), sourceSamples[selectIndex].first, sourceSamples[selectIndex].second);
+
+			mergedSampleIndex++;
+		}
+	}
+
+	sampleWriter.Close();
+}
+
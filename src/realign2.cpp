@@ -15,14 +15,19 @@
 #include "AlignmentProbability.h"
 #include "AlignRead.h"
 #include "AlignmentRecord.h"
+#include "ThreadPool.h"
 
 #include <fstream>
 #include <iostream>
 #include <string>
 #include <map>
 #include <set>
+#include <deque>
+#include <sstream>
 #include <tclap/CmdLine.h>
 #include <boost/algorithm/string.hpp>
+#include <boost/bind.hpp>
+#include <boost/shared_ptr.hpp>
 
 using namespace boost;
 using namespace std;
@@ -132,8 +137,11 @@ int CalculateForwardHomology(const Sequences& sequences,
 	int idx1 = (flip) ? 1 : 0;
 	int idx2 = 1 - idx1;
 
-	const char* seqPtr1 = sequences.Get(chromosome[idx1], position[idx1]);
-	const char* seqPtr2 = sequences.Get(chromosome[idx2], position[idx2]);
+	string buffer1;
+	string buffer2;
+
+	const char* seqPtr1 = sequences.GetWindow(chromosome[idx1], position[idx1], maxOffset + 1, buffer1);
+	const char* seqPtr2 = sequences.GetWindow(chromosome[idx2], position[idx2], maxOffset + 1, buffer2);
 
 	int homology = 0;
 	for (int offset = 1; offset <= maxOffset; offset++)
@@ -199,8 +207,483 @@ void HomologyConsistentBreakpoint(const Sequences& sequences,
 }
 
 
+const int cSeedScoreThreshold = 8;
+const int cMinAnchor = 8;
+const int cBreakEndAdjust = 5;
+const int cInsertedPenalty = -1;
+const int cFragmentsPerBatch = 256;
+
+
+// Realign the seed alignments of a read and write spanning and split
+// alignments.  Copies share the reference, reads and score distributions
+// and can realign in parallel.
+class ReadRealigner
+{
+public:
+	ReadRealigner(const Sequences& referenceSequences, const PreppedReads& preppedReads,
+	              const AlignmentProbability& alignProbability,
+	              int matchScore, int misMatchScore, int gapScore,
+	              int minFragmentLength, int maxFragmentLength,
+	              double chimericPrior, double chimericThreshold, double alignmentThreshold, int libID)
+		: mReferenceSequences(referenceSequences),
+		  mPreppedReads(preppedReads),
+		  mAlignProbability(alignProbability),
+		  mAligner(matchScore, misMatchScore, gapScore),
+		  mMinFragmentLength(minFragmentLength),
+		  mMaxFragmentLength(maxFragmentLength),
+		  mMinAlignedLength(alignProbability.GetMinAlignedLength()),
+		  mChimericPrior(chimericPrior),
+		  mChimericThreshold(chimericThreshold),
+		  mAlignmentThreshold(alignmentThreshold),
+		  mLibID(libID)
+	{
+	}
+	
+	void Realign(const RawAlignmentVec& alignments, ostream& spanningFile, ostream& splitFile);
+	
+private:
+	const Sequences& mReferenceSequences;
+	PreppedReads mPreppedReads;
+	const AlignmentProbability& mAlignProbability;
+	SimpleAligner mAligner;
+	int mMinFragmentLength;
+	int mMaxFragmentLength;
+	int mMinAlignedLength;
+	double mChimericPrior;
+	double mChimericThreshold;
+	double mAlignmentThreshold;
+	int mLibID;
+};
+
+void ReadRealigner::Realign(const RawAlignmentVec& alignments, ostream& spanningFile, ostream& splitFile)
+{
+	int readID = SAFEPARSE(int, alignments.front().fragment);
+
+	mPreppedReads.SetCurrentRead(readID);
+	
+	// Check that both ends are mapped
+	bool readEndMapped[2] = {false,false};
+	for (int alignmentIndex = 0; alignmentIndex < alignments.size(); alignmentIndex++)
+	{
+		const RawAlignment& alignment = alignments[alignmentIndex];
+		
+		readEndMapped[alignment.readEnd] = true;
+	}
+	if (!readEndMapped[0] || !readEndMapped[1])
+	{
+		return;
+	}
+	
+	//
+	// Realignments
+	//
+	// Calculate the 'self' alignment, the alignment of the read
+	// to its seed match location
+	//
+	// Calculate the 'mate' seed alignment, the alignment of a 16 nt seed
+	// from the mate read to the region near the self seed location
+	//
+	// Given a reasonable mate seed alignment, calculate the 'forward'
+	// mate alignment, the alignment of the mate read forward from the
+	// seed match location
+	//
+	// Also calculate the 'reverse' mate alignment, the alignment of the
+	// mate starting from the ending point of the forward mate alignment
+	//
+	pair<int,int> bestAlignment[2] = {pair<int,int>(0,0),pair<int,int>(0,0)};
+	vector<AlignInfo> selfAlignments;
+	unordered_map<int,AlignInfo> mateFwdAlignments;
+	unordered_map<int,AlignInfo> mateRevAlignments;
+	for (int alignmentIndex = 0; alignmentIndex < alignments.size(); alignmentIndex++)
+	{
+		const RawAlignment& alignment = alignments[alignmentIndex];
+		
+		AlignInfo selfAlignInfo = AlignSelfFullSSE(mAligner, alignment, mReferenceSequences, mPreppedReads);
+		
+		int selfSeqLength = selfAlignInfo.BestPartialSeqLength();
+		int selfScore = selfAlignInfo.SeqScores()[selfSeqLength];
+		
+		bestAlignment[alignment.readEnd] = max(bestAlignment[alignment.readEnd], pair<int,int>(selfScore, selfSeqLength));
+		
+		selfAlignments.push_back(selfAlignInfo);
+		
+		int mateEnd = OtherReadEnd(alignment.readEnd);
+		
+		int seedScore;
+		int seedPosition;
+		AlignMate3PrimeSeed16SSE(mAligner, alignment, mReferenceSequences, mPreppedReads, mMinFragmentLength, mMaxFragmentLength, seedScore, seedPosition);
+		
+		if (seedScore >= cSeedScoreThreshold)
+		{
+			AlignInfo mateFwdAlignInfo = AlignFwdMateFullSSE(mAligner, alignment, mReferenceSequences, mPreppedReads, seedPosition);
+			
+			mateFwdAlignments[alignmentIndex] = mateFwdAlignInfo;
+			
+			AlignInfo mateRevAlignInfo = AlignRevMateFullSSE(mAligner, alignment, mReferenceSequences, mPreppedReads, mateFwdAlignInfo.AlignmentPosition(mPreppedReads.ReadLength(mateEnd)));
+			
+			mateRevAlignments[alignmentIndex] = mateRevAlignInfo;
+		}
+	}
+
+	//
+	// Calculate adjusted aligned length for each end
+	// Also create an array of read lengths
+	//
+	vector<int> alignedLength(2);
+	for (int readEnd = 0; readEnd <= 1; readEnd++)
+	{
+		alignedLength[readEnd] = bestAlignment[readEnd].second - cBreakEndAdjust;
+	}
+
+	// Check for very poor alignments
+	if (min(alignedLength[0], alignedLength[1]) < mMinAlignedLength)
+	{
+		return;
+	}
+	
+	//
+	// Add partial alignment scores to posterior calculation including:
+	//  - self alignments
+	//  - reverse mate alignments, if they exist
+	// Calculate best full alignment scores
+	//
+	AlignmentPosterior alignPosteriorPartial(mAlignProbability, mChimericPrior, alignedLength);
+	for (int alignmentIndex = 0; alignmentIndex < alignments.size(); alignmentIndex++)
+	{
+		const RawAlignment& alignment = alignments[alignmentIndex];
+		
+		int selfScorePart = selfAlignments[alignmentIndex].SeqScores()[alignedLength[alignment.readEnd]];
+		
+		unordered_map<int,AlignInfo>::const_iterator mateAlignIter = mateRevAlignments.find(alignmentIndex);
+		if (mateAlignIter == mateRevAlignments.end())
+		{
+			alignPosteriorPartial.AppendAlignment(alignment.readEnd, selfScorePart);
+		}
+		else
+		{
+			int mateEnd = OtherReadEnd(alignment.readEnd);
+
+			int mateScore = mateAlignIter->second.SeqScores()[alignedLength[mateEnd]];
+			
+			alignPosteriorPartial.AppendAlignmentWithMate(alignment.readEnd, selfScorePart, mateScore);
+		}
+	}
+
+	// 
+	// Filter concordant alignments based on threshold on 
+	// the posterior probability that any of the concordant
+	// alignments are above threshold
+	// 
+	if (alignPosteriorPartial.PosteriorConcordant() >= mChimericThreshold)
+	{
+		return;
+	}
+	
+	//
+	// Calculate the full alignment score of each alignment and threshold
+	// on the CDF of the likelihood of attaining this alignment.  Mark each
+	// alignment index as passing or not passing the CDF threshold.  Also 
+	// mark read ends as having an alignment that passes the CDF threshold.
+	//
+	// Create list of alignment indices for each end, filter
+	// based on partial alignment posterior
+	//
+	bool validSpanningReadEnd[2] = {false, false};
+	vector<bool> validSpanningAlignment(alignments.size(), false);
+	vector<int> alignmentIndices[2];
+	for (int alignmentIndex = 0; alignmentIndex < alignments.size(); alignmentIndex++)
+	{
+		const RawAlignment& alignment = alignments[alignmentIndex];
+
+		int selfScoreFull = selfAlignments[alignmentIndex].SeqScores()[mPreppedReads.ReadLength(alignment.readEnd)];
+
+		if (mAlignProbability.AboveThreshold(mPreppedReads.ReadLength(alignment.readEnd), selfScoreFull))
+		{
+			validSpanningReadEnd[alignment.readEnd] = true;
+			validSpanningAlignment[alignmentIndex] = true;
+		}
+
+		double alignmentPosterior = alignPosteriorPartial.Posterior(alignmentIndex);
+
+		if (alignmentPosterior < mAlignmentThreshold)
+		{
+			continue;
+		}
+		
+		alignmentIndices[alignment.readEnd].push_back(alignmentIndex);
+	}
+
+	//
+	// Filter reads unless there is at least 1 alignment of each end exceeding
+	// partial alignment posterior threshold
+	//
+	if (alignmentIndices[0].empty() || alignmentIndices[1].empty())
+	{
+		return;
+	}
+	
+	//
+	// Calculate split alignments for selected alignment pairs
+	//
+	// Calculate the best split length and score where best split length equals
+	// read length unless there are insertions at the breakpoint, in which case
+	// the insertion length is subtracked from the read length and the insertion
+	// penalty is subtracted from the score.  Check whether the length and score
+	// pass the CDF threshold.  Output the split read only it passes the 
+	// threshold.  Also store a boolean as True for split reads that pass the
+	// threshold to be used to determine if a spanning read should be output 
+	// regardless of the fully aligned score.  Store a boolean for each read end
+	// if a valid split alignment was found for that read end.
+	//
+	bool validSplitReadEnd[2] = {false, false};
+	vector<bool> validSplitAlignment(alignments.size(), false);
+	vector<SplitAlignmentRecord> splitRecords;
+	for (int readEnd = 0; readEnd <= 1; readEnd++)
+	{
+		int mateEnd = OtherReadEnd(readEnd);
+		
+		for (vector<int>::const_iterator selfAlignmentIter = alignmentIndices[readEnd].begin(); selfAlignmentIter != alignmentIndices[readEnd].end(); selfAlignmentIter++)
+		{
+			int selfAlignmentIndex = *selfAlignmentIter;
+			const AlignInfo& selfAlignInfo = selfAlignments[selfAlignmentIndex];
+			const RawAlignment& selfAlignment = alignments[selfAlignmentIndex];
+			
+			for (vector<int>::const_iterator mateAlignmentIter = alignmentIndices[mateEnd].begin(); mateAlignmentIter != alignmentIndices[mateEnd].end(); mateAlignmentIter++)
+			{
+				int mateAlignmentIndex = *mateAlignmentIter;
+				unordered_map<int,AlignInfo>::const_iterator mateAlignInfoIter = mateFwdAlignments.find(mateAlignmentIndex);
+				
+				if (mateAlignInfoIter == mateFwdAlignments.end())
+				{
+					continue;
+				}
+				
+				const AlignInfo& mateAlignInfo = mateAlignInfoIter->second;
+				const RawAlignment& mateAlignment = alignments[mateAlignmentIndex];
+				
+				DebugCheck(mateAlignment.readEnd == mateEnd);
+
+				int score;
+				int seq1Length;
+				int seq2Length;
+				bool hasSplit = BestSplitAlignment(selfAlignInfo.SeqScores(), selfAlignInfo.SeqScoresLength(),
+				                                   mateAlignInfo.SeqScores(), mateAlignInfo.SeqScoresLength(),
+				                                   cInsertedPenalty, cMinAnchor, score, seq1Length, seq2Length);
+
+				if (!hasSplit)
+				{
+					continue;
+				}
+
+				string readSeq = mPreppedReads.Sequence(readEnd);
+
+				string inserted = readSeq.substr(seq1Length, readSeq.size() - seq2Length - seq1Length);
+
+				int alignedLength = readSeq.size() - inserted.size();
+				int alignedScore = score - cInsertedPenalty * (int)inserted.size();
+
+				if (!mAlignProbability.AboveThreshold(alignedLength, alignedScore))
+				{
+					continue;
+				}
+
+				SplitAlignmentRecord record;
+				record.libID = mLibID;
+				record.readID = readID;
+				record.readEnd = selfAlignment.readEnd;
+				record.alignID[readEnd] = selfAlignmentIndex;
+				record.chromosome[readEnd] = selfAlignment.reference;
+				record.strand[readEnd] = ((selfAlignment.strand == PlusStrand) ? "+" : "-");
+				record.position[readEnd] = selfAlignInfo.BreakPosition(seq1Length);
+				record.alignID[mateEnd] = mateAlignmentIndex;
+				record.chromosome[mateEnd] = mateAlignment.reference;
+				record.strand[mateEnd] = ((mateAlignment.strand == PlusStrand) ? "+" : "-");
+				record.position[mateEnd] = mateAlignInfo.BreakPosition(seq2Length);
+				record.homology = 0;
+				record.inserted = readSeq.substr(seq1Length, readSeq.size() - seq2Length - seq1Length);
+				record.score = score;
+
+				if (record.inserted.empty())
+				{
+					HomologyConsistentBreakpoint(mReferenceSequences, record.chromosome, record.strand,
+					                             record.position, record.homology, readSeq.size());
+				}
+
+				splitRecords.push_back(record);
+
+				validSplitReadEnd[readEnd] = true;
+				validSplitAlignment[selfAlignmentIndex] = true;
+			}
+		}
+	}
+
+	//
+	// Filter reads based on the cdf of the score likelihood
+	//
+	if ((!validSpanningReadEnd[0] && !validSplitReadEnd[0]) || (!validSpanningReadEnd[1] && !validSplitReadEnd[1]))
+	{
+		return;
+	}
+
+	//
+	// Output split alignment records after cdf test
+	//
+	for (vector<SplitAlignmentRecord>::const_iterator recordIter = splitRecords.begin(); recordIter != splitRecords.end(); recordIter++)
+	{
+		splitFile << *recordIter;
+	}
+
+	// Output spanning alignments exceeding posterior threshold
+	// Reads must also have a valid spanning or split read
+	for (int readEnd = 0; readEnd <= 1; readEnd++)
+	{
+		for (vector<int>::const_iterator alignmentIter = alignmentIndices[readEnd].begin(); alignmentIter != alignmentIndices[readEnd].end(); alignmentIter++)
+		{
+			int alignmentIndex = *alignmentIter;
+
+			const RawAlignment& alignment = alignments[alignmentIndex];
+			
+			DebugCheck(alignment.readEnd == readEnd);
+			
+			int mateEnd = OtherReadEnd(readEnd);
+
+			AlignInfo alignInfo = selfAlignments[alignmentIndex];
+			
+			int selfSeqLength = alignInfo.BestPartialSeqLength();
+
+			int mateScore = 0;
+
+			unordered_map<int,AlignInfo>::const_iterator mateAlignIter = mateRevAlignments.find(alignmentIndex);
+			if (mateAlignIter != mateRevAlignments.end())
+			{
+				mateScore = max((short)0, mateAlignIter->second.SeqScores()[alignedLength[mateEnd]]);
+			}
+
+			if (!validSpanningAlignment[alignmentIndex] && !validSplitAlignment[alignmentIndex])
+			{
+				continue;
+			} 
+			
+			SpanningAlignmentRecord record;
+			record.libID = mLibID;
+			record.readID = readID;
+			record.readEnd = alignment.readEnd;
+			record.alignID = alignmentIndex;
+			record.chromosome = alignment.reference;
+			record.strand = ((alignment.strand == PlusStrand) ? "+" : "-");
+			record.position = alignInfo.OuterPosition();
+			record.alignedLength = selfSeqLength;
+			record.mateLength = mPreppedReads.ReadLength(mateEnd);
+			record.mateScore = mateScore;
+
+			spanningFile << record;
+		}
+	}
+}
+
+
+struct RealignBatch
+{
+	RealignBatch() : done(false) {}
+	
+	vector<RawAlignmentVec> fragments;
+	string spanning;
+	string split;
+	bool done;
+};
+
+typedef boost::shared_ptr<RealignBatch> RealignBatchPtr;
+
+
+// Realign batches of reads on a thread pool, writing the output of each
+// batch in input order so that results match a single threaded run
+class OrderedBatchRealigner
+{
+public:
+	OrderedBatchRealigner(const ReadRealigner& realigner, ThreadPool& threadPool, ostream& spanningFile, ostream& splitFile)
+		: mRealigner(realigner),
+		  mThreadPool(threadPool),
+		  mSpanningFile(spanningFile),
+		  mSplitFile(splitFile),
+		  mMaxPending(2 * threadPool.NumThreads() + 1)
+	{
+	}
+	
+	void Submit(RealignBatchPtr batch)
+	{
+		// Bound the number of batches held in memory
+		while (mPending.size() >= mMaxPending)
+		{
+			WriteFront();
+		}
+		
+		mPending.push_back(batch);
+		mThreadPool.Submit(boost::bind(&OrderedBatchRealigner::Realign, this, mRealigner, batch));
+	}
+	
+	void Close()
+	{
+		while (!mPending.empty())
+		{
+			WriteFront();
+		}
+	}
+	
+private:
+	void Realign(ReadRealigner realigner, RealignBatchPtr batch)
+	{
+		ostringstream spanning;
+		ostringstream split;
+		
+		for (vector<RawAlignmentVec>::const_iterator fragmentIter = batch->fragments.begin(); fragmentIter != batch->fragments.end(); fragmentIter++)
+		{
+			realigner.Realign(*fragmentIter, spanning, split);
+		}
+		
+		boost::mutex::scoped_lock lock(mMutex);
+		
+		batch->fragments.clear();
+		batch->spanning = spanning.str();
+		batch->split = split.str();
+		batch->done = true;
+		
+		mBatchDone.notify_all();
+	}
+	
+	// Write the oldest batch, waiting for its realignment to finish
+	void WriteFront()
+	{
+		RealignBatchPtr batch = mPending.front();
+		
+		{
+			boost::mutex::scoped_lock lock(mMutex);
+			while (!batch->done)
+			{
+				mBatchDone.wait(lock);
+			}
+		}
+		
+		mSpanningFile << batch->spanning;
+		mSplitFile << batch->split;
+		mPending.pop_front();
+	}
+	
+	ReadRealigner mRealigner;
+	ThreadPool& mThreadPool;
+	ostream& mSpanningFile;
+	ostream& mSplitFile;
+	int mMaxPending;
+	deque<RealignBatchPtr> mPending;
+	boost::mutex mMutex;
+	boost::condition_variable mBatchDone;
+};
+
+
 int main(int argc, char* argv[])
 {
+	// Alignments are usually streamed on stdin
+	ios::sync_with_stdio(false);
+
 	int matchScore;
 	int misMatchScore;
 	int gapScore;
@@ -210,6 +693,7 @@ int main(int argc, char* argv[])
 	string reads1Filename;
 	string reads2Filename;
 	string alignmentsFilename;
+	bool binaryAlignments;
 	string statsFilename;
 	double validReadThreshold;
 	double chimericPrior;
@@ -218,6 +702,7 @@ int main(int argc, char* argv[])
 	int libID;
 	string spanningFilename;
 	string splitFilename;
+	int numThreads;
 	
 	try
 	{
@@ -231,6 +716,7 @@ int main(int argc, char* argv[])
 		TCLAP::ValueArg<string> reads1FilenameArg("1","reads1","Read End 1 Fastq",true,"","string",cmd);
 		TCLAP::ValueArg<string> reads2FilenameArg("2","reads2","Read End 2 Fastq",true,"","string",cmd);
 		TCLAP::ValueArg<string> alignmentsFilenameArg("a","align","Sam Alignments",true,"","string",cmd);
+		TCLAP::SwitchArg binaryAlignmentsArg("","binary","Alignments in Binary Format from destruct_samtobinary",cmd);
 		TCLAP::ValueArg<string> statsFilenameArg("z","stats","Stats Filename",true,"","string",cmd);
 		TCLAP::ValueArg<double> validReadThresholdArg("","tvalid","Valid Read Threshold",true,0.01,"float",cmd);
 		TCLAP::ValueArg<double> chimericPriorArg("","pchimer","Prior Probility of Chimeric Read",true,0.05,"float",cmd);
@@ -239,6 +725,7 @@ int main(int argc, char* argv[])
 		TCLAP::ValueArg<int> libIDArg("l","lib","Library ID",true,0,"int",cmd);
 		TCLAP::ValueArg<string> spanningFilenameArg("","span","Spanning Filename",true,"","string",cmd);
 		TCLAP::ValueArg<string> splitFilenameArg("","split","Splits Filename",true,"","string",cmd);
+		TCLAP::ValueArg<int> numThreadsArg("","threads","Number of Realignment Threads",false,1,"int",cmd);
 		cmd.parse(argc,argv);
 		
 		matchScore = matchScoreArg.getValue();
@@ -250,6 +737,7 @@ int main(int argc, char* argv[])
 		reads1Filename = reads1FilenameArg.getValue();
 		reads2Filename = reads2FilenameArg.getValue();
 		alignmentsFilename = alignmentsFilenameArg.getValue();
+		binaryAlignments = binaryAlignmentsArg.getValue();
 		statsFilename = statsFilenameArg.getValue();
 		validReadThreshold = validReadThresholdArg.getValue();
 		chimericPrior = chimericPriorArg.getValue();
@@ -258,6 +746,7 @@ int main(int argc, char* argv[])
 		libID = libIDArg.getValue();
 		spanningFilename = spanningFilenameArg.getValue();
 		splitFilename = splitFilenameArg.getValue();
+		numThreads = numThreadsArg.getValue();
 	}
 	catch (TCLAP::ArgException &e)
 	{
@@ -271,21 +760,15 @@ int main(int argc, char* argv[])
 	ofstream splitFile(splitFilename.c_str());
 	CheckFile(splitFile, splitFilename);
 	
-	const int cSeedScoreThreshold = 8;
-	const int cMinAnchor = 8;
-	const int cBreakEndAdjust = 5;
-	const int cInsertedPenalty = -1;
-	
 	cerr << "Reading alignment stats" << endl;
 	
 	AlignmentProbability alignProbability(matchScore);
 	alignProbability.ReadDistributions(statsFilename, validReadThreshold);
-	int minAlignedLength = alignProbability.GetMinAlignedLength();
 	
 	cerr << "Reading reference fasta" << endl;
 	
 	Sequences referenceSequences(4000);
-	referenceSequences.Read(referenceFasta);
+	referenceSequences.Load(referenceFasta);
 	
 	cerr << "Reading fastq sequences" << endl;
 	
@@ -298,337 +781,61 @@ int main(int argc, char* argv[])
 	
 	cerr << "Realigning" << endl;
 	
-	SimpleAligner aligner(matchScore, misMatchScore, gapScore);
+	AlignmentStream* alignmentStream;
+	if (binaryAlignments)
+	{
+		alignmentStream = new BinaryAlignmentStream(alignmentsFilename);
+	}
+	else
+	{
+		alignmentStream = new SamAlignmentStream(alignmentsFilename);
+	}
+	
+	FragmentAlignmentStream fragmentAlignmentStream(alignmentStream);
 	
-	SamAlignmentStream alignmentStream(alignmentsFilename);
-	FragmentAlignmentStream fragmentAlignmentStream(&alignmentStream);
+	ReadRealigner realigner(referenceSequences, preppedReads, alignProbability,
+	                        matchScore, misMatchScore, gapScore,
+	                        minFragmentLength, maxFragmentLength,
+	                        chimericPrior, chimericThreshold, alignmentThreshold, libID);
 	
-	RawAlignmentVec alignments;
-	while (fragmentAlignmentStream.GetNextAlignments(alignments))
+	if (numThreads <= 1)
 	{
-		int readID = SAFEPARSE(int, alignments.front().fragment);
-
-		preppedReads.SetCurrentRead(readID);
-		
-		// Check that both ends are mapped
-		bool readEndMapped[2] = {false,false};
-		for (int alignmentIndex = 0; alignmentIndex < alignments.size(); alignmentIndex++)
-		{
-			const RawAlignment& alignment = alignments[alignmentIndex];
-			
-			readEndMapped[alignment.readEnd] = true;
-		}
-		if (!readEndMapped[0] || !readEndMapped[1])
-		{
-			continue;
-		}
-		
-		//
-		// Realignments
-		//
-		// Calculate the 'self' alignment, the alignment of the read
-		// to its seed match location
-		//
-		// Calculate the 'mate' seed alignment, the alignment of a 16 nt seed
-		// from the mate read to the region near the self seed location
-		//
-		// Given a reasonable mate seed alignment, calculate the 'forward'
-		// mate alignment, the alignment of the mate read forward from the
-		// seed match location
-		//
-		// Also calculate the 'reverse' mate alignment, the alignment of the
-		// mate starting from the ending point of the forward mate alignment
-		//
-		pair<int,int> bestAlignment[2] = {pair<int,int>(0,0),pair<int,int>(0,0)};
-		vector<AlignInfo> selfAlignments;
-		unordered_map<int,AlignInfo> mateFwdAlignments;
-		unordered_map<int,AlignInfo> mateRevAlignments;
-		for (int alignmentIndex = 0; alignmentIndex < alignments.size(); alignmentIndex++)
-		{
-			const RawAlignment& alignment = alignments[alignmentIndex];
-			
-			AlignInfo selfAlignInfo = AlignSelfFullSSE(aligner, alignment, referenceSequences, preppedReads);
-			
-			int selfSeqLength = selfAlignInfo.BestPartialSeqLength();
-			int selfScore = selfAlignInfo.SeqScores()[selfSeqLength];
-			
-			bestAlignment[alignment.readEnd] = max(bestAlignment[alignment.readEnd], pair<int,int>(selfScore, selfSeqLength));
-			
-			selfAlignments.push_back(selfAlignInfo);
-			
-			int mateEnd = OtherReadEnd(alignment.readEnd);
-			
-			int seedScore;
-			int seedPosition;
-			AlignMate3PrimeSeed16SSE(aligner, alignment, referenceSequences, preppedReads, minFragmentLength, maxFragmentLength, seedScore, seedPosition);
-			
-			if (seedScore >= cSeedScoreThreshold)
-			{
-				AlignInfo mateFwdAlignInfo = AlignFwdMateFullSSE(aligner, alignment, referenceSequences, preppedReads, seedPosition);
-				
-				mateFwdAlignments[alignmentIndex] = mateFwdAlignInfo;
-				
-				AlignInfo mateRevAlignInfo = AlignRevMateFullSSE(aligner, alignment, referenceSequences, preppedReads, mateFwdAlignInfo.AlignmentPosition(preppedReads.ReadLength(mateEnd)));
-				
-				mateRevAlignments[alignmentIndex] = mateRevAlignInfo;
-			}
-		}
-
-		//
-		// Calculate adjusted aligned length for each end
-		// Also create an array of read lengths
-		//
-		vector<int> alignedLength(2);
-		for (int readEnd = 0; readEnd <= 1; readEnd++)
+		RawAlignmentVec alignments;
+		while (fragmentAlignmentStream.GetNextAlignments(alignments))
 		{
-			alignedLength[readEnd] = bestAlignment[readEnd].second - cBreakEndAdjust;
-		}
-
-		// Check for very poor alignments
-		if (min(alignedLength[0], alignedLength[1]) < minAlignedLength)
-		{
-			continue;
+			realigner.Realign(alignments, spanningFile, splitFile);
 		}
+	}
+	else
+	{
+		ThreadPool threadPool(numThreads);
+		OrderedBatchRealigner batchRealigner(realigner, threadPool, spanningFile, splitFile);
 		
-		//
-		// Add partial alignment scores to posterior calculation including:
-		//  - self alignments
-		//  - reverse mate alignments, if they exist
-		// Calculate best full alignment scores
-		//
-		AlignmentPosterior alignPosteriorPartial(alignProbability, chimericPrior, alignedLength);
-		for (int alignmentIndex = 0; alignmentIndex < alignments.size(); alignmentIndex++)
+		RealignBatchPtr batch(new RealignBatch());
+		RawAlignmentVec alignments;
+		while (fragmentAlignmentStream.GetNextAlignments(alignments))
 		{
-			const RawAlignment& alignment = alignments[alignmentIndex];
-			
-			int selfScorePart = selfAlignments[alignmentIndex].SeqScores()[alignedLength[alignment.readEnd]];
+			batch->fragments.push_back(RawAlignmentVec());
+			batch->fragments.back().swap(alignments);
 			
-			unordered_map<int,AlignInfo>::const_iterator mateAlignIter = mateRevAlignments.find(alignmentIndex);
-			if (mateAlignIter == mateRevAlignments.end())
-			{
-				alignPosteriorPartial.AppendAlignment(alignment.readEnd, selfScorePart);
-			}
-			else
+			if (batch->fragments.size() >= cFragmentsPerBatch)
 			{
-				int mateEnd = OtherReadEnd(alignment.readEnd);
-
-				int mateScore = mateAlignIter->second.SeqScores()[alignedLength[mateEnd]];
-				
-				alignPosteriorPartial.AppendAlignmentWithMate(alignment.readEnd, selfScorePart, mateScore);
+				batchRealigner.Submit(batch);
+				batch = RealignBatchPtr(new RealignBatch());
 			}
 		}
-
-		// 
-		// Filter concordant alignments based on threshold on 
-		// the posterior probability that any of the concordant
-		// alignments are above threshold
-		// 
-		if (alignPosteriorPartial.PosteriorConcordant() >= chimericThreshold)
-		{
-			continue;
-		}
 		
-		//
-		// Calculate the full alignment score of each alignment and threshold
-		// on the CDF of the likelihood of attaining this alignment.  Mark each
-		// alignment index as passing or not passing the CDF threshold.  Also 
-		// mark read ends as having an alignment that passes the CDF threshold.
-		//
-		// Create list of alignment indices for each end, filter
-		// based on partial alignment posterior
-		//
-		bool validSpanningReadEnd[2] = {false, false};
-		vector<bool> validSpanningAlignment(alignments.size(), false);
-		vector<int> alignmentIndices[2];
-		for (int alignmentIndex = 0; alignmentIndex < alignments.size(); alignmentIndex++)
+		if (!batch->fragments.empty())
 		{
-			const RawAlignment& alignment = alignments[alignmentIndex];
-
-			int selfScoreFull = selfAlignments[alignmentIndex].SeqScores()[preppedReads.ReadLength(alignment.readEnd)];
-
-			if (alignProbability.AboveThreshold(preppedReads.ReadLength(alignment.readEnd), selfScoreFull))
-			{
-				validSpanningReadEnd[alignment.readEnd] = true;
-				validSpanningAlignment[alignmentIndex] = true;
-			}
-
-			double alignmentPosterior = alignPosteriorPartial.Posterior(alignmentIndex);
-
-			if (alignmentPosterior < alignmentThreshold)
-			{
-				continue;
-			}
-			
-			alignmentIndices[alignment.readEnd].push_back(alignmentIndex);
-		}
-
-		//
-		// Filter reads unless there is at least 1 alignment of each end exceeding
-		// partial alignment posterior threshold
-		//
-		if (alignmentIndices[0].empty() || alignmentIndices[1].empty())
-		{
-			continue;
+			batchRealigner.Submit(batch);
 		}
 		
-		//
-		// Calculate split alignments for selected alignment pairs
-		//
-		// Calculate the best split length and score where best split length equals
-		// read length unless there are insertions at the breakpoint, in which case
-		// the insertion length is subtracked from the read length and the insertion
-		// penalty is subtracted from the score.  Check whether the length and score
-		// pass the CDF threshold.  Output the split read only it passes the 
-		// threshold.  Also store a boolean as True for split reads that pass the
-		// threshold to be used to determine if a spanning read should be output 
-		// regardless of the fully aligned score.  Store a boolean for each read end
-		// if a valid split alignment was found for that read end.
-		//
-		bool validSplitReadEnd[2] = {false, false};
-		vector<bool> validSplitAlignment(alignments.size(), false);
-		vector<SplitAlignmentRecord> splitRecords;
-		for (int readEnd = 0; readEnd <= 1; readEnd++)
-		{
-			int mateEnd = OtherReadEnd(readEnd);
-			
-			for (vector<int>::const_iterator selfAlignmentIter = alignmentIndices[readEnd].begin(); selfAlignmentIter != alignmentIndices[readEnd].end(); selfAlignmentIter++)
-			{
-				int selfAlignmentIndex = *selfAlignmentIter;
-				const AlignInfo& selfAlignInfo = selfAlignments[selfAlignmentIndex];
-				const RawAlignment& selfAlignment = alignments[selfAlignmentIndex];
-				
-				for (vector<int>::const_iterator mateAlignmentIter = alignmentIndices[mateEnd].begin(); mateAlignmentIter != alignmentIndices[mateEnd].end(); mateAlignmentIter++)
-				{
-					int mateAlignmentIndex = *mateAlignmentIter;
-					unordered_map<int,AlignInfo>::const_iterator mateAlignInfoIter = mateFwdAlignments.find(mateAlignmentIndex);
-					
-					if (mateAlignInfoIter == mateFwdAlignments.end())
-					{
-						continue;
-					}
-					
-					const AlignInfo& mateAlignInfo = mateAlignInfoIter->second;
-					const RawAlignment& mateAlignment = alignments[mateAlignmentIndex];
-					
-					DebugCheck(mateAlignment.readEnd == mateEnd);
-
-					int score;
-					int seq1Length;
-					int seq2Length;
-					bool hasSplit = BestSplitAlignment(selfAlignInfo.SeqScores(), selfAlignInfo.SeqScoresLength(),
-					                                   mateAlignInfo.SeqScores(), mateAlignInfo.SeqScoresLength(),
-					                                   cInsertedPenalty, cMinAnchor, score, seq1Length, seq2Length);
-
-					if (!hasSplit)
-					{
-						continue;
-					}
-
-					string readSeq = preppedReads.Sequence(readEnd);
-
-					string inserted = readSeq.substr(seq1Length, readSeq.size() - seq2Length - seq1Length);
-
-					int alignedLength = readSeq.size() - inserted.size();
-					int alignedScore = score - cInsertedPenalty * (int)inserted.size();
-
-					if (!alignProbability.AboveThreshold(alignedLength, alignedScore))
-					{
-						continue;
-					}
-
-					SplitAlignmentRecord record;
-					record.libID = libID;
-					record.readID = readID;
-					record.readEnd = selfAlignment.readEnd;
-					record.alignID[readEnd] = selfAlignmentIndex;
-					record.chromosome[readEnd] = selfAlignment.reference;
-					record.strand[readEnd] = ((selfAlignment.strand == PlusStrand) ? "+" : "-");
-					record.position[readEnd] = selfAlignInfo.BreakPosition(seq1Length);
-					record.alignID[mateEnd] = mateAlignmentIndex;
-					record.chromosome[mateEnd] = mateAlignment.reference;
-					record.strand[mateEnd] = ((mateAlignment.strand == PlusStrand) ? "+" : "-");
-					record.position[mateEnd] = mateAlignInfo.BreakPosition(seq2Length);
-					record.homology = 0;
-					record.inserted = readSeq.substr(seq1Length, readSeq.size() - seq2Length - seq1Length);
-					record.score = score;
-
-					if (record.inserted.empty())
-					{
-						HomologyConsistentBreakpoint(referenceSequences, record.chromosome, record.strand,
-						                             record.position, record.homology, readSeq.size());
-					}
-
-					splitRecords.push_back(record);
-
-					validSplitReadEnd[readEnd] = true;
-					validSplitAlignment[selfAlignmentIndex] = true;
-				}
-			}
-		}
-
-		//
-		// Filter reads based on the cdf of the score likelihood
-		//
-		if ((!validSpanningReadEnd[0] && !validSplitReadEnd[0]) || (!validSpanningReadEnd[1] && !validSplitReadEnd[1]))
-		{
-			continue;
-		}
-
-		//
-		// Output split alignment records after cdf test
-		//
-		for (vector<SplitAlignmentRecord>::const_iterator recordIter = splitRecords.begin(); recordIter != splitRecords.end(); recordIter++)
-		{
-			splitFile << *recordIter;
-		}
-
-		// Output spanning alignments exceeding posterior threshold
-		// Reads must also have a valid spanning or split read
-		for (int readEnd = 0; readEnd <= 1; readEnd++)
-		{
-			for (vector<int>::const_iterator alignmentIter = alignmentIndices[readEnd].begin(); alignmentIter != alignmentIndices[readEnd].end(); alignmentIter++)
-			{
-				int alignmentIndex = *alignmentIter;
-
-				const RawAlignment& alignment = alignments[alignmentIndex];
-				
-				DebugCheck(alignment.readEnd == readEnd);
-				
-				int mateEnd = OtherReadEnd(readEnd);
-
-				AlignInfo alignInfo = selfAlignments[alignmentIndex];
-				
-				int selfSeqLength = alignInfo.BestPartialSeqLength();
+		batchRealigner.Close();
+		threadPool.Join();
+	}
 
-				int mateScore = 0;
 
-				unordered_map<int,AlignInfo>::const_iterator mateAlignIter = mateRevAlignments.find(alignmentIndex);
-				if (mateAlignIter != mateRevAlignments.end())
-				{
-					mateScore = max((short)0, mateAlignIter->second.SeqScores()[alignedLength[mateEnd]]);
-				}
-
-				if (!validSpanningAlignment[alignmentIndex] && !validSplitAlignment[alignmentIndex])
-				{
-					continue;
-				} 
-				
-				SpanningAlignmentRecord record;
-				record.libID = libID;
-				record.readID = readID;
-				record.readEnd = alignment.readEnd;
-				record.alignID = alignmentIndex;
-				record.chromosome = alignment.reference;
-				record.strand = ((alignment.strand == PlusStrand) ? "+" : "-");
-				record.position = alignInfo.OuterPosition();
-				record.alignedLength = selfSeqLength;
-				record.mateLength = preppedReads.ReadLength(mateEnd);
-				record.mateScore = mateScore;
-
-				spanningFile << record;
-			}
-		}
-	}
+	delete alignmentStream;
 }
 
 
@@ -7,6 +7,8 @@
 #include "ReadStream.h"
 #include "Sequences.h"
 
+#include <algorithm>
+#include <stdint.h>
 #include <boost/unordered_map.hpp>
 #include <tclap/CmdLine.h>
 
@@ -14,6 +16,202 @@ using namespace boost;
 using namespace std;
 
 
+// Realign the reads of a cluster to the sequence of one of its breakpoints
+void RealignToBreakpoint(const BreakpointRecord& breakpointRecord, const vector<ClusterMemberRecord>& memberships,
+                         const unordered_map<AlignmentKey,SpanningAlignmentRecord>& spanningAlignments,
+                         const Sequences& referenceSequences, PreppedReads& preppedReads, SimpleAligner& aligner,
+                         int maxFragmentLength, ostream& realignmentsFile)
+{
+	// Create breakend sequences of specific lengths, and record the start and end of the region from which the
+	// sequence originated in the reference genome.
+	string breakendSequence[2];
+	int breakendStart[2];
+	int breakendEnd[2];
+	for (int clusterEnd = 0; clusterEnd <= 1; clusterEnd++)
+	{
+		if (breakpointRecord.strand[clusterEnd] == "+")
+		{
+			breakendStart[clusterEnd] = breakpointRecord.position[clusterEnd] - maxFragmentLength + 1;
+			breakendEnd[clusterEnd] = breakpointRecord.position[clusterEnd];
+		}
+		else
+		{
+			breakendStart[clusterEnd] = breakpointRecord.position[clusterEnd];
+			breakendEnd[clusterEnd] = breakpointRecord.position[clusterEnd] + maxFragmentLength - 1;
+		}
+
+		referenceSequences.Get(breakpointRecord.chromosome[clusterEnd],
+		                       breakendStart[clusterEnd],
+		                       breakendEnd[clusterEnd],
+		                       breakendSequence[clusterEnd]);
+	}
+
+	// Create a breakpoint sequence for each cluster end with the sequence of the reference maintained (not reverse
+	// complemented) for that breakend.  Also calculate an offset which will be used for calculating the 0-based
+	// positions of alignments in the breakpoint sequence.
+	string breakpointSequence[2];
+	for (int clusterEnd = 0; clusterEnd <= 1; clusterEnd++)
+	{
+		string selfbreakendSequence = breakendSequence[clusterEnd];
+		string mateBreakendSequence = breakendSequence[1-clusterEnd];
+
+		if (breakpointRecord.strand[clusterEnd] == "-")
+		{
+			ReverseComplement(selfbreakendSequence);
+		}
+
+		if (breakpointRecord.strand[1-clusterEnd] == "+")
+		{
+			ReverseComplement(mateBreakendSequence);
+		}
+
+		string insertedSequence = breakpointRecord.inserted;
+
+		if (clusterEnd == 1)
+		{
+			ReverseComplement(insertedSequence);
+		}
+
+		breakpointSequence[clusterEnd] = selfbreakendSequence + insertedSequence + mateBreakendSequence;
+	}
+
+	// Iterate cluster reads and their alignments
+	for (vector<ClusterMemberRecord>::const_iterator memberIter = memberships.begin(); memberIter != memberships.end(); memberIter++)
+	{
+		const ClusterMemberRecord& memberRecord = *memberIter;
+
+		unordered_map<AlignmentKey,SpanningAlignmentRecord>::const_iterator alignIter = spanningAlignments.find(memberRecord.GetAlignmentKey());
+		DebugCheck(alignIter != spanningAlignments.end());
+
+		const SpanningAlignmentRecord& spanningRecord = alignIter->second;
+
+		// Calculate the length between the breakend and the start of the read
+		int templateLength = abs(spanningRecord.position - breakpointRecord.position[memberRecord.clusterEnd]) + 1;
+
+		// Calculate position of alignment in breakpoint sequence
+		int adjustedPosition = maxFragmentLength - templateLength;
+
+		// Set current read in prepped read set
+		preppedReads.SetCurrentRead(memberRecord.readID);
+
+		int score = 0;
+		if (adjustedPosition >= 16 && adjustedPosition <= breakpointSequence[memberRecord.clusterEnd].size() / 2)
+		{
+			// Pointer to first position to which the read should align
+			const char* refPtr = &breakpointSequence[memberRecord.clusterEnd][adjustedPosition];
+
+			// Align to forward strand of breakpoint sequence
+			score = aligner.AlignBandedSSE2BW7ScoreFwd(refPtr, preppedReads.StartPtr(memberRecord.readEnd, PlusStrand), preppedReads.EndPtr(memberRecord.readEnd, PlusStrand));
+		}
+
+		BreakAlignScoreRecord scoreRecord;
+
+		scoreRecord.clusterID = breakpointRecord.clusterID;
+		scoreRecord.breakpointID = breakpointRecord.breakpointID;
+		scoreRecord.clusterEnd = memberRecord.clusterEnd;
+		scoreRecord.libID = memberRecord.libID;
+		scoreRecord.readID = memberRecord.readID;
+		scoreRecord.readEnd = memberRecord.readEnd;
+		scoreRecord.alignID = memberRecord.alignID;
+		scoreRecord.alignedLength = preppedReads.ReadLength(memberRecord.readEnd);
+		scoreRecord.templateLength = templateLength;
+		scoreRecord.score = score;
+
+		realignmentsFile << scoreRecord;
+	}
+}
+
+// Sparse index of cluster memberships sorted by library and read
+struct ClusterIndexEntry
+{
+	int libID;
+	int readID;
+	int64_t offset;
+};
+
+bool operator<(const ClusterIndexEntry& entry, const ReadRecord& record)
+{
+	return entry.libID < record.libID || (entry.libID == record.libID && entry.readID < record.readID);
+}
+
+void ReadClusterIndex(const string& indexFilename, vector<ClusterIndexEntry>& index)
+{
+	ifstream indexFile(indexFilename.c_str(), ios::binary);
+	CheckFile(indexFile, indexFilename);
+
+	ClusterIndexEntry entry;
+	while (indexFile.read((char*)&entry, sizeof(entry)))
+	{
+		index.push_back(entry);
+	}
+}
+
+// Read memberships of reads in each library's range of read ids from clusters sorted by library and read
+void ReadIndexedClusters(const string& clustersFilename, const string& indexFilename,
+                         const unordered_map<AlignmentKey,SpanningAlignmentRecord>& spanningAlignments,
+                         unordered_map<int,vector<ClusterMemberRecord> >& clusters)
+{
+	unordered_map<int,pair<int,int> > readRanges;
+	for (unordered_map<AlignmentKey,SpanningAlignmentRecord>::const_iterator alignIter = spanningAlignments.begin(); alignIter != spanningAlignments.end(); alignIter++)
+	{
+		const SpanningAlignmentRecord& spanningRecord = alignIter->second;
+
+		pair<unordered_map<int,pair<int,int> >::iterator,bool> rangeInsert = readRanges.insert(make_pair(spanningRecord.libID, make_pair(spanningRecord.readID, spanningRecord.readID)));
+		pair<int,int>& readRange = rangeInsert.first->second;
+
+		readRange.first = min(readRange.first, spanningRecord.readID);
+		readRange.second = max(readRange.second, spanningRecord.readID);
+	}
+
+	vector<ClusterIndexEntry> index;
+	ReadClusterIndex(indexFilename, index);
+
+	ifstream clustersFile(clustersFilename.c_str());
+	CheckFile(clustersFile, clustersFilename);
+
+	for (unordered_map<int,pair<int,int> >::const_iterator rangeIter = readRanges.begin(); rangeIter != readRanges.end(); rangeIter++)
+	{
+		ReadRecord first;
+		first.libID = rangeIter->first;
+		first.readID = rangeIter->second.first;
+
+		ReadRecord last;
+		last.libID = rangeIter->first;
+		last.readID = rangeIter->second.second;
+
+		// Start from the last indexed record before the first read of the range
+		vector<ClusterIndexEntry>::const_iterator indexIter = lower_bound(index.begin(), index.end(), first);
+		if (index.empty())
+		{
+			continue;
+		}
+		if (indexIter != index.begin())
+		{
+			indexIter--;
+		}
+
+		clustersFile.clear();
+		clustersFile.seekg(indexIter->offset);
+
+		ClusterMemberRecord memberRecord;
+		while (clustersFile >> memberRecord)
+		{
+			if (memberRecord.libID > last.libID || (memberRecord.libID == last.libID && memberRecord.readID > last.readID))
+			{
+				break;
+			}
+
+			// Ignore memberships of unknown alignments
+			if (spanningAlignments.find(memberRecord.GetAlignmentKey()) == spanningAlignments.end())
+			{
+				continue;
+			}
+
+			clusters[memberRecord.clusterID].push_back(memberRecord);
+		}
+	}
+}
+
 int main(int argc, char* argv[])
 {
 	int matchScore;
@@ -27,6 +225,8 @@ int main(int argc, char* argv[])
 	string clustersFilename;
 	string breakpointsFilename;
 	string realignmentsFilename;
+	string clustersIndexFilename;
+	string breakpointsIndexFilename;
 	
 	try
 	{
@@ -42,6 +242,8 @@ int main(int argc, char* argv[])
 		TCLAP::ValueArg<string> clustersFilenameArg("c","clusters","Clusters Filename",true,"","string",cmd);
 		TCLAP::ValueArg<string> breakpointsFilenameArg("b","breakpoints","Breakpoints Filename",true,"","string",cmd);
 		TCLAP::ValueArg<string> realignmentsFilenameArg("","realignments","Realignment Scores Filename",true,"","string",cmd);
+		TCLAP::ValueArg<string> clustersIndexFilenameArg("","clustersindex","Index of Clusters Sorted by Library and Read",false,"","string",cmd);
+		TCLAP::ValueArg<string> breakpointsIndexFilenameArg("","breakpointsindex","Offsets of Breakpoints of each Cluster",false,"","string",cmd);
 		cmd.parse(argc,argv);
 		
 		matchScore = matchScoreArg.getValue();
@@ -55,6 +257,8 @@ int main(int argc, char* argv[])
 		clustersFilename = clustersFilenameArg.getValue();
 		breakpointsFilename = breakpointsFilenameArg.getValue();
 		realignmentsFilename = realignmentsFilenameArg.getValue();
+		clustersIndexFilename = clustersIndexFilenameArg.getValue();
+		breakpointsIndexFilename = breakpointsIndexFilenameArg.getValue();
 	}
 	catch (TCLAP::ArgException &e)
 	{
@@ -67,7 +271,7 @@ int main(int argc, char* argv[])
 	cerr << "Reading reference fasta" << endl;
 	
 	Sequences referenceSequences(1000 + maxFragmentLength * 2);
-	referenceSequences.Read(referenceFasta);
+	referenceSequences.Load(referenceFasta);
 	
 	cerr << "Reading fastq sequences" << endl;
 	
@@ -92,9 +296,20 @@ int main(int argc, char* argv[])
 		}
 	}
 
+	if (clustersIndexFilename.empty() != breakpointsIndexFilename.empty())
+	{
+		cerr << "Error: clusters and breakpoints indices must be given together" << endl;
+		exit(1);
+	}
+
 	cerr << "Reading cluster memberships" << endl;
 
 	unordered_map<int,vector<ClusterMemberRecord> > clusters;
+	if (!clustersIndexFilename.empty())
+	{
+		ReadIndexedClusters(clustersFilename, clustersIndexFilename, spanningAlignments, clusters);
+	}
+	else
 	{
 		ifstream clustersFile(clustersFilename.c_str());
 		CheckFile(clustersFile, clustersFilename);
@@ -120,116 +335,64 @@ int main(int argc, char* argv[])
 	ofstream realignmentsFile(realignmentsFilename.c_str());
 	CheckFile(realignmentsFile, realignmentsFilename);
 
-	BreakpointRecord breakpointRecord;
-	while (breakpointsFile >> breakpointRecord)
+	if (!breakpointsIndexFilename.empty())
 	{
-		// Find reads that support this breakpoint
-		unordered_map<int,vector<ClusterMemberRecord> >::const_iterator clusterIter = clusters.find(breakpointRecord.clusterID);
-
-		// Skip this breakpoint since there are no reads for it in the current read set
-		if (clusterIter == clusters.end())
+		// Breakpoints of the clusters of these reads, in breakpoint file order
+		vector<int> clusterIDs;
+		for (unordered_map<int,vector<ClusterMemberRecord> >::const_iterator clusterIter = clusters.begin(); clusterIter != clusters.end(); clusterIter++)
 		{
-			continue;
+			clusterIDs.push_back(clusterIter->first);
 		}
+		sort(clusterIDs.begin(), clusterIDs.end());
 
-		// Create breakend sequences of specific lengths, and record the start and end of the region from which the
-		// sequence originated in the reference genome.
-		string breakendSequence[2];
-		int breakendStart[2];
-		int breakendEnd[2];
-		for (int clusterEnd = 0; clusterEnd <= 1; clusterEnd++)
-		{
-			if (breakpointRecord.strand[clusterEnd] == "+")
-			{
-				breakendStart[clusterEnd] = breakpointRecord.position[clusterEnd] - maxFragmentLength + 1;
-				breakendEnd[clusterEnd] = breakpointRecord.position[clusterEnd];
-			}
-			else
-			{
-				breakendStart[clusterEnd] = breakpointRecord.position[clusterEnd];
-				breakendEnd[clusterEnd] = breakpointRecord.position[clusterEnd] + maxFragmentLength - 1;
-			}
+		ifstream breakpointsIndexFile(breakpointsIndexFilename.c_str(), ios::binary);
+		CheckFile(breakpointsIndexFile, breakpointsIndexFilename);
 
-			referenceSequences.Get(breakpointRecord.chromosome[clusterEnd],
-			                       breakendStart[clusterEnd],
-			                       breakendEnd[clusterEnd],
-			                       breakendSequence[clusterEnd]);
-		}
-
-		// Create a breakpoint sequence for each cluster end with the sequence of the reference maintained (not reverse
-		// complemented) for that breakend.  Also calculate an offset which will be used for calculating the 0-based
-		// positions of alignments in the breakpoint sequence.
-		string breakpointSequence[2];
-		for (int clusterEnd = 0; clusterEnd <= 1; clusterEnd++)
+		for (vector<int>::const_iterator clusterIDIter = clusterIDs.begin(); clusterIDIter != clusterIDs.end(); clusterIDIter++)
 		{
-			string selfbreakendSequence = breakendSequence[clusterEnd];
-			string mateBreakendSequence = breakendSequence[1-clusterEnd];
-
-			if (breakpointRecord.strand[clusterEnd] == "-")
+			int64_t offset = -1;
+			if (*clusterIDIter >= 0)
 			{
-				ReverseComplement(selfbreakendSequence);
+				breakpointsIndexFile.clear();
+				breakpointsIndexFile.seekg((int64_t)*clusterIDIter * sizeof(offset));
+				breakpointsIndexFile.read((char*)&offset, sizeof(offset));
 			}
-
-			if (breakpointRecord.strand[1-clusterEnd] == "+")
+			if (!breakpointsIndexFile || offset < 0)
 			{
-				ReverseComplement(mateBreakendSequence);
+				cerr << "Error: cluster " << *clusterIDIter << " not found in " << breakpointsIndexFilename << endl;
+				exit(1);
 			}
 
-			string insertedSequence = breakpointRecord.inserted;
-
-			if (clusterEnd == 1)
-			{
-				ReverseComplement(insertedSequence);
-			}
-
-			breakpointSequence[clusterEnd] = selfbreakendSequence + insertedSequence + mateBreakendSequence;
-		}
-
-		// Iterate cluster reads and their alignments
-		const vector<ClusterMemberRecord>& memberships = clusterIter->second;
-		for (vector<ClusterMemberRecord>::const_iterator memberIter = memberships.begin(); memberIter != memberships.end(); memberIter++)
-		{
-			const ClusterMemberRecord& memberRecord = *memberIter;
-
-			unordered_map<AlignmentKey,SpanningAlignmentRecord>::const_iterator alignIter = spanningAlignments.find(memberRecord.GetAlignmentKey());
-			DebugCheck(alignIter != spanningAlignments.end());
+			const vector<ClusterMemberRecord>& memberships = clusters.find(*clusterIDIter)->second;
 
-			const SpanningAlignmentRecord& spanningRecord = alignIter->second;
+			breakpointsFile.clear();
+			breakpointsFile.seekg(offset);
 
-			// Calculate the length between the breakend and the start of the read
-			int templateLength = abs(spanningRecord.position - breakpointRecord.position[memberRecord.clusterEnd]) + 1;
-
-			// Calculate position of alignment in breakpoint sequence
-			int adjustedPosition = maxFragmentLength - templateLength;
-
-			// Set current read in prepped read set
-			preppedReads.SetCurrentRead(memberRecord.readID);
-
-			int score = 0;
-			if (adjustedPosition >= 16 && adjustedPosition <= breakpointSequence[memberRecord.clusterEnd].size() / 2)
+			BreakpointRecord breakpointRecord;
+			while (breakpointsFile >> breakpointRecord && breakpointRecord.clusterID == *clusterIDIter)
 			{
-				// Pointer to first position to which the read should align
-				const char* refPtr = &breakpointSequence[memberRecord.clusterEnd][adjustedPosition];
-
-				// Align to forward strand of breakpoint sequence
-				score = aligner.AlignBandedSSE2BW7ScoreFwd(refPtr, preppedReads.StartPtr(memberRecord.readEnd, PlusStrand), preppedReads.EndPtr(memberRecord.readEnd, PlusStrand));
+				RealignToBreakpoint(breakpointRecord, memberships, spanningAlignments, referenceSequences,
+				                    preppedReads, aligner, maxFragmentLength, realignmentsFile);
 			}
+		}
 
-			BreakAlignScoreRecord scoreRecord;
+		return 0;
+	}
 
-			scoreRecord.clusterID = breakpointRecord.clusterID;
-			scoreRecord.breakpointID = breakpointRecord.breakpointID;
-			scoreRecord.clusterEnd = memberRecord.clusterEnd;
-			scoreRecord.libID = memberRecord.libID;
-			scoreRecord.readID = memberRecord.readID;
-			scoreRecord.readEnd = memberRecord.readEnd;
-			scoreRecord.alignID = memberRecord.alignID;
-			scoreRecord.alignedLength = preppedReads.ReadLength(memberRecord.readEnd);
-			scoreRecord.templateLength = templateLength;
-			scoreRecord.score = score;
+	BreakpointRecord breakpointRecord;
+	while (breakpointsFile >> breakpointRecord)
+	{
+		// Find reads that support this breakpoint
+		unordered_map<int,vector<ClusterMemberRecord> >::const_iterator clusterIter = clusters.find(breakpointRecord.clusterID);
 
-			realignmentsFile << scoreRecord;
+		// Skip this breakpoint since there are no reads for it in the current read set
+		if (clusterIter == clusters.end())
+		{
+			continue;
 		}
+
+		RealignToBreakpoint(breakpointRecord, clusterIter->second, spanningAlignments, referenceSequences,
+		                    preppedReads, aligner, maxFragmentLength, realignmentsFile);
 	}
 }
 
@@ -0,0 +1,194 @@
+/*
+ *  samtobinary.cpp
+ *
+ */
+
+#include "Common.h"
+#include "AlignmentStream.h"
+
+#include <fstream>
+#include <iostream>
+#include <string>
+#include <cstring>
+#include <cstdlib>
+#include <tclap/CmdLine.h>
+
+using namespace std;
+
+
+// Find the end of a tab separated field
+inline const char* FieldEnd(const char* field, const char* lineEnd)
+{
+	const char* end = (const char*)memchr(field, '\t', lineEnd - field);
+	return (end == 0) ? lineEnd : end;
+}
+
+// Parse a non negative integer field, false if invalid
+inline bool ParseInteger(const char* begin, const char* end, int& value)
+{
+	if (begin == end)
+	{
+		return false;
+	}
+
+	value = 0;
+	for (const char* ptr = begin; ptr != end; ptr++)
+	{
+		if (*ptr < '0' || *ptr > '9')
+		{
+			return false;
+		}
+
+		value = value * 10 + (*ptr - '0');
+	}
+
+	return true;
+}
+
+void FormatError(int lineNumber)
+{
+	cerr << "Error: Format error for alignment line " << lineNumber << endl;
+	exit(1);
+}
+
+
+int main(int argc, char* argv[])
+{
+	// Alignments are usually streamed on stdin
+	ios::sync_with_stdio(false);
+
+	string samFilename;
+	string binaryFilename;
+
+	try
+	{
+		TCLAP::CmdLine cmd("Convert seed alignments from sam to binary for realignment");
+		TCLAP::ValueArg<string> samFilenameArg("s","sam","Sam Alignments",false,"-","string",cmd);
+		TCLAP::ValueArg<string> binaryFilenameArg("b","binary","Binary Alignments",false,"-","string",cmd);
+		cmd.parse(argc,argv);
+
+		samFilename = samFilenameArg.getValue();
+		binaryFilename = binaryFilenameArg.getValue();
+	}
+	catch (TCLAP::ArgException &e)
+	{
+		cerr << "error: " << e.error() << " for arg " << e.argId() << endl;
+		exit(1);
+	}
+
+	istream* samStream = &cin;
+	ifstream samFile;
+	if (samFilename != "-")
+	{
+		samFile.open(samFilename.c_str());
+		CheckFile(samFile, samFilename);
+		samStream = &samFile;
+	}
+
+	ostream* binaryStream = &cout;
+	ofstream binaryFile;
+	if (binaryFilename != "-")
+	{
+		binaryFile.open(binaryFilename.c_str(), ios::out | ios::binary);
+		CheckFile(binaryFile, binaryFilename);
+		binaryStream = &binaryFile;
+	}
+
+	BinaryAlignmentWriter writer(*binaryStream);
+
+	// Parse only the fields used for realignment, equivalent to SamAlignmentStream
+	string line;
+	string reference;
+	int lineNumber = 0;
+	while (getline(*samStream, line))
+	{
+		lineNumber++;
+
+		if (line.length() == 0)
+		{
+			cerr << "Error: Empty alignment line " << lineNumber << endl;
+			exit(1);
+		}
+
+		if (line[0] == '@')
+		{
+			continue;
+		}
+
+		const char* lineEnd = line.data() + line.length();
+
+		const char* fields[11];
+		const char* fieldEnds[11];
+		const char* field = line.data();
+		for (int fieldIndex = 0; fieldIndex < 11; fieldIndex++)
+		{
+			if (field > lineEnd)
+			{
+				FormatError(lineNumber);
+			}
+
+			fields[fieldIndex] = field;
+			fieldEnds[fieldIndex] = FieldEnd(field, lineEnd);
+			field = fieldEnds[fieldIndex] + 1;
+		}
+
+		// Unmapped
+		if (fieldEnds[2] - fields[2] == 1 && fields[2][0] == '*')
+		{
+			continue;
+		}
+
+		int flag;
+		int position;
+		if (!ParseInteger(fields[1], fieldEnds[1], flag) || !ParseInteger(fields[3], fieldEnds[3], position))
+		{
+			FormatError(lineNumber);
+		}
+
+		int strand = ((flag & 0x0010) == 0) ? PlusStrand : MinusStrand;
+
+		// Split qname into id and end
+		const char* qnameEnd = fieldEnds[0];
+		int readEnd;
+		if (qnameEnd - fields[0] >= 2 && qnameEnd[-2] == '/')
+		{
+			if (qnameEnd[-1] != '1' && qnameEnd[-1] != '2')
+			{
+				cerr << "Error: Unable to interpret qname for alignment line " << lineNumber << endl;
+				exit(1);
+			}
+
+			readEnd = (qnameEnd[-1] == '1') ? 0 : 1;
+			qnameEnd -= 2;
+		}
+		else if (flag & 0x0040)
+		{
+			readEnd = 0;
+		}
+		else if (flag & 0x0080)
+		{
+			readEnd = 1;
+		}
+		else
+		{
+			cerr << "Error: Unable to interpret read end for alignment line " << lineNumber << endl;
+			exit(1);
+		}
+
+		int fragmentID;
+		if (!ParseInteger(fields[0], qnameEnd, fragmentID))
+		{
+			cerr << "Error: Expected integer read id for alignment line " << lineNumber << endl;
+			exit(1);
+		}
+
+		reference.assign(fields[2], fieldEnds[2]);
+
+		int seqLength = fieldEnds[9] - fields[9];
+
+		writer.Write(fragmentID, readEnd, reference, strand, position, position + seqLength - 1);
+	}
+
+	writer.Flush();
+}
+
@@ -7,9 +7,10 @@
 
 #include "Common.h"
 #include "DebugCheck.h"
-#include "Algorithms.h"
 #include "AlignmentRecord.h"
+#include "ParallelSetCover.h"
 
+#include <algorithm>
 #include <fstream>
 #include <iostream>
 #include <string>
@@ -25,6 +26,7 @@ int main(int argc, char* argv[])
 	string clustersFilename;
 	string weightsFilename;
 	string assignmentsFilename;
+	int numThreads;
 	
 	try
 	{
@@ -32,11 +34,13 @@ int main(int argc, char* argv[])
 		TCLAP::ValueArg<string> clustersFilenameArg("c","clusters","Clusters Filename",true,"","string",cmd);
 		TCLAP::ValueArg<string> weightsFilenameArg("w","weights","Weights Filename",false,"","string",cmd);
 		TCLAP::ValueArg<string> assignmentsFilenameArg("a","assignments","Output Assignments Filename",true,"","string",cmd);
+		TCLAP::ValueArg<int> numThreadsArg("","threads","Number of Threads, solving connected components in parallel",false,1,"int",cmd);
 		cmd.parse(argc,argv);
 		
 		clustersFilename = clustersFilenameArg.getValue();
 		weightsFilename = weightsFilenameArg.getValue();
 		assignmentsFilename = assignmentsFilenameArg.getValue();
+		numThreads = numThreadsArg.getValue();
 	}
 	catch (TCLAP::ArgException &e)
 	{
@@ -46,8 +50,11 @@ int main(int argc, char* argv[])
 	
 	cout << "Reading clusters" << endl;
 	
+	// Reads remapped to dense ids, clusters stored as offsets into their reads
+	unordered_map<ReadRecord,uint32_t> readIndex;
 	vector<int> ids;
-	vector<unordered_set<ReadRecord> > clusters;
+	vector<uint32_t> clusterOffsets(1, 0);
+	vector<uint32_t> clusterReads;
 
 	{
 		ifstream clustersFile(clustersFilename.c_str());
@@ -61,7 +68,6 @@ int main(int argc, char* argv[])
 			DebugCheck(clusterRecords.size() > 0);
 
 			ids.push_back(clusterRecords.front().clusterID);
-			clusters.push_back(unordered_set<ReadRecord>());
 
 			for (vector<ClusterMemberRecord>::const_iterator recordIter = clusterRecords.begin(); recordIter != clusterRecords.end(); recordIter++)
 			{
@@ -69,14 +75,25 @@ int main(int argc, char* argv[])
 				{
 					ReadRecord readRecord = recordIter->GetReadRecord();
 
-					bool inserted = clusters.back().insert(readRecord).second;
+					uint32_t readIdx = readIndex.insert(make_pair(readRecord, (uint32_t)readIndex.size())).first->second;
 
-					if (!inserted)
-					{
-						cerr << "Warning: read " << readRecord.readID << ", lib " << readRecord.libID << " has multiple entries for cluster " << ids.back() << endl;
-					}
+					clusterReads.push_back(readIdx);
 				}
 			}
+
+			vector<uint32_t>::iterator clusterBegin = clusterReads.begin() + clusterOffsets.back();
+
+			sort(clusterBegin, clusterReads.end());
+
+			vector<uint32_t>::iterator uniqueEnd = unique(clusterBegin, clusterReads.end());
+
+			if (uniqueEnd != clusterReads.end())
+			{
+				cerr << "Warning: " << clusterReads.end() - uniqueEnd << " reads have multiple entries for cluster " << ids.back() << endl;
+				clusterReads.erase(uniqueEnd, clusterReads.end());
+			}
+
+			clusterOffsets.push_back(clusterReads.size());
 		}
 	}
 
@@ -102,9 +119,9 @@ int main(int argc, char* argv[])
 			weights.push_back(weight);
 		}
 
-		if (clusters.size() != weights.size())
+		if (ids.size() != weights.size())
 		{
-			cerr << "Error: read " << clusters.size() << " clusters and " << weights.size() << " weights" << endl;
+			cerr << "Error: read " << ids.size() << " clusters and " << weights.size() << " weights" << endl;
 			exit(1);
 		}
 	}
@@ -112,21 +129,16 @@ int main(int argc, char* argv[])
 	{
 		cout << "Setting weights to 1" << endl;
 
-		weights = vector<double>(clusters.size(), 1.0);
+		weights = vector<double>(ids.size(), 1.0);
 	}
 
 	cout << "Calculating set cover solution" << endl;
 
-	vector<int> solution;
-	SetCover(clusters, weights, solution);
-	
-	cout << "Assigning fragments to solution sets" << endl;
-	
-	vector<unordered_set<ReadRecord> > assignments;
-	AssignInOrder(clusters, solution, assignments);
+	// Of the clusters with the minimum cost per unassigned read, the cluster
+	// earliest in the clusters file is selected, with any number of threads
+	vector<int> readAssignments;
+	ParallelSetCover(clusterOffsets, clusterReads, readIndex.size(), weights, numThreads, readAssignments);
 
-	DebugCheck(ids.size() == assignments.size());
-	
 	cout << "Writing out assignments" << endl;
 
 	{
@@ -146,11 +158,11 @@ int main(int argc, char* argv[])
 			DebugCheck(clusterRecords.size() > 0);
 			DebugCheck(clusterRecords.front().clusterID == ids[fileIdx]);
 
-			const unordered_set<ReadRecord>& set = assignments[fileIdx];
-
 			for (vector<ClusterMemberRecord>::const_iterator recordIter = clusterRecords.begin(); recordIter != clusterRecords.end(); recordIter++)
 			{
-				if (set.find(recordIter->GetReadRecord()) != set.end())
+				unordered_map<ReadRecord,uint32_t>::const_iterator readIter = readIndex.find(recordIter->GetReadRecord());
+
+				if (readIter != readIndex.end() && readAssignments[readIter->second] == fileIdx)
 				{
 					assignmentsFile << (*recordIter);
 				}
@@ -160,4 +172,3 @@ int main(int argc, char* argv[])
 		}
 	}
 }
-
@@ -0,0 +1,161 @@
+/*
+ *  testalignmentstream.cpp
+ *
+ *  Benchmark parsing seed alignments from sam and binary streams.
+ *
+ */
+
+#include "Common.h"
+#include "AlignmentStream.h"
+
+#include <fstream>
+#include <iostream>
+#include <sstream>
+#include <string>
+#include <cstdlib>
+#include <sys/time.h>
+#include <tclap/CmdLine.h>
+
+using namespace std;
+
+
+double CurrentTime()
+{
+	timeval tv;
+	gettimeofday(&tv, 0);
+	return tv.tv_sec + tv.tv_usec / 1e6;
+}
+
+void WriteSimulatedSam(const string& samFilename, int numAlignments, int seedLength)
+{
+	ofstream samFile(samFilename.c_str());
+	CheckFile(samFile, samFilename);
+
+	const char ntchars[] = {'A','C','T','G'};
+
+	string sequence(seedLength, 'A');
+	string quality(seedLength, 'I');
+
+	srand(1);
+
+	// Multi mapping reads with a bowtie -k style number of alignments per end
+	int fragmentID = 0;
+	int numWritten = 0;
+	while (numWritten < numAlignments)
+	{
+		for (int readEnd = 0; readEnd <= 1; readEnd++)
+		{
+			int numEndAlignments = 1 + rand() % 20;
+
+			for (int alignmentIndex = 0; alignmentIndex < numEndAlignments && numWritten < numAlignments; alignmentIndex++)
+			{
+				for (int seqIndex = 0; seqIndex < seedLength; seqIndex++)
+				{
+					sequence[seqIndex] = ntchars[rand() % 4];
+				}
+
+				int flag = (rand() % 2 == 0) ? 0 : 16;
+
+				samFile << fragmentID << "/" << readEnd + 1 << "\t" << flag << "\t" << (1 + rand() % 22);
+				samFile << "\t" << 1 + rand() % 100000000 << "\t255\t" << seedLength << "M\t*\t0\t0\t";
+				samFile << sequence << "\t" << quality << "\tXA:i:0\tMD:Z:" << seedLength << "\tNM:i:0\n";
+
+				numWritten++;
+			}
+		}
+
+		fragmentID++;
+	}
+}
+
+void WriteBinary(const string& samFilename, const string& binaryFilename)
+{
+	ofstream binaryFile(binaryFilename.c_str(), ios::out | ios::binary);
+	CheckFile(binaryFile, binaryFilename);
+
+	BinaryAlignmentWriter writer(binaryFile);
+
+	SamAlignmentStream samStream(samFilename);
+
+	RawAlignment alignment;
+	while (samStream.GetNextAlignment(alignment))
+	{
+		writer.Write(SAFEPARSE(int, alignment.fragment), alignment.readEnd, alignment.reference,
+		             alignment.strand, alignment.region.start, alignment.region.end);
+	}
+}
+
+long ParseAlignments(AlignmentStream& alignmentStream)
+{
+	FragmentAlignmentStream fragmentAlignmentStream(&alignmentStream);
+
+	long checksum = 0;
+
+	RawAlignmentVec alignments;
+	while (fragmentAlignmentStream.GetNextAlignments(alignments))
+	{
+		for (RawAlignmentVecConstIter alignmentIter = alignments.begin(); alignmentIter != alignments.end(); alignmentIter++)
+		{
+			checksum += alignmentIter->region.start + alignmentIter->readEnd + alignmentIter->reference.size();
+		}
+	}
+
+	return checksum;
+}
+
+
+int main(int argc, char* argv[])
+{
+	int numAlignments;
+	int seedLength;
+	string tempPrefix;
+
+	try
+	{
+		TCLAP::CmdLine cmd("Seed Alignment Stream Benchmark");
+		TCLAP::ValueArg<int> numAlignmentsArg("n","num","Number of Alignments",false,1000000,"int",cmd);
+		TCLAP::ValueArg<int> seedLengthArg("l","length","Seed Length",false,36,"int",cmd);
+		TCLAP::ValueArg<string> tempPrefixArg("t","temp","Temp Filename Prefix",true,"","string",cmd);
+		cmd.parse(argc,argv);
+
+		numAlignments = numAlignmentsArg.getValue();
+		seedLength = seedLengthArg.getValue();
+		tempPrefix = tempPrefixArg.getValue();
+	}
+	catch (TCLAP::ArgException &e)
+	{
+		cerr << "error: " << e.error() << " for arg " << e.argId() << endl;
+		exit(1);
+	}
+
+	string samFilename = tempPrefix + ".sam";
+	string binaryFilename = tempPrefix + ".bin";
+
+	WriteSimulatedSam(samFilename, numAlignments, seedLength);
+	WriteBinary(samFilename, binaryFilename);
+
+	double samStart = CurrentTime();
+	SamAlignmentStream samStream(samFilename);
+	long samChecksum = ParseAlignments(samStream);
+	double samTime = CurrentTime() - samStart;
+
+	double binaryStart = CurrentTime();
+	BinaryAlignmentStream binaryStream(binaryFilename);
+	long binaryChecksum = ParseAlignments(binaryStream);
+	double binaryTime = CurrentTime() - binaryStart;
+
+	if (samChecksum != binaryChecksum)
+	{
+		cerr << "Error: Sam and binary alignments differ" << endl;
+		exit(1);
+	}
+
+	double millions = numAlignments / 1e6;
+
+	cout << "sam\t" << samTime / millions << " s per million alignments" << endl;
+	cout << "binary\t" << binaryTime / millions << " s per million alignments" << endl;
+
+	remove(samFilename.c_str());
+	remove(binaryFilename.c_str());
+}
+
@@ -0,0 +1,232 @@
+/*
+ *  testsetcover.cpp
+ *
+ */
+
+#include "Common.h"
+#include "DebugCheck.h"
+#include "Algorithms.h"
+#include "AlignmentRecord.h"
+#include "ParallelSetCover.h"
+
+#include <algorithm>
+#include <cstdlib>
+#include <iostream>
+#include <vector>
+#include <tclap/CmdLine.h>
+
+using namespace boost;
+using namespace std;
+
+
+// Random clusters of reads with weights drawn from a few values, so that many
+// clusters have equal cost
+void RandomClusters(int maxClusters, int maxReads, int maxClusterSize, vector<vector<ReadRecord> >& clusters, vector<double>& weights)
+{
+	int numClusters = rand() % maxClusters + 1;
+	int numReads = rand() % maxReads + 1;
+
+	const double tiedWeights[] = {0.5, 1.0, 2.0};
+
+	clusters = vector<vector<ReadRecord> >(numClusters);
+	weights = vector<double>(numClusters);
+
+	for (int clusterIdx = 0; clusterIdx < numClusters; clusterIdx++)
+	{
+		int clusterSize = rand() % maxClusterSize + 1;
+
+		for (int memberIdx = 0; memberIdx < clusterSize; memberIdx++)
+		{
+			ReadRecord readRecord;
+			readRecord.libID = rand() % 3;
+			readRecord.readID = rand() % numReads;
+
+			clusters[clusterIdx].push_back(readRecord);
+		}
+
+		weights[clusterIdx] = tiedWeights[rand() % 3];
+	}
+}
+
+// Assignments of reads to clusters by the greedy set cover tie rule, evaluated
+// directly: each step selects the cluster with the minimum cost per unassigned
+// read, the lowest cluster index of those with equal cost
+void AssignReference(const vector<vector<ReadRecord> >& clusters, const vector<double>& weights, unordered_map<ReadRecord,int>& readAssignments)
+{
+	vector<unordered_set<ReadRecord> > unassigned;
+
+	for (vector<vector<ReadRecord> >::const_iterator clusterIter = clusters.begin(); clusterIter != clusters.end(); clusterIter++)
+	{
+		unassigned.push_back(unordered_set<ReadRecord>(clusterIter->begin(), clusterIter->end()));
+	}
+
+	while (true)
+	{
+		int minClusterIdx = -1;
+		double minCost = 0.0;
+
+		for (int clusterIdx = 0; clusterIdx < (int)unassigned.size(); clusterIdx++)
+		{
+			if (unassigned[clusterIdx].empty())
+			{
+				continue;
+			}
+
+			double cost = weights[clusterIdx] / (double)unassigned[clusterIdx].size();
+
+			if (minClusterIdx < 0 || cost < minCost)
+			{
+				minClusterIdx = clusterIdx;
+				minCost = cost;
+			}
+		}
+
+		if (minClusterIdx < 0)
+		{
+			break;
+		}
+
+		const unordered_set<ReadRecord> selected(unassigned[minClusterIdx]);
+
+		for (unordered_set<ReadRecord>::const_iterator readIter = selected.begin(); readIter != selected.end(); readIter++)
+		{
+			readAssignments[*readIter] = minClusterIdx;
+
+			for (int clusterIdx = 0; clusterIdx < (int)unassigned.size(); clusterIdx++)
+			{
+				unassigned[clusterIdx].erase(*readIter);
+			}
+		}
+	}
+}
+
+// Dense read ids and clusters as offsets into their reads, as in destruct_setcover
+void DenseClusters(const vector<vector<ReadRecord> >& clusters, vector<ReadRecord>& readRecords,
+                   vector<uint32_t>& clusterOffsets, vector<uint32_t>& clusterReads)
+{
+	unordered_map<ReadRecord,uint32_t> readIndex;
+
+	clusterOffsets = vector<uint32_t>(1, 0);
+
+	for (vector<vector<ReadRecord> >::const_iterator clusterIter = clusters.begin(); clusterIter != clusters.end(); clusterIter++)
+	{
+		for (vector<ReadRecord>::const_iterator readIter = clusterIter->begin(); readIter != clusterIter->end(); readIter++)
+		{
+			uint32_t readIdx = readIndex.insert(make_pair(*readIter, (uint32_t)readIndex.size())).first->second;
+
+			if (readIdx == (uint32_t)readRecords.size())
+			{
+				readRecords.push_back(*readIter);
+			}
+
+			clusterReads.push_back(readIdx);
+		}
+
+		vector<uint32_t>::iterator clusterBegin = clusterReads.begin() + clusterOffsets.back();
+
+		sort(clusterBegin, clusterReads.end());
+		clusterReads.erase(unique(clusterBegin, clusterReads.end()), clusterReads.end());
+
+		clusterOffsets.push_back(clusterReads.size());
+	}
+}
+
+// Assignments of reads to clusters using the lazy set cover of dense read ids
+void AssignLazy(const vector<vector<ReadRecord> >& clusters, const vector<double>& weights, unordered_map<ReadRecord,int>& readAssignments)
+{
+	vector<ReadRecord> readRecords;
+	vector<uint32_t> clusterOffsets;
+	vector<uint32_t> clusterReads;
+	DenseClusters(clusters, readRecords, clusterOffsets, clusterReads);
+
+	vector<int> solution;
+	vector<int> assignments;
+	LazySetCover(clusterOffsets, clusterReads, readRecords.size(), weights, solution, assignments);
+
+	for (int readIdx = 0; readIdx < (int)assignments.size(); readIdx++)
+	{
+		readAssignments[readRecords[readIdx]] = assignments[readIdx];
+	}
+}
+
+// Assignments of reads to clusters solving connected components on multiple threads
+void AssignParallel(const vector<vector<ReadRecord> >& clusters, const vector<double>& weights, int numThreads, unordered_map<ReadRecord,int>& readAssignments)
+{
+	vector<ReadRecord> readRecords;
+	vector<uint32_t> clusterOffsets;
+	vector<uint32_t> clusterReads;
+	DenseClusters(clusters, readRecords, clusterOffsets, clusterReads);
+
+	vector<int> assignments;
+	ParallelSetCover(clusterOffsets, clusterReads, readRecords.size(), weights, numThreads, assignments);
+
+	for (int readIdx = 0; readIdx < (int)assignments.size(); readIdx++)
+	{
+		readAssignments[readRecords[readIdx]] = assignments[readIdx];
+	}
+}
+
+int main(int argc, char* argv[])
+{
+	int numTests;
+	int seed;
+
+	try
+	{
+		TCLAP::CmdLine cmd("Set cover test with tied weights and multiple threads");
+		TCLAP::ValueArg<int> numTestsArg("n","num","Number of Random Tests",false,1000,"int",cmd);
+		TCLAP::ValueArg<int> seedArg("s","seed","Random Seed",false,1,"int",cmd);
+		cmd.parse(argc,argv);
+
+		numTests = numTestsArg.getValue();
+		seed = seedArg.getValue();
+	}
+	catch (TCLAP::ArgException &e)
+	{
+		cerr << "error: " << e.error() << " for arg " << e.argId() << endl;
+		exit(1);
+	}
+
+	srand(seed);
+
+	int numMismatches = 0;
+
+	for (int testIdx = 0; testIdx < numTests; testIdx++)
+	{
+		vector<vector<ReadRecord> > clusters;
+		vector<double> weights;
+		RandomClusters(1000, 2000, 20, clusters, weights);
+
+		unordered_map<ReadRecord,int> referenceAssignments;
+		AssignReference(clusters, weights, referenceAssignments);
+
+		unordered_map<ReadRecord,int> lazyAssignments;
+		AssignLazy(clusters, weights, lazyAssignments);
+
+		if (referenceAssignments != lazyAssignments)
+		{
+			cerr << "Error: assignments differ for test " << testIdx << " with " << clusters.size() << " clusters" << endl;
+			numMismatches++;
+			continue;
+		}
+
+		// Assignments must not depend on the number of threads
+		int numThreads = testIdx % 7 + 2;
+
+		unordered_map<ReadRecord,int> parallelAssignments;
+		AssignParallel(clusters, weights, numThreads, parallelAssignments);
+
+		if (lazyAssignments != parallelAssignments)
+		{
+			cerr << "Error: assignments with " << numThreads << " threads differ for test " << testIdx << " with " << clusters.size() << " clusters" << endl;
+			numMismatches++;
+		}
+	}
+
+	cout << numTests - numMismatches << " of " << numTests << " tests passed" << endl;
+
+	if (numMismatches > 0)
+	{
+		exit(1);
+	}
+}